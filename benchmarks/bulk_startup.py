@@ -0,0 +1,111 @@
+"""Time to start a population of agents in one process and deliver a
+first message, with one socket and one copy of the agents table per
+agent (as LocalAMS did) and with LocalAMS.start (shared table, a few
+shared sockets, batches).
+
+Each run uses its own process, as the reactor cannot be restarted.
+
+Usage: python benchmarks/bulk_startup.py [agents...] [--sockets N]
+"""
+import sys
+import time
+from multiprocessing import Process, Queue
+from random import randint
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.plus.agent import ImprovedAgent
+from pade.plus.local import LocalAMS
+from pade.plus.simulation import Simulation
+
+
+class Member(ImprovedAgent):
+    def __init__(self, name, port, on_message=None):
+        super().__init__(AID(f'{name}@localhost:{port}'))
+        self.on_message = on_message
+
+    def react(self, message):
+        if self.on_message is not None:
+            self.on_message()
+
+
+def first_message(agents, started, queue):
+    """Send a message from the first agent to the last one"""
+
+    from twisted.internet import reactor
+
+    ready = time.perf_counter()
+
+    def received():
+        queue.put_nowait((ready - started, time.perf_counter() - started))
+        reactor.stop()
+
+    agents[-1].on_message = received
+    message = ACLMessage(ACLMessage.INFORM)
+    message.add_receiver(agents[-1].aid)
+    agents[0].send(message)
+
+
+def per_agent(count, sockets, queue):
+    from twisted.internet import reactor
+
+    port = randint(20000, 40000)
+    agents = [Member(f'member{i}', port + i) for i in range(count)]
+    started = time.perf_counter()
+
+    table = {}
+    for agent in agents:
+        agent.update_ams(agent.ams)
+        agent.ILP = reactor.listenTCP(agent.aid.port, agent.agentInstance)
+        table[agent.aid.name] = agent.aid
+    for agent in agents:
+        agent.agentInstance.table.update(table)
+
+    reactor.callLater(0, first_message, agents, started, queue)
+    reactor.run()
+
+
+def shared(count, sockets, queue):
+    from twisted.internet import reactor
+
+    port = randint(40000, 60000)
+    agents = [Member(f'member{i}', port + i % sockets) for i in range(count)]
+    started = time.perf_counter()
+
+    LocalAMS().start(agents, listen=True).addCallback(
+        first_message, started, queue)
+    reactor.run()
+
+
+def simulated(count, sockets, queue):
+    simulation = Simulation()
+    with simulation:
+        agents = [Member(f'member{i}', 1) for i in range(count)]
+    started = time.perf_counter()
+    simulation.start()
+    ready = time.perf_counter() - started
+    queue.put_nowait((ready, ready))
+
+
+def main(counts=(1000, 10000), sockets=8):
+    for count in counts:
+        for label, target in (('one socket per agent', per_agent),
+                              (f'LocalAMS.start, {sockets} sockets', shared),
+                              ('Simulation.start', simulated)):
+            queue = Queue()
+            process = Process(target=target, args=(count, sockets, queue))
+            process.start()
+            ready, delivered = queue.get(timeout=600)
+            process.join()
+            print(f'{count:>6} agents  {label:<28} ready {ready:8.3f} s  '
+                  f'first message {delivered:8.3f} s')
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    sockets = 8
+    if '--sockets' in arguments:
+        position = arguments.index('--sockets')
+        sockets = int(arguments[position + 1])
+        del arguments[position:position + 2]
+    main([int(count) for count in arguments] or (1000, 10000), sockets)
@@ -0,0 +1,89 @@
+"""Cost of a request/response round through FipaRequestProtocolInitiator,
+with a generator session (send_request) and with callbacks (request).
+Requests are kept instead of sent and INFORMs are fed straight to the
+protocol, so only the session machinery is timed.
+
+Usage: python benchmarks/callback_requests.py [requests] [repeat]
+"""
+import gc
+import sys
+import time
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.fipa_request import FipaRequestProtocolInitiator
+from pade.plus.agent import ImprovedAgent
+
+
+class Initiator(FipaRequestProtocolInitiator):
+    """Keeps the requests instead of sending them"""
+
+    def register_session(self, message, generator):
+        self.open_sessions[message.conversation_id] = generator
+        self.sent.append(message)
+
+
+def with_generators(protocol, messages, results):
+    @AgentSession.session
+    def make_request(message):
+        while True:
+            try:
+                response = yield from protocol.send_request(message)
+                results.append(response.content)
+            except FipaProtocolComplete:
+                break
+
+    for message in messages:
+        make_request(message)
+
+
+def with_callbacks(protocol, messages, results):
+    for message in messages:
+        protocol.request(message, on_inform=lambda m: results.append(m.content))
+
+
+def run(start, requests):
+    agent = ImprovedAgent(AID('client@localhost:2'))
+    protocol = Initiator(agent)
+    protocol.sent = []
+    results = []
+
+    server = AID('server@localhost:1')
+    messages = []
+    for _ in range(requests):
+        message = ACLMessage()
+        message.add_receiver(server)
+        messages.append(message)
+
+    informs = []
+    for message in messages:
+        inform = ACLMessage(ACLMessage.INFORM)
+        inform.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+        inform.set_conversation_id(message.conversation_id)
+        inform.set_sender(server)
+        inform.set_content(1)
+        informs.append(inform)
+
+    gc.collect()
+    gc.disable()
+    begin = time.perf_counter()
+    start(protocol, messages, results)
+    for inform in informs:
+        protocol.execute(inform)
+    elapsed = time.perf_counter() - begin
+    gc.enable()
+
+    assert len(results) == requests and not protocol.open_sessions
+    return elapsed
+
+
+def main(requests=10000, repeat=10):
+    for name, start in (('generators', with_generators),
+                        ('callbacks', with_callbacks)):
+        elapsed = min(run(start, requests) for _ in range(repeat))
+        print(f'{name:>10}: {1e6 * elapsed / requests:6.2f} us per request')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
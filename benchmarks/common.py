@@ -0,0 +1,7 @@
+"""Helpers to run agents in-process, without an AMS."""
+from pade.plus.local import LocalAMS
+
+
+def listen_local(agents):
+    """Start listening and fill every agent table with its peers"""
+    LocalAMS().register(agents, start=False)
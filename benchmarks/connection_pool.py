@@ -0,0 +1,91 @@
+"""Request round-trip time with and without persistent peer connections.
+
+Usage: python benchmarks/connection_pool.py [requests]
+"""
+import sys
+import time
+from random import randint
+
+from twisted.internet import reactor
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.transport import ConnectionPool
+
+from common import listen_local
+
+
+class Server(ImprovedAgent):
+    def __init__(self, name, pool):
+        super().__init__(AID(f'{name}@localhost:{randint(10000, 60000)}'),
+                         connection_pool=pool)
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+
+    def on_request(self, message):
+        reply = message.create_reply()
+        reply.set_content(message.content)
+        self.request.send_inform(reply)
+
+
+class Client(ImprovedAgent):
+    def __init__(self, name, pool, server):
+        super().__init__(AID(f'{name}@localhost:{randint(10000, 60000)}'),
+                         connection_pool=pool)
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server
+
+    @AgentSession.session
+    def run(self, count, done):
+        start = time.perf_counter()
+        for i in range(count):
+            message = ACLMessage()
+            message.set_content(i)
+            message.add_receiver(self.server)
+            while True:
+                try:
+                    yield from self.request.send_request(message)
+                except FipaProtocolComplete:
+                    break
+        done(time.perf_counter() - start)
+
+
+def main(count=500):
+    results = {}
+    pairs = {}
+    for label, pooled in (('per-message', False), ('pooled', True)):
+        server = Server(f'server_{label}', ConnectionPool() if pooled else None)
+        client = Client(f'client_{label}', ConnectionPool() if pooled else None,
+                        server.aid)
+        pairs[label] = (client, server)
+        listen_local([client, server])
+
+    def run(labels):
+        if not labels:
+            reactor.stop()
+            return
+        label, *rest = labels
+        client, _ = pairs[label]
+
+        def done(elapsed):
+            results[label] = elapsed
+            reactor.callLater(0, run, rest)
+
+        client.run(count, done)
+
+    reactor.callLater(0.5, run, list(pairs))
+    reactor.run()
+
+    for label, elapsed in results.items():
+        print(f'{label:>12}: {1000 * elapsed / count:.3f} ms per request '
+              f'({count / elapsed:.0f} req/s)')
+    for label, (client, server) in pairs.items():
+        if client.connection_pool is not None:
+            print(f'client pool: {client.connection_pool.report()}')
+            print(f'server pool: {server.connection_pool.report()}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,80 @@
+"""Response time percentiles of requests to a replica group with
+heavy-tailed service times, with and without hedging, in virtual time.
+
+Usage: python benchmarks/hedging.py [replicas] [requests]
+"""
+import sys
+from random import Random
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.replicas import ReplicaGroup
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Replica(ImprovedAgent):
+    def __init__(self, name, random):
+        super().__init__(AID(f'{name}@localhost:1'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.random = random
+
+    def on_request(self, message):
+        reply = message.create_reply()
+        # Usually fast, sometimes stuck behind a long job
+        if self.random.random() < 0.05:
+            delay = self.random.uniform(1, 5)
+        else:
+            delay = self.random.expovariate(1 / 0.05)
+        self.call_later(delay, self.request.send_inform, reply)
+
+
+class Client(ImprovedAgent):
+    def __init__(self, group):
+        super().__init__(AID('client@localhost:2'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.group = group
+        self.latencies = []
+
+    @AgentSession.session
+    def make_request(self):
+        start = self.simulation.now
+        while True:
+            try:
+                yield from self.request.send_group_request(
+                    ACLMessage(), self.group)
+                self.latencies.append(self.simulation.now - start)
+            except FipaProtocolComplete:
+                break
+
+
+def run(replicas, requests, hedge_quantile):
+    random = Random(0)
+    simulation = Simulation(latency=ConstantLatency(0.001))
+    with simulation:
+        aids = [Replica(f'replica{i}', random).aid for i in range(replicas)]
+        group = ReplicaGroup(aids, hedge_quantile=hedge_quantile)
+        client = Client(group)
+    for i in range(requests):
+        client.call_later(5 + i * 0.1, client.make_request)
+    simulation.run()
+
+    latencies = sorted(client.latencies)
+    return [latencies[int(q * (len(latencies) - 1))]
+            for q in (0.5, 0.95, 0.99)], group.report()
+
+
+def main(replicas=4, requests=5000):
+    for hedge_quantile in (None, 0.95):
+        (p50, p95, p99), report = run(replicas, requests, hedge_quantile)
+        label = f'hedge at p{int(100 * hedge_quantile)}' if hedge_quantile \
+            else 'no hedging'
+        print(f'{label:>12}: p50 {1000 * p50:.0f} ms, p95 {1000 * p95:.0f} ms, '
+              f'p99 {1000 * p99:.0f} ms, {report["hedged"]} hedged, '
+              f'{report["hedge_wins"]} won by the hedge')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
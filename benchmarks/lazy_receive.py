@@ -0,0 +1,60 @@
+"""CPU time of the receive path for an agent that discards most of
+its traffic, with full unpickling and with lazy message views.
+
+Usage: python benchmarks/lazy_receive.py [messages]
+"""
+import sys
+import time
+from pickle import dumps, loads
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.messages import dump_message, load_message
+
+
+class Busy(ImprovedAgent):
+    """Agent with the usual protocol behaviours and no open session"""
+
+    def __init__(self):
+        super().__init__(AID('busy@localhost:20000'))
+        FipaRequestProtocol(self, is_initiator=True)
+        FipaContractNetProtocol(self, is_initiator=True)
+        FipaSubscribeProtocol(self, is_initiator=True)
+        FipaRequestProtocol(self, is_initiator=False).set_request_handler(
+            lambda message: None)
+        self.update_ams(self.ams)
+
+
+def main(count=20000):
+    agent = Busy()
+
+    # Replies to sessions the agent does not know about
+    message = ACLMessage(ACLMessage.INFORM)
+    message.set_protocol(ACLMessage.FIPA_CONTRACT_NET_PROTOCOL)
+    message.set_sender(AID('other@localhost:20001'))
+    message.add_receiver(agent.aid)
+    message.set_content({'values': list(range(200))})
+
+    full = dumps(message)
+    lazy = dump_message(message)
+
+    start = time.process_time()
+    for _ in range(count):
+        agent.react(loads(full))
+    full_time = time.process_time() - start
+
+    start = time.process_time()
+    for _ in range(count):
+        agent.react(load_message(lazy))
+    lazy_time = time.process_time() - start
+
+    print(f'{count} discarded messages')
+    print(f'full parse: {1e6 * full_time / count:7.1f} us/message')
+    print(f'lazy view:  {1e6 * lazy_time / count:7.1f} us/message '
+          f'({100 * (1 - lazy_time / full_time):.0f}% less CPU)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,94 @@
+"""Cost of resuming sessions at the bottom of nested AgentSession.gather
+fan-out trees, for increasing depth and about the same number of
+leaves, and of single-branch chains of gathers. INFORMs are fed
+straight to the protocol, without transport.
+
+Usage: python benchmarks/nested_gather.py [leaves] [repeat]
+"""
+import gc
+import sys
+import time
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.fipa_request import FipaRequestProtocolInitiator
+from pade.plus.agent import ImprovedAgent
+
+
+class Initiator(FipaRequestProtocolInitiator):
+    """Keeps the requests instead of sending them"""
+
+    def register_session(self, message, generator):
+        self.open_sessions[message.conversation_id] = generator
+        self.sent.append(message)
+
+
+def leaf(protocol):
+    message = ACLMessage()
+    message.add_receiver(AID('server@localhost:1'))
+    response = yield from protocol.send_request(message)
+    return response.content
+
+
+def node(protocol, depth, fanout):
+    if depth == 0:
+        return (yield from leaf(protocol))
+    results = yield from AgentSession.gather(
+        *(node(protocol, depth - 1, fanout) for _ in range(fanout)))
+    return sum(results)
+
+
+def run(depth, fanout):
+    agent = ImprovedAgent(AID('client@localhost:2'))
+    protocol = Initiator(agent)
+    protocol.sent = []
+    total = []
+
+    @AgentSession.session
+    def root():
+        total.append((yield from node(protocol, depth, fanout)))
+
+    root()
+
+    informs = []
+    for message in protocol.sent:
+        inform = ACLMessage(ACLMessage.INFORM)
+        inform.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+        inform.set_conversation_id(message.conversation_id)
+        inform.set_sender(message.receivers[0])
+        inform.set_content(1)
+        informs.append(inform)
+
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    for inform in informs:
+        protocol.execute(inform)
+    elapsed = time.perf_counter() - start
+    gc.enable()
+
+    assert total == [len(informs)]
+    return len(informs), elapsed
+
+
+def main(leaves=4096, repeat=10):
+    for depth in (1, 2, 3, 4, 6, 12):
+        fanout = max(2, round(leaves ** (1 / depth)))
+        count, elapsed = min((run(depth, fanout) for _ in range(repeat)),
+                             key=lambda result: result[1])
+        print(f'tree depth {depth:>4} (fan-out {fanout:>4}): {count:>5} leaves, '
+              f'{1e6 * elapsed / count:7.1f} us per resumption')
+
+    for depth in (10, 100, 250, 1000):
+        try:
+            _, elapsed = min((run(depth, 1) for _ in range(repeat)),
+                             key=lambda result: result[1])
+        except RecursionError:
+            print(f'chain depth {depth:>4}: RecursionError')
+            continue
+        print(f'chain depth {depth:>4}: {1e6 * elapsed:7.1f} us to resume the leaf')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
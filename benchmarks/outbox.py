@@ -0,0 +1,76 @@
+"""Throughput of durable requests through the Outbox, with and without
+fsync, committing each message alone or in groups.
+
+A client sends bursts of requests to a server in a simulation; the
+wall time includes the writes and fsyncs of the log.
+
+Usage: python benchmarks/outbox.py [requests] [burst]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.outbox import Outbox
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Server(ImprovedAgent):
+    def __init__(self):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+
+    def on_request(self, message):
+        reply = message.create_reply()
+        reply.set_content('done')
+        self.request.send_inform(reply)
+
+
+def send_burst(client, server, burst):
+    for _ in range(burst):
+        message = ACLMessage(ACLMessage.REQUEST)
+        message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+        message.add_receiver(server)
+        client.send(message)
+
+
+def run(path, requests, burst, fsync, max_batch):
+    outbox = Outbox(path, fsync=fsync, max_batch=max_batch)
+    simulation = Simulation(latency=ConstantLatency(0.001))
+    with simulation:
+        server = Server()
+        client = ImprovedAgent(AID('client@localhost:9001'), outbox=outbox)
+    for i in range(requests // burst):
+        client.call_later(1 + 0.1 * i, send_burst, client, server.aid, burst)
+
+    begin = time.perf_counter()
+    simulation.run()
+    elapsed = time.perf_counter() - begin
+
+    report = outbox.report()
+    outbox.close()
+    os.remove(path)
+    return elapsed, report
+
+
+def main(requests=2000, burst=50):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'outbox')
+    print(f'{requests} requests in bursts of {burst}')
+    for fsync in (True, False):
+        for max_batch, label in ((1, 'single'), (256, 'grouped')):
+            elapsed, report = run(path, requests, burst, fsync, max_batch)
+            print(f'fsync={fsync!s:5} {label:8} '
+                  f'{requests / elapsed:>9.0f} msg/s  '
+                  f'commits={report["commits"]:>5} '
+                  f'acknowledged={report["acknowledged"]}')
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
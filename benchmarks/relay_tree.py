@@ -0,0 +1,106 @@
+"""End-to-end publish latency to many subscribers for a flat Subscribe
+participant and for relay trees of decreasing degree (increasing
+depth), in virtual time. Each agent takes `send_us` microseconds of
+sender time per message on top of a fixed network delay.
+
+Usage: python benchmarks/relay_tree.py [subscribers] [send_us]
+"""
+import sys
+from collections import defaultdict
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.relay import FipaSubscribeRelay, relay_tree
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation
+
+PUBLISH_AT = 100.0
+
+
+class SenderQueueLatency():
+    """Messages leave each sender one after the other"""
+
+    def __init__(self, simulation, send_time, network=0.0005):
+        self.simulation = simulation
+        self.send_time = send_time
+        self.network = network
+        self.busy_until = defaultdict(float)
+
+    def __call__(self, sender, receiver, message):
+        now = self.simulation.now
+        done = max(now, self.busy_until[sender.name]) + self.send_time
+        self.busy_until[sender.name] = done
+        return done - now + self.network
+
+
+class Publisher(ImprovedAgent):
+    def __init__(self):
+        super().__init__(AID('publisher@localhost:1'))
+        self.protocol = FipaSubscribeProtocol(self, is_initiator=False)
+        self.protocol.set_subscribe_handler(self.protocol.subscribe)
+        self.call_later(PUBLISH_AT, self.publish)
+
+    def publish(self):
+        message = ACLMessage()
+        message.set_content(self.simulation.now)
+        self.protocol.send_inform(message)
+
+
+class Relay(ImprovedAgent):
+    def __init__(self, name):
+        super().__init__(AID(f'{name}@localhost:2'))
+        self.relay = FipaSubscribeRelay(self)
+        self.call_later(1, self.relay.start)
+
+
+class Subscriber(ImprovedAgent):
+    def __init__(self, name, publisher, latencies):
+        super().__init__(AID(f'{name}@localhost:3'))
+        self.protocol = FipaSubscribeProtocol(self, is_initiator=True)
+        self.latencies = latencies
+        self.call_later(10, self.subscribe, publisher)
+
+    @AgentSession.session
+    def subscribe(self, publisher):
+        message = ACLMessage()
+        message.add_receiver(publisher)
+        while True:
+            try:
+                response = yield from self.protocol.send_subscribe(message)
+                self.latencies.append(self.simulation.now - response.content)
+            except FipaAgreeHandler:
+                pass
+            except FipaProtocolComplete:
+                break
+
+
+def run(subscribers, send_time, degree, relays):
+    simulation = Simulation()
+    simulation.latency = SenderQueueLatency(simulation, send_time)
+    latencies = []
+    with simulation:
+        publisher = Publisher()
+        relay_agents = [Relay(f'relay{i}') for i in range(relays)]
+        for i in range(subscribers):
+            Subscriber(f'subscriber{i}', publisher.aid, latencies)
+    depth = relay_tree(publisher.protocol,
+                       [agent.relay for agent in relay_agents], degree)
+    simulation.run()
+
+    latencies.sort()
+    return depth, latencies
+
+
+def main(subscribers=2000, send_us=50):
+    for degree, relays in ((None, 0), (64, 64), (16, 16 + 256),
+                           (8, 8 + 64 + 512)):
+        depth, latencies = run(subscribers, send_us / 1e6, degree, relays)
+        assert len(latencies) == subscribers
+        print(f'depth {depth} ({relays:>3} relays): '
+              f'p50 {1000 * latencies[len(latencies) // 2]:6.1f} ms, '
+              f'max {1000 * latencies[-1]:6.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
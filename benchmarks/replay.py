@@ -0,0 +1,80 @@
+"""Capture the traffic of a request server, then replay it against
+the current code and compare throughput and response times.
+
+Usage:
+    python benchmarks/replay.py record capture.bin [seconds]
+    python benchmarks/replay.py replay capture.bin [speed|max]
+"""
+import sys
+from random import random
+
+from twisted.internet import reactor
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.capture import TrafficRecorder, TrafficReplayer
+from pade.plus.local import LocalAMS
+
+SERVER = 'server@localhost:23456'
+
+
+class Server(ImprovedAgent):
+    def __init__(self):
+        super().__init__(AID(SERVER))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+
+    def on_request(self, message):
+        reply = message.create_reply()
+        reply.set_content(sum(range(10000)))
+        self.request.send_inform(reply)
+
+
+class Client(ImprovedAgent):
+    def __init__(self, name, server):
+        super().__init__(AID(f'{name}@localhost:{23457 + int(name[6:])}'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server
+
+    def tick(self):
+        self.make_request()
+        self.call_later(0.05 * random(), self.tick)
+
+    @AgentSession.session
+    def make_request(self):
+        message = ACLMessage()
+        message.add_receiver(self.server)
+        while True:
+            try:
+                yield from self.request.send_request(message)
+            except FipaProtocolComplete:
+                break
+
+
+def record(path, seconds=10):
+    server = Server()
+    clients = [Client(f'client{i}', server.aid) for i in range(10)]
+    server.recorder = TrafficRecorder(path)
+
+    LocalAMS().register([server, *clients])
+    for client in clients:
+        reactor.callLater(1.0, client.tick)
+    reactor.callLater(1.0 + float(seconds), reactor.stop)
+    reactor.run()
+    server.recorder.close()
+
+
+def replay(path, speed='1'):
+    report = TrafficReplayer(path).replay(
+        [Server()], speed=None if speed == 'max' else float(speed))
+    for run, stats in report.items():
+        print(run)
+        for key, value in stats.items():
+            print(f'{key:>16}: {value:.6g}')
+
+
+if __name__ == '__main__':
+    command, *args = sys.argv[1:]
+    {'record': record, 'replay': replay}[command](*args)
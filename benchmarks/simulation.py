@@ -0,0 +1,69 @@
+"""Simulated seconds per wall-clock second for a fleet of agents
+exchanging periodic FIPA requests in virtual time.
+
+Usage: python benchmarks/simulation.py [clients] [servers] [hours]
+"""
+import sys
+from random import Random
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ExponentialLatency
+
+random = Random(0)
+
+
+class Server(ImprovedAgent):
+    def __init__(self, name):
+        super().__init__(AID(f'{name}@localhost:1'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+
+    def on_request(self, message):
+        reply = message.create_reply()
+        reply.set_content('done')
+        # Some work before answering
+        self.call_later(random.uniform(0.1, 5), self.request.send_inform, reply)
+
+
+class Client(ImprovedAgent):
+    def __init__(self, name, servers, period):
+        super().__init__(AID(f'{name}@localhost:2'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.servers = servers
+        self.period = period
+        self.call_later(5 + random.uniform(0, period), self.tick)
+
+    def tick(self):
+        self.make_request(random.choice(self.servers))
+        self.call_later(self.period, self.tick)
+
+    @AgentSession.session
+    def make_request(self, server):
+        message = ACLMessage()
+        message.add_receiver(server)
+        while True:
+            try:
+                yield from self.request.send_request(message)
+            except FipaProtocolComplete:
+                break
+
+
+def main(clients=1000, servers=50, hours=1):
+    simulation = Simulation(latency=ExponentialLatency(0.005, 0.001, seed=0))
+    with simulation:
+        server_aids = [Server(f'server{i}').aid for i in range(servers)]
+        for i in range(clients):
+            Client(f'client{i}', server_aids, period=60)
+
+    report = simulation.run(until=3600 * hours)
+    print(f'{clients} clients, {servers} servers, {hours} simulated hour(s)')
+    for key, value in report.items():
+        print(f'{key:>18}: {value:.1f}' if isinstance(value, float)
+              else f'{key:>18}: {value}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,60 @@
+"""Bytes on the wire for Subscribe INFORMs with and without delta encoding.
+
+Usage: python benchmarks/subscribe_delta.py [keys] [snapshots] [changes]
+"""
+import sys
+import time
+from pickle import dumps
+from random import randint, seed
+
+from pade.acl.messages import ACLMessage
+from pade.behaviours.session.delta import DELTA_ENCODING, make_delta
+
+
+def inform_size(content, encoding=None):
+    inform = ACLMessage(ACLMessage.INFORM)
+    inform.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
+    inform.set_content(content)
+    inform.set_encoding(encoding)
+    return len(dumps(inform))
+
+
+def snapshots(keys, count, changes):
+    state = {f'item{i}': randint(0, 10**6) for i in range(keys)}
+    for _ in range(count):
+        yield dict(state)
+        for _ in range(changes):
+            state[f'item{randint(0, keys - 1)}'] = randint(0, 10**6)
+
+
+def main(keys=10000, count=50, changes=10):
+    seed(0)
+    full_bytes = delta_bytes = 0
+    encode_time = 0.0
+    previous = None
+    version = 0
+
+    for snapshot in snapshots(keys, count, changes):
+        full_bytes += inform_size(snapshot)
+
+        start = time.perf_counter()
+        delta = make_delta(previous, snapshot)
+        encode_time += time.perf_counter() - start
+
+        version += 1
+        if delta is None:
+            content = ('full', version, None, snapshot, None)
+        else:
+            content = ('delta', version, version - 1, delta, None)
+        delta_bytes += inform_size(content, DELTA_ENCODING)
+        previous = snapshot
+
+    print(f'{count} snapshots of {keys} keys, {changes} changes each')
+    print(f'full:  {full_bytes:>12} bytes')
+    print(f'delta: {delta_bytes:>12} bytes '
+          f'({100 * (1 - delta_bytes / full_bytes):.1f}% saved)')
+    print(f'diff time per publish: {1000 * encode_time / count:.2f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
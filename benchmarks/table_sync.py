@@ -0,0 +1,73 @@
+"""Bandwidth and apply time of an agents table update when one agent
+joins a population, with the whole table in every update (as PADE's
+AMS sends it) and with versioned events (AgentDirectory/TableSync).
+
+Usage: python benchmarks/table_sync.py [agents...]
+"""
+import sys
+import time
+from pickle import dumps, loads
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.plus.agent import ImprovedAgent
+from pade.plus.directory import (
+    ADD, EVENTS, SNAPSHOT, TABLE_ENCODING, TableSync)
+from pade.plus.messages import dump_message, load_message
+
+
+def inform(content, encoding=None) -> bytes:
+    message = ACLMessage(ACLMessage.INFORM)
+    message.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
+    message.set_sender(AID('ams@localhost:8000'))
+    message.set_content(content)
+    message.set_encoding(encoding)
+    return dump_message(message)
+
+
+def timed(function, repeat):
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - begin) / repeat
+
+
+def main(counts=(100, 1000, 10000)):
+    for count in counts:
+        table = {f'agent{i}@localhost:{i}': AID(f'agent{i}@localhost:{i}')
+                 for i in range(count)}
+        joined = AID(f'agent{count}@localhost:{count}')
+
+        # Whole table, unpickled by every agent
+        full = inform(dumps({**table, joined.name: joined}))
+
+        agent = ImprovedAgent(AID('member@localhost:1'))
+        agent.update_ams(agent.ams, subscribe=False)
+
+        def apply_full():
+            agent.agentInstance.table = loads(load_message(full).content)
+
+        # One event, applied in place
+        events = inform((EVENTS, count, [(count + 1, ADD, joined.name, joined)]),
+                        TABLE_ENCODING)
+        sync = TableSync(agent)
+        sync.apply((SNAPSHOT, count, table))
+
+        def apply_events():
+            sync.version = count
+            sync.apply(load_message(events).content)
+
+        repeat = max(10, 100000 // count)
+        full_time = timed(apply_full, repeat)
+        events_time = timed(apply_events, repeat)
+
+        # Every agent of the population gets the update
+        print(f'{count:>6} agents  '
+              f'full: {len(full):>9} B/agent {len(full) * count / 1e6:9.2f} MB total '
+              f'{full_time * 1e6:9.1f} us  |  '
+              f'events: {len(events):>5} B/agent {len(events) * count / 1e6:7.3f} MB total '
+              f'{events_time * 1e6:6.1f} us')
+
+
+if __name__ == '__main__':
+    main([int(count) for count in sys.argv[1:]] or (100, 1000, 10000))
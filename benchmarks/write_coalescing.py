@@ -0,0 +1,103 @@
+"""Throughput and socket calls for bursts of messages to one peer,
+with per-message connections, pooled connections and pooled batching.
+
+Usage: python benchmarks/write_coalescing.py [burst] [rounds]
+"""
+import sys
+import time
+from collections import Counter
+from random import randint
+
+from twisted.internet import reactor, tcp
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+from pade.plus.agent import ImprovedAgent
+from pade.plus.transport import ConnectionPool
+
+from common import listen_local
+
+calls = Counter()
+
+
+def counted(name, method):
+    def wrapper(*args, **kwargs):
+        calls[name] += 1
+        return method(*args, **kwargs)
+    return wrapper
+
+
+tcp.Connection.writeSomeData = counted('send', tcp.Connection.writeSomeData)
+tcp.Connection.doRead = counted('recv', tcp.Connection.doRead)
+reactor.connectTCP = counted('connect', reactor.connectTCP)
+
+
+class Sink(ImprovedAgent):
+    def __init__(self, name, expected, done):
+        super().__init__(AID(f'{name}@localhost:{randint(10000, 60000)}'))
+        self.expected = expected
+        self.received = 0
+        self.done = done
+
+    def react(self, message):
+        self.received += 1
+        if self.received == self.expected:
+            self.done()
+
+
+class Source(ImprovedAgent):
+    def __init__(self, name, pool, sink):
+        super().__init__(AID(f'{name}@localhost:{randint(10000, 60000)}'),
+                         connection_pool=pool)
+        self.sink = sink
+
+    def burst(self, size, rounds):
+        for i in range(size):
+            message = ACLMessage(ACLMessage.INFORM)
+            message.add_receiver(self.sink)
+            message.set_content(i)
+            self.send(message)
+        if rounds > 1:
+            self.call_later(0, self.burst, size, rounds - 1)
+
+
+def main(burst=50, rounds=40):
+    modes = {
+        'per-message': None,
+        'pooled': ConnectionPool(),
+        'batched': ConnectionPool(batching=True),
+    }
+    results = {}
+    pending = list(modes)
+
+    def run_next():
+        if not pending:
+            reactor.stop()
+            return
+        label = pending.pop(0)
+        start = time.perf_counter()
+        before = Counter(calls)
+
+        def done():
+            elapsed = time.perf_counter() - start
+            results[label] = (elapsed, calls - before)
+            reactor.callLater(0.1, run_next)
+
+        sink = Sink(f'sink_{label}', burst * rounds, done)
+        source = Source(f'source_{label}', modes[label], sink.aid)
+        listen_local([sink, source])
+        source.burst(burst, rounds)
+
+    reactor.callLater(0.5, run_next)
+    reactor.run()
+
+    total = burst * rounds
+    print(f'{rounds} bursts of {burst} messages to one peer')
+    for label, (elapsed, syscalls) in results.items():
+        print(f'{label:>12}: {total / elapsed:8.0f} msg/s, '
+              f'connect={syscalls["connect"]} send={syscalls["send"]} '
+              f'recv={syscalls["recv"]}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
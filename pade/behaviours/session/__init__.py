@@ -1,13 +1,40 @@
+from collections import Counter
 from functools import wraps
 from typing import Iterable
 from collections.abc import Generator
 
+from twisted.internet import reactor
+
 from pade.behaviours.protocols import Behaviour
 from pade.acl.messages import ACLMessage
 
+from . import audit
+from . import profiling
 from .exceptions import *
 
 
+def clock(agent) -> float:
+    """Current time on the agent's clock, simulated or real"""
+    simulation = getattr(agent, 'simulation', None)
+    if simulation is not None:
+        return simulation.now
+    return reactor.seconds()
+
+
+def deadline(message: ACLMessage):
+    """Time after which nobody waits for answers to the message
+    (its reply-by), or None"""
+    try:
+        return float(message.reply_by)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_expired(message: ACLMessage, now) -> bool:
+    expiry = deadline(message)
+    return expiry is not None and now > expiry
+
+
 class GenericFipaProtocol(Behaviour):
     def __init__(self, agent):
         super().__init__(agent)
@@ -15,6 +42,22 @@ class GenericFipaProtocol(Behaviour):
 
         self.open_sessions = {}
 
+        # Expired messages dropped, by performative
+        self.dropped = Counter()
+
+    def set_deadline(self, message: ACLMessage, timeout):
+        """Mark the message as useless to receive after `timeout`
+        seconds on this agent's clock"""
+        message.set_reply_by(str(clock(self.agent) + timeout))
+
+    def drop_expired(self, message: ACLMessage) -> bool:
+        """Drop a message whose deadline passed, before any work"""
+        if message.reply_by is None or \
+                not is_expired(message, clock(self.agent)):
+            return False
+        self.dropped[message.performative] += 1
+        return True
+
     def send_not_understood(self, message: ACLMessage):
 
         message.set_performative(ACLMessage.NOT_UNDERSTOOD)
@@ -28,6 +71,13 @@ class GenericFipaProtocol(Behaviour):
         """Register generator to receive response."""
         raise NotImplementedError
 
+    def open_session(self, session_id, generator) -> None:
+        """Store the generator waiting for the session's messages"""
+
+        self.open_sessions[session_id] = generator
+        if audit.auditor is not None:
+            audit.auditor.opened(self, session_id, generator)
+
     def delete_session(self, session_id) -> None:
         """Delete an open session and terminate protocol session"""
 
@@ -37,6 +87,8 @@ class GenericFipaProtocol(Behaviour):
             pass
         else:
             AgentSession.run(generator, continuation=True)
+            if audit.auditor is not None:
+                audit.auditor.closed(self, session_id, generator)
 
 
 class AgentSession():
@@ -59,30 +111,46 @@ class AgentSession():
         return synchronized
 
     @staticmethod
-    def run(generator: Generator, continuation=False, data=None) -> None:
+    def run(generator: Generator, continuation=False) -> None:
         """Start or Resume a generator, saving the returned session
         into the referred protocol."""
 
         try:
-            if continuation:
-                if data:
-                    # End of a special method
-                    session = generator.send(data)
-                else:
+            with profiling.step(generator):
+                if continuation:
                     # Signal last protocol completion
                     session = generator.throw(FipaProtocolComplete)
-            else:
-                # Start generator
-                session = next(generator)
+                else:
+                    # Start generator
+                    session = next(generator)
 
             session.register(generator)
 
         except TypeError:
             pass
-        except StopIteration:
-            pass
+        except StopIteration as stop:
+            AgentSession.finish(generator, stop.value)
         except FipaProtocolComplete:
-            pass
+            # Ended by the session closed under it, without result
+            AgentSession.finish(generator, None)
+
+    @staticmethod
+    def finish(generator: Generator, value) -> None:
+        """Hand the return value of a finished generator to the gather
+        waiting for it. Gathers completed this way resume their caller
+        in a loop rather than through nested calls."""
+
+        while isinstance(generator, _Child):
+            gather, generator.gather = generator.gather, None
+            if gather is None:
+                # Result already given
+                return
+            gather.results[generator.index] = value
+            gather.remaining -= 1
+            if gather.remaining:
+                return
+
+            generator, value = gather.resume()
 
     @staticmethod
     def gather(*generators):
@@ -90,26 +158,114 @@ class AgentSession():
         return results
 
 
-class MultiSession():
+class Callbacks():
+    """Callbacks standing in for a generator in a protocol's session
+    table, for request/response traffic that needs no generator.
 
-    @staticmethod
-    def generate_queue(dest_generator, size):
-        # Gather responses into a list
-        results_list = [None] * size
-        for _ in range(size):
-            position, result = yield
-            results_list[position] = result
+    Protocols resume it like a generator, so dispatch, retries,
+    timeouts and profiling are the same: INFORMs sent to it call
+    `on_inform`, handlers thrown at it call the callback registered
+    for them, and closing the session before an answer other than
+    AGREE calls `on_timeout`."""
 
-        AgentSession.run(dest_generator, continuation=True, data=results_list)
+    __slots__ = ('on_inform', 'on_timeout', 'handlers', 'answered')
+
+    def __init__(self, on_inform=None, on_agree=None, on_refuse=None,
+                 on_failure=None, on_timeout=None):
+        self.on_inform = on_inform
+        self.on_timeout = on_timeout
+        self.handlers = {
+            FipaAgreeHandler: on_agree,
+            FipaRefuseHandler: on_refuse,
+            FipaFailureHandler: on_failure,
+        }
+        self.answered = False
+
+    def __repr__(self):
+        # Profiled under the name of its first callback
+        for callback in (self.on_inform, *self.handlers.values()):
+            if callback is not None:
+                return f'Callbacks({getattr(callback, "__qualname__", callback)})'
+        return 'Callbacks()'
+
+    def send(self, message):
+        self.answered = True
+        if self.on_inform is not None:
+            self.on_inform(message)
+
+    def throw(self, handler, message=None):
+        if issubclass(handler, FipaProtocolComplete):
+            if not self.answered:
+                self.answered = True
+                if self.on_timeout is not None:
+                    self.on_timeout()
+            raise StopIteration
+
+        if handler is not FipaAgreeHandler:
+            self.answered = True
+        callback = self.handlers.get(handler)
+        if callback is not None:
+            callback(message)
+
+
+class _Gather():
+    """Results of a gather and count of generators still running"""
+
+    __slots__ = ('parent', 'results', 'remaining')
+
+    def __init__(self, parent: Generator, size):
+        self.parent = parent
+        self.results = [None] * size
+        self.remaining = size
+
+    def resume(self):
+        """Send results to the generator that called gather.
+        Returns (generator, return value) if it finished."""
 
-    @staticmethod
-    def generate_send_to_queue(generator, queue, position):
-        # Modify generator to send result to queue
-        result = yield from generator
         try:
-            queue.send((position, result))
-        except StopIteration:
-            pass
+            with profiling.step(self.parent):
+                session = self.parent.send(self.results)
+        except StopIteration as stop:
+            return self.parent, stop.value
+        except FipaProtocolComplete:
+            return self.parent, None
+        else:
+            session.register(self.parent)
+        return None, None
+
+
+class _Child():
+    """Generator started by a gather, with the place of its result.
+    Protocols hold and resume it in place of the generator."""
+
+    __slots__ = ('generator', 'gather', 'index')
+
+    def __init__(self, generator: Generator, gather: _Gather, index):
+        self.generator = generator
+        self.gather = gather
+        self.index = index
+
+    def __next__(self):
+        return next(self.generator)
+
+    def send(self, value):
+        return self.generator.send(value)
+
+    def throw(self, *args):
+        return self.generator.throw(*args)
+
+    def close(self):
+        self.generator.close()
+
+    def __getattr__(self, name):
+        # gi_frame, __qualname__... for profiling and auditing
+        return getattr(self.generator, name)
+
+    def __repr__(self):
+        return repr(self.generator)
+
+
+class MultiSession():
 
     def __init__(self, generators: Iterable[Generator]):
         # dict AgentSession -> generator
@@ -118,15 +274,28 @@ class MultiSession():
     def register(self, outside_generator: Generator):
         """Register session in the interaction protocol"""
 
-        response_queue = MultiSession.generate_queue(
-            outside_generator, size=len(self.generators)
-        )
-        next(response_queue)
-
-        for index, generator in enumerate(self.generators):
-            # Save modified generators into their respective Protocols
-            modified = MultiSession.generate_send_to_queue(
-                generator, queue=response_queue, position=index
-            )
-            session = next(modified)
-            session.register(modified)
+        # Nested gathers are started from this loop, not recursively
+        pending = [(self, outside_generator)]
+        while pending:
+            multi_session, parent = pending.pop()
+            gather = _Gather(parent, len(multi_session.generators))
+            if not multi_session.generators:
+                AgentSession.finish(*gather.resume())
+                continue
+
+            for index, generator in enumerate(multi_session.generators):
+                generator = _Child(generator, gather, index)
+                try:
+                    with profiling.step(generator):
+                        session = next(generator)
+                except StopIteration as stop:
+                    AgentSession.finish(generator, stop.value)
+                    continue
+                except FipaProtocolComplete:
+                    AgentSession.finish(generator, None)
+                    continue
+
+                if isinstance(session, MultiSession):
+                    pending.append((session, generator))
+                else:
+                    session.register(generator)
@@ -0,0 +1,173 @@
+from collections import Counter
+
+from pade.misc.utility import display_message
+
+# Active SessionAuditor, if any
+auditor = None
+
+
+def enable(max_age=None, max_idle=None):
+    """Start tracking the sessions registered in protocols"""
+    global auditor
+    auditor = SessionAuditor(max_age, max_idle)
+    return auditor
+
+
+def disable():
+    global auditor
+    auditor = None
+
+
+def site(generator):
+    """Function, file and first line of the code running a session"""
+
+    code = getattr(generator, 'gi_code', None)
+    if code is None:
+        return repr(generator), None, None
+    return generator.__qualname__, code.co_filename, code.co_firstlineno
+
+
+class _Live():
+    __slots__ = ('protocol', 'session_id', 'created', 'resumed')
+
+    def __init__(self, protocol, session_id, now):
+        self.protocol = protocol
+        self.session_id = session_id
+        self.created = now
+        self.resumed = now
+
+
+class SessionAuditor():
+    """Tracks the generators waiting in protocol sessions: where they
+    were created, since when they live and when they were last resumed.
+
+    A generator keeps its record while it moves from one session to the
+    next. sweep() closes the sessions older than `max_age` or not
+    resumed for `max_idle` seconds, even if the generator swallows
+    FipaProtocolComplete."""
+
+    def __init__(self, max_age=None, max_idle=None):
+        from . import AgentSession, clock
+        self.clock = clock
+        self.finish = AgentSession.finish
+
+        self.max_age = max_age
+        self.max_idle = max_idle
+
+        # generator -> _Live
+        self.sessions = {}
+        self.stats = Counter()
+
+    def opened(self, protocol, session_id, generator):
+        live = self.sessions.get(generator)
+        if live is None:
+            self.sessions[generator] = _Live(
+                protocol, session_id, self.clock(protocol.agent))
+            self.stats['opened'] += 1
+        else:
+            live.protocol = protocol
+            live.session_id = session_id
+
+    def resumed(self, generator):
+        live = self.sessions.get(generator)
+        if live is not None:
+            live.resumed = self.clock(live.protocol.agent)
+
+    def closed(self, protocol, session_id, generator):
+        """Forget a generator, unless it opened another session"""
+        live = self.sessions.get(generator)
+        if live is not None and live.protocol is protocol and \
+                live.session_id == session_id and \
+                protocol.open_sessions.get(session_id) is not generator:
+            del self.sessions[generator]
+            self.stats['closed'] += 1
+
+    def live(self, older_than=0.0) -> list:
+        """Sessions alive for more than `older_than` seconds, oldest first"""
+
+        sessions = []
+        for generator, live in self.sessions.items():
+            now = self.clock(live.protocol.agent)
+            if now - live.created < older_than:
+                continue
+            name, filename, line = site(generator)
+            sessions.append({
+                'agent': live.protocol.agent.aid.name,
+                'protocol': type(live.protocol).__name__,
+                'session_id': live.session_id,
+                'site': name,
+                'file': filename,
+                'line': line,
+                'age': now - live.created,
+                'idle': now - live.resumed,
+            })
+        return sorted(sessions, key=lambda session: -session['age'])
+
+    def count(self) -> dict:
+        """Live sessions per protocol class"""
+        return dict(Counter(type(live.protocol).__name__
+                            for live in self.sessions.values()))
+
+    def expired(self) -> list:
+        expired = []
+        for generator, live in self.sessions.items():
+            now = self.clock(live.protocol.agent)
+            if self.max_age is not None and now - live.created > self.max_age or \
+                    self.max_idle is not None and now - live.resumed > self.max_idle:
+                expired.append(generator)
+        return expired
+
+    def sweep(self) -> int:
+        """Close the sessions past max_age or max_idle. Returns how many
+        were closed."""
+
+        expired = self.expired()
+        for generator in expired:
+            self.close(generator)
+        return len(expired)
+
+    def close(self, generator):
+        """Close a session as its expiry would, then close the generator
+        if it keeps running. A gather waiting for it gets None."""
+
+        live = self.sessions.get(generator)
+        if live is None:
+            return
+
+        name, filename, line = site(generator)
+        display_message('auditor',
+                        f'closing session {live.session_id} of {name} '
+                        f'({filename}:{line})')
+        self.stats['forced'] += 1
+        live.protocol.delete_session(live.session_id)
+
+        # Still registered: FipaProtocolComplete was swallowed
+        live = self.sessions.pop(generator, None)
+        if live is None:
+            return
+        live.protocol.open_sessions.pop(live.session_id, None)
+        self.stats['closed'] += 1
+        self.stats['swallowed'] += 1
+
+        close = getattr(generator, 'close', None)
+        if close is not None:
+            close()
+
+        self.finish(generator, None)
+
+    def schedule(self, agent, interval):
+        """Sweep every `interval` seconds on the agent's clock"""
+        self.sweep()
+        agent.call_later(interval, self.schedule, agent, interval)
+
+    def report(self) -> dict:
+        oldest = self.live()[:1]
+        return {
+            'live': len(self.sessions),
+            'per_protocol': self.count(),
+            'oldest': oldest[0]['age'] if oldest else 0.0,
+            'opened': self.stats['opened'],
+            'closed': self.stats['closed'],
+            'forced': self.stats['forced'],
+            'swallowed': self.stats['swallowed'],
+        }
@@ -0,0 +1,75 @@
+from collections import Counter, OrderedDict
+from pickle import dumps, loads
+
+
+class ResponseCache():
+    """Replies a participant sent to each request, kept to answer
+    duplicates of the request without running its handler again.
+
+    Requests are identified by (sender, conversation_id, reply_with).
+    At most `max_size` requests are remembered, least recently used
+    first out, each for `ttl` seconds. Duplicates of a request still
+    being handled get the replies sent so far."""
+
+    def __init__(self, max_size=1024, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # key -> [time of the request, pickled replies, size in bytes]
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stats = Counter()
+
+    def lookup(self, message, now):
+        """Replies already sent for a duplicate of `message`, or None
+        (and `message` is remembered) if it is new"""
+
+        sender = message.sender.name if message.sender is not None else None
+        key = (sender, message.conversation_id, message.reply_with)
+
+        entry = self.entries.get(key)
+        if entry is not None and now - entry[0] > self.ttl:
+            self.remove(key)
+            self.stats['expired'] += 1
+            entry = None
+
+        if entry is None:
+            self.stats['misses'] += 1
+            self.entries[key] = [now, [], 0]
+            while len(self.entries) > self.max_size:
+                self.remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+            return None
+
+        self.stats['hits'] += 1
+        self.entries.move_to_end(key)
+        return [loads(reply) for reply in entry[1]]
+
+    def record(self, message):
+        """Remember a reply sent to a request in the cache"""
+
+        for receiver in message.receivers:
+            key = (receiver.name, message.conversation_id, message.in_reply_to)
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+
+            reply = dumps(message)
+            entry[1].append(reply)
+            entry[2] += len(reply)
+            self.size += len(reply)
+
+    def remove(self, key):
+        self.size -= self.entries.pop(key)[2]
+
+    def report(self) -> dict:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'hits': self.stats['hits'],
+            'misses': self.stats['misses'],
+            'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+            'evictions': self.stats['evictions'],
+            'expired': self.stats['expired'],
+        }
@@ -0,0 +1,87 @@
+from difflib import SequenceMatcher
+
+# Value of the ACL encoding field for delta-encoded contents
+DELTA_ENCODING = 'pade-plus-delta'
+
+# Above this ratio of changed items the full content is sent instead
+MAX_DELTA_RATIO = 0.5
+
+# Longest changed region that is refined by SequenceMatcher (quadratic)
+MAX_MATCHER_SIZE = 4096
+
+
+def make_delta(old, new):
+    """Compute a compact diff that rebuilds `new` from `old`.
+
+    Supports dicts (key level) and str/bytes (opcode level).
+    Returns None whenever a full snapshot would be cheaper."""
+
+    if old is None or type(old) is not type(new):
+        return None
+
+    if isinstance(new, dict):
+        changed = {k: v for k, v in new.items()
+                   if k not in old or old[k] != v}
+        deleted = tuple(k for k in old if k not in new)
+        if len(changed) + len(deleted) > MAX_DELTA_RATIO * max(len(new), 1):
+            return None
+        return ('dict', changed, deleted)
+
+    if isinstance(new, (str, bytes)):
+        # Trim the common prefix and suffix first
+        start = _common_prefix(old, new)
+        end = _common_prefix(old[start:][::-1], new[start:][::-1])
+        old_middle = old[start:len(old) - end]
+        new_middle = new[start:len(new) - end]
+
+        if max(len(old_middle), len(new_middle)) > MAX_MATCHER_SIZE:
+            ops = [(start, start + len(old_middle), new_middle)]
+        else:
+            matcher = SequenceMatcher(None, old_middle, new_middle,
+                                      autojunk=False)
+            ops = [(start + i1, start + i2, new_middle[j1:j2])
+                   for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+                   if tag != 'equal']
+        if sum(len(part) for *_, part in ops) > MAX_DELTA_RATIO * len(new):
+            return None
+        return ('seq', ops)
+
+    return None
+
+
+def _common_prefix(a, b):
+    """Length of the common prefix of two sequences"""
+
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def apply_delta(old, delta):
+    """Rebuild a content from its previous value and a delta"""
+
+    kind = delta[0]
+
+    if kind == 'dict':
+        _, changed, deleted = delta
+        content = {k: v for k, v in old.items() if k not in deleted}
+        content.update(changed)
+        return content
+
+    if kind == 'seq':
+        _, ops = delta
+        parts = []
+        position = 0
+        for i1, i2, part in ops:
+            parts.append(old[position:i1])
+            parts.append(part)
+            position = i2
+        parts.append(old[position:])
+        return old[:0].join(parts)
+
+    raise ValueError(f'Unknown delta kind: {kind}')
@@ -41,3 +41,7 @@ class FipaRejectProposalHandler(FipaMessageHandler):
 
 class FipaNotUnderstoodHandler(FipaMessageHandler):
     """Exception handler for FIPA-NOT-UNDERSTOOD messages"""
+
+
+class FipaChunkHandler(FipaMessageHandler):
+    """Exception handler for each part of a streamed INFORM"""
@@ -1,16 +1,36 @@
+from collections import Counter
 from typing import Any, Callable
 
 from pade.acl.messages import ACLMessage
 from pade.core.agent import Agent
 
 from . import GenericFipaProtocol
-from . import AgentSession
+from . import AgentSession, clock
+from . import profiling
 from .exceptions import *
+from .latency import LatencyEstimator
+from .stream import ChunkReceiver, ChunkSender, is_stream
+
+
+class CfpSession(AgentSession):
+    """Session of a cfp with early termination options"""
+
+    def __init__(self, protocol, message, **options):
+        super().__init__(protocol, message)
+        self.options = options
+
+    def register(self, generator):
+        return self.protocol.register_session(
+            self.message, generator, **self.options)
 
 
 class FipaContractNetProtocolInitiator(GenericFipaProtocol):
 
-    def __init__(self, agent):
+    # Longest CFP phase
+    CFP_TIMEOUT = 30
+
+    def __init__(self, agent, min_deadline=0.5,
+                 latency: LatencyEstimator = None):
         super().__init__(agent)
 
         # Denote each open request. It is possible to have multiple
@@ -18,6 +38,19 @@ class FipaContractNetProtocolInitiator(GenericFipaProtocol):
         # The pair (conversation_id) represents a unique session.
         self.session_params = {}
 
+        # Contractor name -> [mean, deviation] of its answer time,
+        # for adaptive CFP deadlines
+        self.cfp_latency = {}
+        self.min_deadline = min_deadline
+        self.stats = Counter()
+
+        # Optional LatencyEstimator giving the CFP phase timeout
+        # of new sessions
+        self.latency = latency
+
+        # Streamed results being received
+        self.streams = ChunkReceiver(agent)
+
     def execute(self, message: ACLMessage):
         """Called whenever the agent receives a message.
         
@@ -37,6 +70,23 @@ class FipaContractNetProtocolInitiator(GenericFipaProtocol):
         generator = self.open_sessions[session_id]
         params = self.session_params[session_id]
 
+        if message.performative in (ACLMessage.PROPOSE, ACLMessage.REFUSE):
+            self.observe_latency(message.sender.name,
+                                 clock(self.agent) - params['started'])
+
+            # Proposal after the end of the CFP phase
+            if not params['cfp_phase']:
+                if message.performative == ACLMessage.PROPOSE:
+                    self.reject_late(message, params)
+                return
+
+        # Parts of a streamed result go on until the last one
+        if not params['cfp_phase'] and \
+                message.performative == ACLMessage.INFORM and is_stream(message):
+            message = self.stream_part(session_id, message)
+            if message is None:
+                return
+
         # CFP Phase
         if params['cfp_phase']:
             handlers = {
@@ -55,9 +105,10 @@ class FipaContractNetProtocolInitiator(GenericFipaProtocol):
 
         # Resume generator
         try:
-            handlers[message.performative]()
-        except StopIteration:
-            pass
+            with profiling.step(generator):
+                handlers[message.performative]()
+        except StopIteration as stop:
+            AgentSession.finish(generator, stop.value)
         except KeyError:
             return
 
@@ -66,6 +117,18 @@ class FipaContractNetProtocolInitiator(GenericFipaProtocol):
         # First phase: CFP
         if params['cfp_phase']:
 
+            if message.performative == ACLMessage.PROPOSE:
+                params['proposals'] += 1
+                if params['quorum'] is not None and \
+                        params['proposals'] >= params['quorum']:
+                    self.stats['quorum'] += 1
+                    self.end_cfp(session_id)
+                    return
+                if params['accept'] is not None and params['accept'](message):
+                    self.stats['accepted'] += 1
+                    self.end_cfp(session_id)
+                    return
+
             if all(
                 receiver_msgs & {
                     ACLMessage.PROPOSE, ACLMessage.REFUSE}
@@ -99,21 +162,93 @@ class FipaContractNetProtocolInitiator(GenericFipaProtocol):
                 params['cfp_phase'] = False
 
                 try:
-                    generator.throw(FipaCfpComplete)
-                except (StopIteration, FipaCfpComplete):
+                    with profiling.step(generator):
+                        generator.throw(FipaCfpComplete)
+                except StopIteration as stop:
+                    AgentSession.finish(generator, stop.value)
+                except FipaCfpComplete:
                     pass
 
-    def send_cfp(self, message: ACLMessage):
+    def stream_part(self, session_id, message):
+        """Hand over the parts of a streamed INFORM received so far.
+        Returns the final INFORM once all parts arrived."""
+
+        ready, end = self.streams.receive(message)
+        generator = self.open_sessions[session_id]
+        for part in ready:
+            try:
+                with profiling.step(generator):
+                    generator.throw(FipaChunkHandler, part)
+            except StopIteration as stop:
+                # No longer interested
+                AgentSession.finish(generator, stop.value)
+                self.delete_session(session_id)
+                return None
+
+        self.streams.consumed(message)
+        return end
+
+    def observe_latency(self, name, latency):
+        """Smoothed answer time and deviation, as TCP does for RTT"""
+
+        if self.latency is not None:
+            self.latency.observe(name, latency)
+
+        estimate = self.cfp_latency.get(name)
+        if estimate is None:
+            self.cfp_latency[name] = [latency, latency / 2]
+        else:
+            estimate[1] += 0.25 * (abs(latency - estimate[0]) - estimate[1])
+            estimate[0] += 0.125 * (latency - estimate[0])
+
+    def cfp_deadline(self, receivers) -> float:
+        """Time by which all receivers usually answered a cfp"""
+
+        deadline = self.min_deadline
+        for receiver in receivers:
+            estimate = self.cfp_latency.get(receiver.name)
+            if estimate is None:
+                return self.CFP_TIMEOUT
+            deadline = max(deadline, estimate[0] + 4 * estimate[1])
+        return min(deadline, self.CFP_TIMEOUT)
+
+    def reject_late(self, message: ACLMessage, params):
+        """Refuse a proposal that arrived after the CFP phase"""
+
+        receiver_msgs = params['receivers'].setdefault(message.sender, set())
+        if receiver_msgs & {ACLMessage.ACCEPT_PROPOSAL, ACLMessage.REJECT_PROPOSAL}:
+            return
+
+        self.stats['late'] += 1
+        receiver_msgs.add(ACLMessage.REJECT_PROPOSAL)
+        reply = message.create_reply()
+        reply.set_protocol(ACLMessage.FIPA_CONTRACT_NET_PROTOCOL)
+        reply.set_performative(ACLMessage.REJECT_PROPOSAL)
+        reply.set_content('late proposal')
+        self.agent.send(reply)
+
+    def send_cfp(self, message: ACLMessage, quorum=None, accept=None,
+                 adaptive=False):
+        """Send a cfp. The CFP phase also ends once `quorum` proposals
+        arrived, a proposal satisfies `accept(proposal)`, or with
+        `adaptive`, once contractors usually answered."""
 
         message.set_protocol(ACLMessage.FIPA_CONTRACT_NET_PROTOCOL)
         message.set_performative(ACLMessage.CFP)
 
-        response = yield AgentSession(self, message)
+        response = yield CfpSession(self, message, quorum=quorum,
+                                    accept=accept, adaptive=adaptive)
         return response
 
-    def send_accept_proposal(self, message: ACLMessage):
+    def send_accept_proposal(self, message: ACLMessage, stream=False):
+        """Accept a proposal. With `stream`, the parts of streamed
+        results are thrown as FipaChunkHandler as they come, and the
+        final INFORM has no content; otherwise the final INFORM holds
+        the list of parts."""
 
         session_id = message.conversation_id
+        if stream:
+            self.streams.expect(session_id)
         receiver = message.receivers[0]
         receiver_msgs = self.session_params[session_id]['receivers'][receiver]
 
@@ -146,22 +281,35 @@ class FipaContractNetProtocolInitiator(GenericFipaProtocol):
             # Send message to all receivers
             self.agent.send(message)
 
-    def register_session(self, message, generator) -> None:
+    def register_session(self, message, generator, quorum=None, accept=None,
+                         adaptive=False) -> None:
 
         receivers = message.receivers
         # Register generator in session
         session_id = message.conversation_id
-        self.open_sessions[session_id] = generator
+        self.open_session(session_id, generator)
         self.session_params[session_id] = {
             'cfp_phase': True,
-            'receivers': {r: set() for r in receivers}
+            'receivers': {r: set() for r in receivers},
+            'started': clock(self.agent),
+            'proposals': 0,
+            'quorum': quorum,
+            'accept': accept,
         }
 
-        # Send cfp message now
+        # Set timeout to CFP
+        if adaptive:
+            timeout = self.cfp_deadline(receivers)
+        elif self.latency is not None:
+            timeout = self.latency.timeout(receivers, self.CFP_TIMEOUT)
+        else:
+            timeout = self.CFP_TIMEOUT
+
+        # Send cfp message now, useless after the CFP phase
+        self.set_deadline(message, timeout)
         self.agent.send(message)
 
-        # Set timeout to CFP
-        self.agent.call_later(30, self.end_cfp, session_id)
+        self.agent.call_later(timeout, self.end_cfp, session_id)
         # The session expires in 1 minute by default
         self.agent.call_later(60, self.delete_session, session_id)
 
@@ -171,16 +319,23 @@ class FipaContractNetProtocolInitiator(GenericFipaProtocol):
             params = self.session_params.pop(session_id)
         except KeyError:
             pass
+        self.streams.discard(session_id)
 
         super().delete_session(session_id)
 
 
 class FipaContractNetProtocolParticipant(GenericFipaProtocol):
 
-    def __init__(self, agent):
+    def __init__(self, agent, response_cache=None):
         super().__init__(agent)
         self.callback = None
 
+        # Optional ResponseCache answering duplicated requests
+        self.response_cache = response_cache
+
+        # Streamed results being sent. Their parts bypass the cache.
+        self.streams = ChunkSender(agent, agent.send)
+
     def execute(self, message: ACLMessage):
         """Called whenever the agent receives a message.
         The message was NOT yet filtered in terms of:
@@ -191,8 +346,19 @@ class FipaContractNetProtocolParticipant(GenericFipaProtocol):
         if not message.protocol == ACLMessage.FIPA_CONTRACT_NET_PROTOCOL:
             return
 
+        # Flow control of streamed results
+        if message.performative == ACLMessage.CONFIRM and is_stream(message):
+            self.streams.credit(message)
+            return
+        if message.performative == ACLMessage.CANCEL:
+            self.streams.cancel(message)
+            return
+
         if message.performative == ACLMessage.CFP:
-            self.callback(message)
+            if not self.drop_expired(message) and \
+                    not self.is_duplicate(message):
+                with profiling.step(self.callback):
+                    self.callback(message)
             return
 
         # Filter for session_id (conversation_id)
@@ -208,20 +374,46 @@ class FipaContractNetProtocolParticipant(GenericFipaProtocol):
                 FipaRejectProposalHandler, message)
         }
         try:
-            handlers[message.performative]()
-        except StopIteration:
-            pass
+            with profiling.step(generator):
+                handlers[message.performative]()
+        except StopIteration as stop:
+            AgentSession.finish(generator, stop.value)
         except KeyError:
             return
 
         # Clear session
         self.delete_session(session_id)
 
+    def report(self) -> dict:
+        return {
+            'expired': sum(self.dropped.values()),
+            'streams': self.streams.report(),
+        }
+
     def set_cfp_handler(self, callback: Callable[[ACLMessage], Any]):
         """Add function to be called on cfp"""
 
         self.callback = callback
 
+    def is_duplicate(self, message) -> bool:
+        """Send again the replies to an already received cfp"""
+
+        if self.response_cache is None:
+            return False
+
+        replies = self.response_cache.lookup(message, clock(self.agent))
+        if replies is None:
+            return False
+
+        for reply in replies:
+            self.agent.send(reply)
+        return True
+
+    def reply(self, message: ACLMessage):
+        self.agent.send(message)
+        if self.response_cache is not None:
+            self.response_cache.record(message)
+
     def send_propose(self, message: ACLMessage):
 
         message.set_protocol(ACLMessage.FIPA_CONTRACT_NET_PROTOCOL)
@@ -236,7 +428,7 @@ class FipaContractNetProtocolParticipant(GenericFipaProtocol):
         message.set_performative(ACLMessage.REFUSE)
 
         # Send message to all receivers
-        self.agent.send(message)
+        self.reply(message)
 
     def send_inform(self, message: ACLMessage):
 
@@ -244,7 +436,7 @@ class FipaContractNetProtocolParticipant(GenericFipaProtocol):
         message.set_performative(ACLMessage.INFORM)
 
         # Send message to all receivers
-        self.agent.send(message)
+        self.reply(message)
 
     def send_failure(self, message: ACLMessage):
 
@@ -252,24 +444,31 @@ class FipaContractNetProtocolParticipant(GenericFipaProtocol):
         message.set_performative(ACLMessage.FAILURE)
 
         # Send message to all receivers
-        self.agent.send(message)
+        self.reply(message)
+
+    def send_stream(self, message: ACLMessage, chunks, window=8):
+        """Send the result in parts taken from the iterable `chunks`,
+        with at most `window` parts not yet consumed by the initiator"""
+
+        message.set_protocol(ACLMessage.FIPA_CONTRACT_NET_PROTOCOL)
+        self.streams.start(message, chunks, window)
 
     def register_session(self, message, generator) -> None:
 
         # Register generator in session
         session_id = message.conversation_id
-        self.open_sessions[session_id] = generator
+        self.open_session(session_id, generator)
 
         # Send propose message now
-        self.agent.send(message)
+        self.reply(message)
 
         # The session expires in 1 minute by default
         self.agent.call_later(60, self.delete_session, session_id)
 
 
-def FipaContractNetProtocol(agent: Agent, is_initiator=True):
+def FipaContractNetProtocol(agent: Agent, is_initiator=True, **kwargs):
 
     if is_initiator:
-        return FipaContractNetProtocolInitiator(agent)
+        return FipaContractNetProtocolInitiator(agent, **kwargs)
     else:
-        return FipaContractNetProtocolParticipant(agent)
+        return FipaContractNetProtocolParticipant(agent, **kwargs)
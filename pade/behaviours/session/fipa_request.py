@@ -1,16 +1,38 @@
+from collections import Counter, OrderedDict
 from typing import Any, Callable
 
 from pade.acl.messages import ACLMessage
 from pade.core.agent import Agent
 
 from . import GenericFipaProtocol
-from . import AgentSession
+from . import AgentSession, Callbacks, clock, deadline
+from . import profiling
 from .exceptions import *
+from .latency import LatencyEstimator
+from .memo import ContentCache
+from .replicas import ReplicaGroup, ReplicaSession, _Hedge
+from .retry import TIMEOUT, CircuitBreaker
+from .stream import ChunkReceiver, ChunkSender, is_stream
+
+
+class _Attempt():
+    __slots__ = ('message', 'receiver', 'number', 'timer', 'answered')
+
+    def __init__(self, message):
+        self.message = message
+        self.receiver = message.receivers[0].name
+        self.number = 1
+        self.timer = None
+        self.answered = False
 
 
 class FipaRequestProtocolInitiator(GenericFipaProtocol):
 
-    def __init__(self, agent):
+    # Session expiry without LatencyEstimator
+    SESSION_TIMEOUT = 60
+
+    def __init__(self, agent, retry_policy=None, circuit_breaker=None,
+                 latency: LatencyEstimator = None):
         super().__init__(agent)
 
         # Denote each open request. It is possible to have multiple
@@ -18,6 +40,27 @@ class FipaRequestProtocolInitiator(GenericFipaProtocol):
         # The pair (conversation_id) represents a unique session.
         self.open_sessions = {}
 
+        # Optional RetryPolicy and CircuitBreaker
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+
+        # session_id -> _Attempt, when retrying or circuit breaking
+        self.attempts = {}
+        self.stats = Counter()
+
+        # session_id -> _Hedge, for requests to a ReplicaGroup
+        self.hedges = {}
+
+        # Optional LatencyEstimator of the receivers' response times,
+        # giving the timeouts of new sessions (of attempts, with a
+        # RetryPolicy without timeout), and session_id -> (receiver,
+        # time the request was sent)
+        self.latency = latency
+        self.sent_at = {}
+
+        # Streamed INFORMs being received
+        self.streams = ChunkReceiver(agent)
+
     def execute(self, message: ACLMessage):
         """Called whenever the agent receives a message.
         The message was NOT yet filtered in terms of:
@@ -33,6 +76,27 @@ class FipaRequestProtocolInitiator(GenericFipaProtocol):
         if session_id not in self.open_sessions:
             return
 
+        # Parts of a streamed INFORM go on until the last one
+        if message.performative == ACLMessage.INFORM and is_stream(message):
+            message = self.stream_part(session_id, message)
+            if message is None:
+                return
+
+        if session_id in self.sent_at and message.performative in \
+                (ACLMessage.INFORM, ACLMessage.FAILURE, ACLMessage.REFUSE):
+            receiver, sent = self.sent_at.pop(session_id)
+            self.latency.observe(receiver, clock(self.agent) - sent)
+
+        # Only the first useful answer of a replica group resumes
+        if session_id in self.hedges and \
+                not self.replica_answered(session_id, message):
+            return
+
+        # Send again instead of resuming on a retried failure
+        if session_id in self.attempts and \
+                self.answered(session_id, message.performative):
+            return
+
         # Resume generator
         generator = self.open_sessions[session_id]
         handlers = {
@@ -43,9 +107,10 @@ class FipaRequestProtocolInitiator(GenericFipaProtocol):
                 FipaFailureHandler, message)
         }
         try:
-            handlers[message.performative]()
-        except StopIteration:
-            pass
+            with profiling.step(generator):
+                handlers[message.performative]()
+        except StopIteration as stop:
+            AgentSession.finish(generator, stop.value)
         except KeyError:
             return
 
@@ -53,33 +118,363 @@ class FipaRequestProtocolInitiator(GenericFipaProtocol):
         if message.performative in (ACLMessage.REFUSE, ACLMessage.INFORM, ACLMessage.FAILURE):
             self.delete_session(session_id)
 
-    def send_request(self, message: ACLMessage):
+    def send_request(self, message: ACLMessage, stream=False):
+        """Send a request. With `stream`, the parts of a streamed
+        answer are thrown as FipaChunkHandler as they come, and the
+        final INFORM has no content; otherwise the final INFORM holds
+        the list of parts."""
+
         # Only individual messages
         assert len(message.receivers) == 1
 
         message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
         message.set_performative(ACLMessage.REQUEST)
+        if stream:
+            self.streams.expect(message.conversation_id)
 
         response = yield AgentSession(self, message)
         return response
 
+    def request(self, message: ACLMessage, on_inform=None, on_agree=None,
+                on_refuse=None, on_failure=None, on_timeout=None,
+                group: ReplicaGroup = None):
+        """Send a request answered through callbacks rather than a
+        generator session. `on_timeout` is called if the session
+        expires without an answer."""
+
+        message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+        message.set_performative(ACLMessage.REQUEST)
+
+        callbacks = Callbacks(on_inform, on_agree, on_refuse, on_failure,
+                              on_timeout)
+        if group is None:
+            # Only individual messages
+            assert len(message.receivers) == 1
+            self.register_session(message, callbacks)
+        else:
+            assert not message.receivers
+            self.register_group_session(message, callbacks, group)
+
+    def stream_part(self, session_id, message):
+        """Hand over the parts of a streamed INFORM received so far.
+        Returns the final INFORM once all parts arrived."""
+
+        # The first part answers the request
+        attempt = self.attempts.get(session_id)
+        if attempt is not None and not attempt.answered:
+            self.answered(session_id, ACLMessage.INFORM)
+
+        ready, end = self.streams.receive(message)
+        generator = self.open_sessions[session_id]
+        for part in ready:
+            try:
+                with profiling.step(generator):
+                    generator.throw(FipaChunkHandler, part)
+            except StopIteration as stop:
+                # No longer interested
+                AgentSession.finish(generator, stop.value)
+                self.delete_session(session_id)
+                return None
+
+        self.streams.consumed(message)
+        return end
+
+    def send_group_request(self, message: ACLMessage, group: ReplicaGroup):
+        # Receiver is chosen from the group
+        assert not message.receivers
+
+        message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+        message.set_performative(ACLMessage.REQUEST)
+
+        response = yield ReplicaSession(self, message, group)
+        return response
+
+    def register_group_session(self, message, generator, group) -> None:
+        session_id = message.conversation_id
+        self.open_session(session_id, generator)
+
+        timeout = self.session_timeout(group.replicas)
+        self.set_deadline(message, timeout)
+
+        hedge = _Hedge(group, message)
+        self.hedges[session_id] = hedge
+        group.stats['requests'] += 1
+        if not self.send_replica(session_id):
+            del self.hedges[session_id]
+            self.stats['rejected'] += 1
+            self.fail_soon(session_id, 'no replica available')
+            return
+
+        delay = group.hedge_delay()
+        if delay is not None:
+            hedge.timer = self.agent.call_later(delay, self.hedge, session_id)
+
+        # The session expires after SESSION_TIMEOUT by default
+        self.agent.call_later(timeout, self.delete_session, session_id)
+
+    def send_replica(self, session_id) -> bool:
+        """Send the request to one more replica of the group"""
+
+        hedge = self.hedges[session_id]
+        available = None
+        if self.circuit_breaker is not None:
+            def available(name):
+                return self.circuit_breaker.state(name) != CircuitBreaker.OPEN
+
+        replica = hedge.group.choose(hedge.receivers, available)
+        if replica is None:
+            return False
+
+        hedge.group.started(replica.name)
+        hedge.receivers[replica.name] = clock(self.agent)
+        self.agent.send(hedge.request(replica))
+        return True
+
+    def hedge(self, session_id):
+        hedge = self.hedges.get(session_id)
+        if hedge is None:
+            return
+
+        hedge.timer = None
+        if self.send_replica(session_id):
+            hedge.group.stats['hedged'] += 1
+            hedge.hedged = list(hedge.receivers)[-1]
+
+    def replica_answered(self, session_id, message) -> bool:
+        """Account for a replica's answer, return True if it must be
+        passed on to the session"""
+
+        hedge = self.hedges[session_id]
+        name = message.sender.name
+        if name not in hedge.receivers:
+            return False
+
+        if message.performative == ACLMessage.AGREE:
+            first, hedge.agreed = not hedge.agreed, True
+            return first
+
+        started = hedge.receivers.pop(name)
+        if self.latency is not None:
+            self.latency.observe(name, clock(self.agent) - started)
+
+        if message.performative == ACLMessage.INFORM:
+            hedge.group.finished(name, clock(self.agent) - started)
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success(name)
+            if name == hedge.hedged:
+                hedge.group.stats['hedge_wins'] += 1
+            return True
+
+        hedge.group.finished(name)
+        if message.performative == ACLMessage.FAILURE:
+            self.record_failure(name)
+
+        # Wait for the replicas still working on it
+        return not hedge.receivers
+
+    def cancel_replicas(self, hedge):
+        """Tell replicas that lost the race to stop"""
+
+        for name in hedge.receivers:
+            hedge.group.finished(name)
+            hedge.group.stats['cancelled'] += 1
+
+            cancel = hedge.request(name)
+            cancel.set_performative(ACLMessage.CANCEL)
+            self.agent.send(cancel)
+        hedge.receivers.clear()
+
     def register_session(self, message, generator) -> None:
         # Register generator in session
         session_id = message.conversation_id
-        self.open_sessions[session_id] = generator
+        self.open_session(session_id, generator)
+
+        # Fail at once while the receiver's circuit is open
+        if self.circuit_breaker is not None and \
+                not self.circuit_breaker.allow(message.receivers[0].name):
+            self.stats['rejected'] += 1
+            self.fail_soon(session_id, 'circuit open', message.receivers[0])
+            return
 
-        # Send request message now
+        if self.retry_policy is not None or self.circuit_breaker is not None:
+            self.attempts[session_id] = _Attempt(message)
+            self.start_attempt(session_id)
+
+        # Send request message now, useless after the session expiry
+        timeout = self.session_timeout(message.receivers)
+        if session_id in self.attempts and self.retry_policy is not None:
+            # Time for every attempt and the waits between them
+            limit = self.attempt_limit(message.receivers[0].name)
+            timeout = max(timeout, self.retry_policy.budget(
+                limit or self.SESSION_TIMEOUT))
+        self.set_deadline(message, timeout)
         self.agent.send(message)
+        if self.latency is not None:
+            self.sent_at[session_id] = (message.receivers[0].name,
+                                        clock(self.agent))
+
+        # The session expires after SESSION_TIMEOUT by default, or once
+        # every attempt of the retry policy had time to be answered
+        self.agent.call_later(timeout, self.delete_session, session_id)
+
+    def session_timeout(self, receivers) -> float:
+        """Expiry of a new session. With a RetryPolicy, adaptive
+        timeouts apply to each attempt instead."""
+
+        if self.latency is None or self.retry_policy is not None:
+            return self.SESSION_TIMEOUT
+        return self.latency.timeout(receivers, self.SESSION_TIMEOUT)
+
+    def fail_soon(self, session_id, reason, sender=None):
+        """Answer a request locally with a FAILURE"""
+
+        failure = ACLMessage(ACLMessage.FAILURE)
+        failure.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+        failure.set_conversation_id(session_id)
+        if sender is not None:
+            failure.set_sender(sender)
+        failure.set_content(reason)
+        self.agent.call_later(0, self.execute, failure)
+
+    def delete_session(self, session_id) -> None:
+        hedge = self.hedges.pop(session_id, None)
+        if hedge is not None:
+            if hedge.timer is not None and hedge.timer.active():
+                hedge.timer.cancel()
+            self.cancel_replicas(hedge)
+
+        self.sent_at.pop(session_id, None)
+        self.streams.discard(session_id)
+
+        attempt = self.attempts.pop(session_id, None)
+        if attempt is not None:
+            self.cancel_timer(attempt)
+            if not attempt.answered:
+                # Expired without answer
+                self.stats['timeouts'] += 1
+                self.record_failure(attempt.receiver)
+
+        super().delete_session(session_id)
+
+    def start_attempt(self, session_id):
+        policy = self.retry_policy
+        if policy is None:
+            return
+
+        attempt = self.attempts[session_id]
+        timeout = self.attempt_limit(attempt.receiver)
+        if timeout is not None:
+            attempt.timer = self.agent.call_later(
+                timeout, self.attempt_timeout, session_id, attempt.number)
+
+    def attempt_limit(self, receiver):
+        """Seconds an attempt waits for an answer, or None"""
+
+        timeout = self.retry_policy.timeout
+        if timeout is None and self.latency is not None and \
+                self.latency.estimate(receiver) is not None:
+            timeout = self.latency.timeout([receiver])
+        return timeout
+
+    def cancel_timer(self, attempt):
+        if attempt.timer is not None and attempt.timer.active():
+            attempt.timer.cancel()
+        attempt.timer = None
+
+    def attempt_timeout(self, session_id, number):
+        attempt = self.attempts.get(session_id)
+        if attempt is None or attempt.number != number or attempt.answered:
+            return
+
+        attempt.timer = None
+        self.stats['timeouts'] += 1
+        if not self.answered(session_id, TIMEOUT):
+            # Out of attempts: close the session as its expiry would
+            self.delete_session(session_id)
 
-        # The session expires in 1 minute by default
-        self.agent.call_later(60, self.delete_session, session_id)
+    def answered(self, session_id, performative) -> bool:
+        """Update circuit and retry state on an answer (or TIMEOUT).
+        Return True if the request is being sent again."""
+
+        attempt = self.attempts[session_id]
+        self.cancel_timer(attempt)
+
+        policy = self.retry_policy
+        failed = performative in (policy.retry_on if policy is not None
+                                  else (ACLMessage.FAILURE, TIMEOUT))
+        if not failed:
+            attempt.answered = True
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success(attempt.receiver)
+            return False
+
+        self.record_failure(attempt.receiver)
+        if policy is None or attempt.number >= policy.max_attempts or \
+                (self.circuit_breaker is not None and
+                 self.circuit_breaker.state(attempt.receiver) == CircuitBreaker.OPEN):
+            attempt.answered = True
+            return False
+
+        self.stats['retries'] += 1
+        self.agent.call_later(policy.delay(attempt.number),
+                              self.retry, session_id, attempt.number)
+        return True
+
+    def retry(self, session_id, number):
+        attempt = self.attempts.get(session_id)
+        if attempt is None or attempt.number != number:
+            return
+
+        attempt.number += 1
+        self.start_attempt(session_id)
+        self.agent.send(attempt.message)
+        if self.latency is not None:
+            self.sent_at[session_id] = (attempt.receiver, clock(self.agent))
+
+    def record_failure(self, receiver):
+        breaker = self.circuit_breaker
+        if breaker is not None and breaker.record_failure(receiver):
+            self.agent.call_later(breaker.reset_timeout,
+                                  breaker.half_open, receiver)
+
+    def report(self) -> dict:
+        """Retry counts and circuit states"""
+        report = {
+            'retries': self.stats['retries'],
+            'timeouts': self.stats['timeouts'],
+            'rejected': self.stats['rejected'],
+            'pending': len(self.attempts),
+        }
+        if self.circuit_breaker is not None:
+            report['circuits'] = self.circuit_breaker.report()
+        if self.latency is not None:
+            report['latency'] = self.latency.report()
+        report['streams'] = self.streams.report()
+        return report
 
 
 class FipaRequestProtocolParticipant(GenericFipaProtocol):
 
-    def __init__(self, agent):
+    # Cancelled requests remembered to drop their replies
+    CANCELLED = 4096
+
+    def __init__(self, agent, response_cache=None):
         super().__init__(agent)
         self.callback = None
+        self.stats = Counter()
+
+        # (initiator, conversation_id) of the requests cancelled,
+        # oldest first
+        self.cancelled = OrderedDict()
+
+        # Optional ResponseCache answering duplicated requests
+        self.response_cache = response_cache
+
+        # Optional ContentCache given with the request handler
+        self.content_cache = None
+
+        # Streamed INFORMs being sent. Their parts bypass the caches.
+        self.streams = ChunkSender(agent, agent.send)
 
     def execute(self, message: ACLMessage):
         """Called whenever the agent receives a message.
@@ -91,15 +486,115 @@ class FipaRequestProtocolParticipant(GenericFipaProtocol):
         if not message.protocol == ACLMessage.FIPA_REQUEST_PROTOCOL:
             return
 
+        # Flow control of streamed answers
+        if message.performative == ACLMessage.CONFIRM and is_stream(message):
+            self.streams.credit(message)
+            return
+        if message.performative == ACLMessage.CANCEL:
+            self.cancel(message)
+            return
+
         # Filter for performative
         if not message.performative == ACLMessage.REQUEST:
             return
 
-        self.callback(message)
+        if self.drop_expired(message) or self.is_cancelled(message):
+            return
+
+        if self.is_duplicate(message) or self.is_memoized(message):
+            return
 
-    def set_request_handler(self, callback: Callable[[ACLMessage], Any]):
-        """Add function to be called for request"""
+        with profiling.step(self.callback):
+            self.callback(message)
+
+    def cancel(self, message: ACLMessage):
+        """The initiator no longer waits for the answer to a request:
+        its replies, or the rest of its stream, are not sent"""
+
+        self.streams.cancel(message)
+        self.cancelled[message.sender.name, message.conversation_id] = None
+        if len(self.cancelled) > self.CANCELLED:
+            self.cancelled.popitem(last=False)
+        self.stats['cancelled'] += 1
+
+    def is_cancelled(self, message: ACLMessage) -> bool:
+        """Whether a request was cancelled, so that its handler can
+        stop working on it"""
+        return (message.sender.name, message.conversation_id) in self.cancelled
+
+    def is_duplicate(self, message) -> bool:
+        """Send again the replies to an already received request"""
+
+        if self.response_cache is None:
+            return False
+
+        replies = self.response_cache.lookup(message, clock(self.agent))
+        if replies is None:
+            return False
+
+        for reply in replies:
+            self.agent.send(reply)
+        return True
+
+    def is_memoized(self, message) -> bool:
+        """Answer a request from the content cache, or hold it until
+        the same request being handled is answered"""
+
+        if self.content_cache is None:
+            return False
+
+        now = clock(self.agent)
+        replies = self.content_cache.lookup(message, now)
+        if replies is None:
+            # Handled now: give up when the initiator stops waiting
+            if (message.sender.name, message.conversation_id) in \
+                    self.content_cache.leaders:
+                expiry = deadline(message)
+                timeout = self.content_cache.ttl if expiry is None else expiry - now
+                self.agent.call_later(max(timeout, 0), self.abandon, message)
+            return False
+
+        for reply in replies:
+            self.reply(ContentCache.build(message, *reply))
+        return True
+
+    def abandon(self, message: ACLMessage):
+        """Fail the requests waiting for a request left unanswered"""
+
+        for request in self.content_cache.abandon(message):
+            self.reply(ContentCache.build(
+                request, ACLMessage.FAILURE, 'timeout', None))
+
+    def reply(self, message: ACLMessage):
+        if self.cancelled and message.receivers and (
+                message.receivers[0].name, message.conversation_id) in self.cancelled:
+            self.stats['unsent'] += 1
+        else:
+            self.agent.send(message)
+        if self.response_cache is not None:
+            self.response_cache.record(message)
+
+        if self.content_cache is not None:
+            # Same answer to the requests waiting for this one
+            for request in self.content_cache.replied(message, clock(self.agent)):
+                self.reply(ContentCache.build(
+                    request, message.performative, message.content,
+                    message.encoding))
+
+    def report(self) -> dict:
+        return {
+            'expired': sum(self.dropped.values()),
+            'cancelled': self.stats['cancelled'],
+            'unsent': self.stats['unsent'],
+            'streams': self.streams.report(),
+        }
+
+    def set_request_handler(self, callback: Callable[[ACLMessage], Any],
+                            cache: ContentCache = None):
+        """Add function to be called for request, and optionally
+        a ContentCache of its replies"""
         self.callback = callback
+        self.content_cache = cache
 
     def send_inform(self, message: ACLMessage):
 
@@ -107,7 +602,7 @@ class FipaRequestProtocolParticipant(GenericFipaProtocol):
         message.set_performative(ACLMessage.INFORM)
 
         # Send message to all receivers
-        self.agent.send(message)
+        self.reply(message)
 
     def send_failure(self, message: ACLMessage):
 
@@ -115,7 +610,14 @@ class FipaRequestProtocolParticipant(GenericFipaProtocol):
         message.set_performative(ACLMessage.FAILURE)
 
         # Send message to all receivers
-        self.agent.send(message)
+        self.reply(message)
+
+    def send_stream(self, message: ACLMessage, chunks, window=8):
+        """Send an INFORM in parts taken from the iterable `chunks`,
+        with at most `window` parts not yet consumed by the initiator"""
+
+        message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+        self.streams.start(message, chunks, window)
 
     def send_agree(self, message: ACLMessage):
 
@@ -123,7 +625,7 @@ class FipaRequestProtocolParticipant(GenericFipaProtocol):
         message.set_performative(ACLMessage.AGREE)
 
         # Send message to all receivers
-        self.agent.send(message)
+        self.reply(message)
 
     def send_refuse(self, message: ACLMessage):
 
@@ -131,12 +633,12 @@ class FipaRequestProtocolParticipant(GenericFipaProtocol):
         message.set_performative(ACLMessage.REFUSE)
 
         # Send message to all receivers
-        self.agent.send(message)
+        self.reply(message)
 
 
-def FipaRequestProtocol(agent: Agent, is_initiator=True):
+def FipaRequestProtocol(agent: Agent, is_initiator=True, **kwargs):
 
     if is_initiator:
-        return FipaRequestProtocolInitiator(agent)
+        return FipaRequestProtocolInitiator(agent, **kwargs)
     else:
-        return FipaRequestProtocolParticipant(agent)
+        return FipaRequestProtocolParticipant(agent, **kwargs)
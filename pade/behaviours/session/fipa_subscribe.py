@@ -1,15 +1,39 @@
+from collections import Counter
+from copy import deepcopy
+from heapq import heappop, heappush
 from typing import Any, Callable
 
 from pade.acl.messages import ACLMessage
 from pade.core.agent import Agent
 
 from . import GenericFipaProtocol
-from . import AgentSession
+from . import AgentSession, Callbacks, clock
+from . import profiling
+from .delta import DELTA_ENCODING, make_delta, apply_delta
 from .exceptions import *
 
 
+def _subscriber(subscribe_message):
+    """Subscriber of a subscribe message, possibly forwarded by relays"""
+    if subscribe_message.reply_to:
+        return subscribe_message.reply_to[0]
+    return subscribe_message.sender
+
+
 class FipaSubscribeProtocolInitiator(GenericFipaProtocol):
 
+    def __init__(self, agent, renew_every=None):
+        super().__init__(agent)
+
+        # Last (version, content) received in each delta-encoded session
+        self.delta_state = {}
+
+        # Subscriptions are renewed every `renew_every` seconds
+        # to keep their lease on the publisher
+        self.renew_every = renew_every
+        self.renewals = {}
+        self.stats = Counter()
+
     def execute(self, message: ACLMessage):
         """Called whenever the agent receives a message.
         The message was NOT yet filtered in terms of:
@@ -25,6 +49,13 @@ class FipaSubscribeProtocolInitiator(GenericFipaProtocol):
         if session_id not in self.open_sessions:
             return
 
+        # Rebuild delta-encoded contents before resuming
+        if message.performative == ACLMessage.INFORM and \
+                message.encoding == DELTA_ENCODING:
+            if not self.decode_delta(message):
+                self.request_resync(message)
+                return
+
         # Resume generator
         generator = self.open_sessions[session_id]
         handlers = {
@@ -35,9 +66,10 @@ class FipaSubscribeProtocolInitiator(GenericFipaProtocol):
                 FipaFailureHandler, message)
         }
         try:
-            handlers[message.performative]()
-        except StopIteration:
-            pass
+            with profiling.step(generator):
+                handlers[message.performative]()
+        except StopIteration as stop:
+            AgentSession.finish(generator, stop.value)
         except KeyError:
             return
 
@@ -45,6 +77,61 @@ class FipaSubscribeProtocolInitiator(GenericFipaProtocol):
         if message.performative in (ACLMessage.REFUSE, ACLMessage.FAILURE):
             self.delete_session(session_id)
 
+    def decode_delta(self, message: ACLMessage) -> bool:
+        """Replace a delta-encoded content by the full content.
+        Returns False if the delta does not apply to the known version."""
+
+        session_id = message.conversation_id
+        kind, version, base_version, payload, encoding = message.content
+
+        if kind == 'full':
+            content = payload
+        else:
+            try:
+                known_version, known_content = self.delta_state[session_id]
+            except KeyError:
+                return False
+            if known_version != base_version:
+                return False
+            content = apply_delta(known_content, payload)
+
+        self.delta_state[session_id] = (version, content)
+        message.set_content(content)
+        message.set_encoding(encoding)
+        return True
+
+    def request_resync(self, message: ACLMessage):
+        """Ask the publisher for a full snapshot"""
+
+        self.delta_state.pop(message.conversation_id, None)
+
+        reply = message.create_reply()
+        reply.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
+        reply.set_performative(ACLMessage.NOT_UNDERSTOOD)
+        reply.set_content('resync')
+
+        self.agent.send(reply)
+
+    def delete_session(self, session_id):
+
+        self.delta_state.pop(session_id, None)
+        timer = self.renewals.pop(session_id, None)
+        if timer is not None and timer.active():
+            timer.cancel()
+        super().delete_session(session_id)
+
+    def renew(self, session_id, message: ACLMessage):
+        """Send the subscribe message again to extend its lease"""
+
+        if session_id not in self.open_sessions:
+            return
+
+        self.stats['renewals'] += 1
+        self.set_deadline(message, self.renew_every)
+        self.agent.send(message)
+        self.renewals[session_id] = self.agent.call_later(
+            self.renew_every, self.renew, session_id, message)
+
     def send_subscribe(self, message: ACLMessage):
 
         message.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
@@ -53,22 +140,62 @@ class FipaSubscribeProtocolInitiator(GenericFipaProtocol):
         response = yield AgentSession(self, message)
         return response
 
+    def subscribe(self, message: ACLMessage, on_inform=None, on_agree=None,
+                  on_refuse=None, on_failure=None):
+        """Subscribe with callbacks rather than a generator session"""
+
+        message.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
+        message.set_performative(ACLMessage.SUBSCRIBE)
+
+        self.register_session(message, Callbacks(
+            on_inform, on_agree, on_refuse, on_failure))
+
     def register_session(self, message, generator) -> None:
         """Register generator to receive response."""
         session_id = message.conversation_id
-        self.open_sessions[session_id] = generator
+        self.open_session(session_id, generator)
 
-        # Send message now
+        # Send message now. With renewals, it is useless once the
+        # next one is sent.
+        if self.renew_every is not None:
+            self.set_deadline(message, self.renew_every)
         self.agent.send(message)
 
+        if self.renew_every is not None:
+            self.renewals[session_id] = self.agent.call_later(
+                self.renew_every, self.renew, session_id, message)
+
 
 class FipaSubscribeProtocolParticipant(GenericFipaProtocol):
 
-    def __init__(self, agent):
+    def __init__(self, agent, delta_encoding=False, lease=None):
         super().__init__(agent)
         self.callback = None
         self._subscribers = set()
 
+        # Subscriptions not renewed within `lease` seconds are
+        # purged: (sender, conversation_id) -> [subscribe message,
+        # deadline], with a heap of possibly outdated deadlines
+        self.lease = lease
+        self._leases = {}
+        self._deadlines = []
+        self._purge_timer = None
+        self.stats = Counter()
+
+        # Relay mode: subscribers are handed to the child relays
+        # (FipaSubscribeRelay) with fewer subscribers
+        self.relays = []
+        self._routes = {}
+        self._relay_load = Counter()
+
+        # Delta mode: a copy of the last published content, its version
+        # and the version last sent to each subscriber
+        self.delta_encoding = delta_encoding
+        self._version = 0
+        self._last_content = None
+        self._last_encoding = None
+        self._sent_versions = {}
+
     def execute(self, message: ACLMessage):
         """Called whenever the agent receives a message.
         The message was NOT yet filtered in terms of:
@@ -79,33 +206,229 @@ class FipaSubscribeProtocolParticipant(GenericFipaProtocol):
         if not message.protocol == ACLMessage.FIPA_SUBSCRIBE_PROTOCOL:
             return
 
+        # Subscriber lost track of the delta versions
+        if message.performative == ACLMessage.NOT_UNDERSTOOD:
+            self.resync(message)
+            return
+
+        # Subscription ended by the subscriber, or by the publisher
+        # that handed it to this relay
+        if message.performative == ACLMessage.CANCEL:
+            self.cancel(message)
+            return
+
+        # Publisher's answer to a subscription handed to this relay
+        if message.performative in (ACLMessage.AGREE, ACLMessage.REFUSE) \
+                and message.reply_to:
+            self.pass_answer(message)
+            return
+
         # Filter for performative
         if not message.performative == ACLMessage.SUBSCRIBE:
             return
 
-        self.callback(message)
+        # Renewal superseded by a later one
+        if self.drop_expired(message):
+            return
+
+        # Renewal of a known subscription, served here or by a relay.
+        # Without leases, a repeated subscription is registered again.
+        key = (_subscriber(message).name, message.conversation_id)
+        lease = self._leases.get(key)
+        if lease is not None and self.lease is not None:
+            self.stats['renewals'] += 1
+            lease[1] = clock(self.agent) + self.lease
+            if key in self._routes:
+                self.forward(message, self._routes[key])
+            return
+
+        with profiling.step(self.callback):
+            self.callback(message)
 
     def subscribe(self, subscribe_message: ACLMessage):
         """Add new subscriber by registering its subscribe message"""
-        self._subscribers.add(subscribe_message)
+
+        key = (_subscriber(subscribe_message).name,
+               subscribe_message.conversation_id)
+
+        # Replaces an earlier registration of the same subscription
+        lease = self._leases.get(key)
+        if lease is not None:
+            self._subscribers.discard(lease[0])
+            self._sent_versions.pop(lease[0], None)
+
+        if key in self._routes:
+            # Registered again by the relay serving it
+            self.forward(subscribe_message, self._routes[key])
+        elif self.relays and subscribe_message.sender not in self.relays:
+            relay = min(self.relays, key=lambda aid: self._relay_load[aid.name])
+            self._relay_load[relay.name] += 1
+            self._routes[key] = relay
+            self.forward(subscribe_message, relay)
+        else:
+            self._subscribers.add(subscribe_message)
+
+        if self.lease is None:
+            self._leases[key] = [subscribe_message, None]
+            return
+
+        deadline = clock(self.agent) + self.lease
+        self._leases[key] = [subscribe_message, deadline]
+        heappush(self._deadlines, (deadline, key))
+        if self._purge_timer is None:
+            self._purge_timer = self.agent.call_later(self.lease, self.purge)
 
     def unsubscribe(self, aid):
         """Remove subscriber"""
         subscribe_message = next(
-            subscribe_message for subscribe_message in self._subscribers
-            if subscribe_message.sender == aid)
-        self._subscribers.remove(subscribe_message)
+            subscribe_message for subscribe_message, _ in self._leases.values()
+            if _subscriber(subscribe_message) == aid)
+        self._remove(subscribe_message)
+
+    def cancel(self, message: ACLMessage):
+        """Remove the subscription a CANCEL message refers to"""
+
+        lease = self._leases.get((_subscriber(message).name,
+                                  message.conversation_id))
+        if lease is not None:
+            self.stats['cancelled'] += 1
+            self._remove(lease[0])
+
+    def _remove(self, subscribe_message):
+        key = (_subscriber(subscribe_message).name,
+               subscribe_message.conversation_id)
+        self._subscribers.discard(subscribe_message)
+        self._sent_versions.pop(subscribe_message, None)
+        self._leases.pop(key, None)
+
+        # The relay serving it removes it too
+        relay = self._routes.pop(key, None)
+        if relay is not None:
+            self._relay_load[relay.name] -= 1
+            self.forward(subscribe_message, relay, ACLMessage.CANCEL)
+
+    def pass_answer(self, message: ACLMessage):
+        """Send the AGREE or REFUSE forwarded from upstream on to the
+        subscriber, or further down the tree"""
+
+        lease = self._leases.get((_subscriber(message).name,
+                                  message.conversation_id))
+        if lease is None:
+            return
+
+        reply = lease[0].create_reply()
+        reply.set_content(message.content)
+        if message.performative == ACLMessage.AGREE:
+            self.send_agree(reply)
+        else:
+            self.send_refuse(reply)
+
+    def add_relay(self, aid):
+        """Hand new subscribers to a relay subscribed to this agent"""
+        self.relays.append(aid)
+
+    def forward(self, subscribe_message: ACLMessage, relay,
+                performative=ACLMessage.SUBSCRIBE, answer=None):
+        """Pass a subscription (its CANCEL, or the `answer` given to
+        it) on to a relay, which answers the subscriber directly in the
+        same conversation"""
+
+        content = subscribe_message if answer is None else answer
+        forwarded = ACLMessage(performative)
+        forwarded.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
+        forwarded.set_conversation_id(subscribe_message.conversation_id)
+        forwarded.set_content(content.content)
+        forwarded.set_language(content.language)
+        forwarded.set_ontology(content.ontology)
+        if performative == ACLMessage.SUBSCRIBE and \
+                subscribe_message.reply_by is not None:
+            forwarded.set_reply_by(subscribe_message.reply_by)
+        # ACLMessage.add_reply_to does not work
+        forwarded.reply_to = [_subscriber(subscribe_message)]
+        forwarded.add_receiver(relay)
+
+        if performative == ACLMessage.SUBSCRIBE:
+            self.stats['forwarded'] += 1
+        self.agent.send(forwarded)
+
+    def purge(self):
+        """Remove in bulk the subscribers whose lease is over"""
+
+        self._purge_timer = None
+        now = clock(self.agent)
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, key = heappop(self._deadlines)
+            lease = self._leases.get(key)
+            if lease is None:
+                continue
+            if lease[1] <= now:
+                self._remove(lease[0])
+                self.stats['purged'] += 1
+            else:
+                # Renewed since, wait for its new deadline
+                heappush(self._deadlines, (lease[1], key))
+
+        if self._deadlines:
+            self._purge_timer = self.agent.call_later(
+                max(self._deadlines[0][0] - now, self.lease / 10), self.purge)
+
+    def report(self) -> dict:
+        return {
+            'subscribers': len(self._subscribers),
+            'routed': len(self._routes),
+            'forwarded': self.stats['forwarded'],
+            'renewals': self.stats['renewals'],
+            'purged': self.stats['purged'],
+            'cancelled': self.stats['cancelled'],
+            'expired': sum(self.dropped.values()),
+        }
+
+    def resync(self, message: ACLMessage):
+        """Send the last published content in full to a subscriber"""
+
+        if not self.delta_encoding or not self._version:
+            return
+
+        for subscribe_message in self._subscribers:
+            if subscribe_message.conversation_id == message.conversation_id and \
+                    _subscriber(subscribe_message) == message.sender:
+                break
+        else:
+            return
+
+        inform = self._create_inform(subscribe_message, ACLMessage.INFORM)
+        inform.set_content(('full', self._version, None,
+                            self._last_content, self._last_encoding))
+        inform.set_encoding(DELTA_ENCODING)
+        self._sent_versions[subscribe_message] = self._version
+
+        # Send message to subscriber
+        self.agent.send(inform)
 
     def set_subscribe_handler(self, callback: Callable[[ACLMessage], Any]):
         """Add function to be called on subscribe"""
         self.callback = callback
 
+    def _create_inform(self, subscribe_message, performative):
+
+        inform = subscribe_message.create_reply()
+        inform.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
+        inform.set_performative(performative)
+        return inform
+
     def send_inform(self, message: ACLMessage):
 
+        if self.delta_encoding:
+            self.send_delta_inform(message)
+            return
+
+        # Compress the content once for all subscribers
+        compression = getattr(self.agent, 'compression', None)
+        if compression is not None and self._subscribers:
+            message = compression.wrap(message)
+
         for subscribe_message in self._subscribers:
-            inform = subscribe_message.create_reply()
-            inform.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
-            inform.set_performative(ACLMessage.INFORM)
+            inform = self._create_inform(subscribe_message, ACLMessage.INFORM)
             inform.set_content(message.content)
             inform.set_language(message.language)
             inform.set_ontology(message.ontology)
@@ -114,12 +437,44 @@ class FipaSubscribeProtocolParticipant(GenericFipaProtocol):
             # Send message to subscriber
             self.agent.send(inform)
 
+    def send_delta_inform(self, message: ACLMessage):
+        """Send the difference to the previous content to subscribers
+        that are up to date, and the full content to the others"""
+
+        base_version = self._version
+        delta = make_delta(self._last_content, message.content) \
+            if base_version else None
+
+        self._version += 1
+        # The publisher may change the same object and publish it again
+        self._last_content = deepcopy(message.content)
+        self._last_encoding = message.encoding
+
+        full = ('full', self._version, None,
+                message.content, message.encoding)
+        if delta is not None:
+            partial = ('delta', self._version, base_version,
+                       delta, message.encoding)
+
+        for subscribe_message in self._subscribers:
+            inform = self._create_inform(subscribe_message, ACLMessage.INFORM)
+            if delta is not None and \
+                    self._sent_versions.get(subscribe_message) == base_version:
+                inform.set_content(partial)
+            else:
+                inform.set_content(full)
+            inform.set_language(message.language)
+            inform.set_ontology(message.ontology)
+            inform.set_encoding(DELTA_ENCODING)
+            self._sent_versions[subscribe_message] = self._version
+
+            # Send message to subscriber
+            self.agent.send(inform)
+
     def send_failure(self, message: ACLMessage):
 
         for subscribe_message in self._subscribers:
-            inform = subscribe_message.create_reply()
-            inform.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
-            inform.set_performative(ACLMessage.FAILURE)
+            inform = self._create_inform(subscribe_message, ACLMessage.FAILURE)
             inform.set_content(message.content)
             inform.set_language(message.language)
             inform.set_ontology(message.ontology)
@@ -128,8 +483,23 @@ class FipaSubscribeProtocolParticipant(GenericFipaProtocol):
             # Send message to subscriber
             self.agent.send(inform)
 
+    def _route(self, reply: ACLMessage):
+        """Relay serving the subscriber a reply goes to, if any"""
+        if not reply.receivers:
+            return None
+        return self._routes.get((reply.receivers[0].name,
+                                 reply.conversation_id))
+
     def send_agree(self, message: ACLMessage):
 
+        # Sent to the subscriber by the relay serving it
+        relay = self._route(message)
+        if relay is not None:
+            key = (message.receivers[0].name, message.conversation_id)
+            self.forward(self._leases[key][0], relay,
+                         ACLMessage.AGREE, message)
+            return
+
         message.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
         message.set_performative(ACLMessage.AGREE)
 
@@ -138,6 +508,17 @@ class FipaSubscribeProtocolParticipant(GenericFipaProtocol):
 
     def send_refuse(self, message: ACLMessage):
 
+        # Sent to the subscriber by the relay serving it, which then
+        # forgets the subscription
+        relay = self._route(message)
+        if relay is not None:
+            key = (message.receivers[0].name, message.conversation_id)
+            subscribe_message = self._leases[key][0]
+            self.forward(subscribe_message, relay,
+                         ACLMessage.REFUSE, message)
+            self._remove(subscribe_message)
+            return
+
         message.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
         message.set_performative(ACLMessage.REFUSE)
 
@@ -145,9 +526,11 @@ class FipaSubscribeProtocolParticipant(GenericFipaProtocol):
         self.agent.send(message)
 
 
-def FipaSubscribeProtocol(agent: Agent, is_initiator=True):
+def FipaSubscribeProtocol(agent: Agent, is_initiator=True, **kwargs):
 
     if is_initiator:
-        return FipaSubscribeProtocolInitiator(agent)
+        # Delta encoding is chosen by the publisher
+        kwargs.pop('delta_encoding', None)
+        return FipaSubscribeProtocolInitiator(agent, **kwargs)
     else:
-        return FipaSubscribeProtocolParticipant(agent)
+        return FipaSubscribeProtocolParticipant(agent, **kwargs)
@@ -0,0 +1,128 @@
+from collections import Counter
+from math import ceil, log
+
+# Latencies are counted from one microsecond
+MIN_LATENCY = 1e-6
+
+
+class QuantileSketch():
+    """Streaming quantiles of response times within `accuracy`
+    relative error.
+
+    Values are counted in logarithmic buckets. Every `window` values
+    the counts are halved, so that old values weigh less."""
+
+    def __init__(self, accuracy=0.02, window=1000):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = log(self.gamma)
+        self.window = window
+
+        # bucket index -> weight
+        self.buckets = Counter()
+        self.weight = 0.0
+        self.count = 0
+
+    def add(self, value):
+        index = ceil(log(max(value, MIN_LATENCY)) / self.log_gamma)
+        self.buckets[index] += 1
+        self.weight += 1
+        self.count += 1
+        if self.count % self.window == 0:
+            for index in self.buckets:
+                self.buckets[index] /= 2
+            self.weight /= 2
+
+    def quantile(self, q) -> float:
+        if not self.buckets:
+            return None
+
+        rank = q * self.weight
+        total = 0.0
+        for index in sorted(self.buckets):
+            total += self.buckets[index]
+            if total >= rank:
+                break
+        # Middle of the bucket, in relative terms
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+
+class LatencyEstimator():
+    """Response time of each receiver, as an EWMA and a quantile sketch,
+    and the timeouts derived from it.
+
+    A receiver's timeout is `factor` times the largest of its
+    `quantile` and its EWMA (quicker to follow a slowdown), clamped
+    to [min_timeout, max_timeout]. Until `min_samples` answers were
+    seen, `default` is used. One estimator can be shared by several
+    protocols of an agent."""
+
+    def __init__(self, quantile=0.99, factor=2.0, min_timeout=1.0,
+                 max_timeout=60.0, default=60.0, alpha=0.2, min_samples=10,
+                 accuracy=0.02, window=1000):
+        self.quantile = quantile
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.default = default
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.accuracy = accuracy
+        self.window = window
+
+        # receiver name -> EWMA, QuantileSketch
+        self.ewma = {}
+        self.sketches = {}
+        self.stats = Counter()
+
+    def observe(self, receiver, latency):
+        name = getattr(receiver, 'name', receiver)
+
+        sketch = self.sketches.get(name)
+        if sketch is None:
+            sketch = self.sketches[name] = QuantileSketch(
+                self.accuracy, self.window)
+        sketch.add(latency)
+
+        previous = self.ewma.get(name)
+        self.ewma[name] = latency if previous is None else \
+            previous + self.alpha * (latency - previous)
+
+    def estimate(self, receiver):
+        """Usual worst response time of a receiver, or None while
+        unknown"""
+
+        name = getattr(receiver, 'name', receiver)
+        sketch = self.sketches.get(name)
+        if sketch is None or sketch.count < self.min_samples:
+            return None
+        return max(sketch.quantile(self.quantile), self.ewma[name])
+
+    def timeout(self, receivers, default=None) -> float:
+        """Timeout of a session waiting for all receivers"""
+
+        estimates = [self.estimate(receiver) for receiver in receivers]
+        if None in estimates:
+            self.stats['default'] += 1
+            return self.default if default is None else default
+
+        self.stats['adaptive'] += 1
+        return self.clamp(max(estimates, default=0.0))
+
+    def clamp(self, estimate) -> float:
+        return min(max(self.factor * estimate, self.min_timeout),
+                   self.max_timeout)
+
+    def report(self) -> dict:
+        """Current estimates of each receiver"""
+        report = {}
+        for name, sketch in self.sketches.items():
+            estimate = self.estimate(name)
+            report[name] = {
+                'samples': sketch.count,
+                'ewma': self.ewma[name],
+                'p50': sketch.quantile(0.5),
+                'quantile': sketch.quantile(self.quantile),
+                'timeout': self.default if estimate is None
+                else self.clamp(estimate),
+            }
+        return report
@@ -0,0 +1,161 @@
+from collections import Counter, OrderedDict
+
+from pade.acl.messages import ACLMessage
+
+# Performatives ending a request
+FINAL = (ACLMessage.INFORM, ACLMessage.FAILURE, ACLMessage.REFUSE)
+
+
+def content_key(message):
+    return (message.content, message.ontology, message.language)
+
+
+class _Flight():
+    """Request being handled, with the requests waiting for its replies"""
+
+    __slots__ = ('key', 'started', 'waiters', 'replies', 'cacheable')
+
+    def __init__(self, key, started):
+        self.key = key
+        self.started = started
+        self.waiters = []
+        self.replies = []
+        self.cacheable = True
+
+
+class ContentCache():
+    """Replies of a request handler, reused for requests with the same
+    `key(message)` (content, ontology and language by default).
+
+    Only requests answered with an INFORM are cached, up to `max_size`
+    keys, for `ttl` seconds. Requests arriving while the handler works
+    on the same key wait for its replies instead of running it again.
+    A computation left without final reply when its request expires is
+    abandoned, and the requests waiting for it are answered with a
+    FAILURE."""
+
+    def __init__(self, key=content_key, max_size=1024, ttl=60.0):
+        self.key = key
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # key -> (time, [(performative, content, encoding)])
+        self.entries = OrderedDict()
+        # key -> _Flight
+        self.flights = {}
+        # (requester, conversation_id) -> _Flight
+        self.leaders = {}
+        self.stats = Counter()
+
+    def lookup(self, message, now):
+        """Cached replies for the message's key, the replies sent so
+        far if it joined a computation in flight, or None if the
+        handler must run"""
+
+        try:
+            key = self.key(message)
+            entry = self.entries.get(key)
+        except TypeError:
+            # Unhashable key
+            self.stats['uncacheable'] += 1
+            return None
+
+        if entry is not None:
+            if now - entry[0] <= self.ttl:
+                self.stats['hits'] += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+            del self.entries[key]
+            self.stats['expired'] += 1
+
+        flight = self.flights.get(key)
+        if flight is not None and now - flight.started <= self.ttl:
+            self.stats['joined'] += 1
+            flight.waiters.append(message)
+            return list(flight.replies)
+
+        self.stats['misses'] += 1
+        flight = self.flights[key] = _Flight(key, now)
+        self.leaders[message.sender.name, message.conversation_id] = flight
+        return None
+
+    def replied(self, reply, now):
+        """Account for a reply of the handler. Return the requests
+        waiting for it."""
+
+        try:
+            leader = (reply.receivers[0].name, reply.conversation_id)
+            flight = self.leaders[leader]
+        except (IndexError, KeyError):
+            return []
+
+        flight.replies.append(
+            (reply.performative, reply.content, reply.encoding))
+        waiters = list(flight.waiters)
+
+        if reply.performative in FINAL:
+            del self.leaders[leader]
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+            if reply.performative == ACLMessage.INFORM and flight.cacheable:
+                self.entries[flight.key] = (now, flight.replies)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.stats['evictions'] += 1
+
+        return waiters
+
+    def abandon(self, request):
+        """Forget the computation started by `request` if it is still
+        in flight. Return the requests waiting for it."""
+
+        flight = self.leaders.pop(
+            (request.sender.name, request.conversation_id), None)
+        if flight is None:
+            return []
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+        self.stats['abandoned'] += 1
+        return flight.waiters
+
+    @staticmethod
+    def build(request, performative, content, encoding):
+        """Reply to `request` with a cached answer"""
+        reply = request.create_reply()
+        reply.set_performative(performative)
+        reply.set_content(content)
+        if encoding is not None:
+            reply.set_encoding(encoding)
+        return reply
+
+    def invalidate(self, *keys):
+        """Drop cached replies. Replies computed at the moment are
+        still sent to the waiting requests, but not cached."""
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self.stats['invalidated'] += 1
+            if key in self.flights:
+                self.flights[key].cacheable = False
+
+    def invalidate_if(self, predicate):
+        """Drop the entries whose key satisfies predicate(key)"""
+        self.invalidate(*[key for key in [*self.entries, *self.flights]
+                          if predicate(key)])
+
+    def clear(self):
+        self.invalidate(*self.entries, *self.flights)
+
+    def report(self) -> dict:
+        lookups = self.stats['hits'] + self.stats['joined'] + self.stats['misses']
+        return {
+            'entries': len(self.entries),
+            'in_flight': len(self.flights),
+            'hits': self.stats['hits'],
+            'joined': self.stats['joined'],
+            'misses': self.stats['misses'],
+            'hit_rate': (self.stats['hits'] + self.stats['joined']) / lookups
+            if lookups else 0.0,
+            'evictions': self.stats['evictions'],
+            'invalidated': self.stats['invalidated'],
+            'abandoned': self.stats['abandoned'],
+        }
@@ -0,0 +1,123 @@
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from heapq import heappush, heappushpop
+from time import perf_counter
+
+from pade.misc.utility import display_message
+
+from . import audit
+
+# Active HandlerProfiler, if any
+profiler = None
+
+_disabled = nullcontext()
+
+
+def enable(threshold=0.1, top=20, on_slow=None):
+    """Start timing generator resumptions and protocol callbacks"""
+    global profiler
+    profiler = HandlerProfiler(threshold, top, on_slow)
+    return profiler
+
+
+def disable():
+    global profiler
+    profiler = None
+
+
+def step(target):
+    """Context timing one resumption of a generator or one callback"""
+    if audit.auditor is not None:
+        audit.auditor.resumed(target)
+    if profiler is None:
+        return _disabled
+    return _Step(profiler, target)
+
+
+def location(target):
+    """Qualified name and current line of a generator or function.
+
+    The line of a suspended generator is the yield it waits at, which
+    is the line it resumes from: the code timed by a step runs from
+    there to the next yield. The line of a function is its first one."""
+
+    name = getattr(target, '__qualname__', repr(target))
+    frame = getattr(target, 'gi_frame', None)
+    if frame is not None:
+        return name, frame.f_lineno
+
+    function = getattr(target, '__func__', target)
+    code = getattr(function, '__code__', None)
+    return name, code.co_firstlineno if code is not None else None
+
+
+class _Step():
+    __slots__ = ('profiler', 'target', 'line', 'start')
+
+    def __init__(self, profiler, target):
+        self.profiler = profiler
+        self.target = target
+
+    def __enter__(self):
+        self.line = location(self.target)[1]
+        self.start = perf_counter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.record(self.target, perf_counter() - self.start, self.line)
+
+
+class HandlerProfiler():
+    """Times handler steps, flags the ones slower than `threshold`
+    seconds and keeps the `top` slowest ones.
+
+    Steps are reported with the line they resumed from (see location),
+    not the statement that took the time."""
+
+    def __init__(self, threshold=0.1, top=20, on_slow=None):
+        self.threshold = threshold
+        self.top = top
+        self.on_slow = on_slow or self.display_slow
+
+        # Min-heap of (duration, seq, name, line)
+        self.slowest = []
+        self.seq = 0
+
+        # name -> [steps, total time, max time]
+        self.handlers = defaultdict(lambda: [0, 0.0, 0.0])
+        self.stats = Counter()
+
+    def record(self, target, duration, line):
+        name, _ = location(target)
+
+        handler = self.handlers[name]
+        handler[0] += 1
+        handler[1] += duration
+        handler[2] = max(handler[2], duration)
+        self.stats['steps'] += 1
+
+        self.seq += 1
+        entry = (duration, self.seq, name, line)
+        if len(self.slowest) < self.top:
+            heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heappushpop(self.slowest, entry)
+
+        if duration >= self.threshold:
+            self.stats['slow'] += 1
+            self.on_slow(name, line, duration)
+
+    @staticmethod
+    def display_slow(name, line, duration):
+        display_message('profiler',
+                        f'{name} (resumed from line {line}) blocked the reactor '
+                        f'for {1000 * duration:.1f} ms')
+
+    def report(self) -> list:
+        """Slowest steps first, as (duration, name, line)"""
+        return [(duration, name, line) for duration, _, name, line
+                in sorted(self.slowest, reverse=True)]
+
+    def summary(self) -> dict:
+        """Per-handler steps, total and maximum time"""
+        return {name: {'steps': steps, 'total': total, 'max': longest}
+                for name, (steps, total, longest) in self.handlers.items()}
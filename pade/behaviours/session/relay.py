@@ -0,0 +1,79 @@
+from collections import deque
+
+from pade.acl.messages import ACLMessage
+
+from . import AgentSession
+from .exceptions import *
+from .fipa_subscribe import FipaSubscribeProtocolInitiator
+from .fipa_subscribe import FipaSubscribeProtocolParticipant
+
+
+class FipaSubscribeRelay():
+    """Intermediate node of a Subscribe fan-out tree.
+
+    The relay subscribes to `upstream` (a publisher or another relay)
+    and publishes what it receives to the subscribers handed to it.
+    Subscribers still subscribe to the publisher with send_subscribe:
+    the publisher forwards their subscription down the tree, and the
+    relay answers them in their own conversation. The AGREE or REFUSE
+    of the publisher's subscribe handler, if it sends one, is passed
+    down to the relay, which sends it on before the INFORMs.
+    Unsubscribing at the publisher cancels the subscription down the
+    tree."""
+
+    def __init__(self, agent, upstream=None, renew_every=None, **kwargs):
+        self.agent = agent
+        self.upstream = upstream
+
+        self.initiator = FipaSubscribeProtocolInitiator(
+            agent, renew_every=renew_every)
+        self.participant = FipaSubscribeProtocolParticipant(agent, **kwargs)
+        # Subscribers handed over from upstream, or further down
+        self.participant.set_subscribe_handler(self.participant.subscribe)
+
+    @property
+    def aid(self):
+        return self.agent.aid
+
+    def start(self):
+        """Subscribe upstream"""
+        self.follow()
+
+    @AgentSession.session
+    def follow(self):
+        message = ACLMessage()
+        message.add_receiver(self.upstream)
+        while True:
+            try:
+                response = yield from self.initiator.send_subscribe(message)
+                self.participant.send_inform(response)
+            except FipaAgreeHandler:
+                pass
+            except FipaFailureHandler as h:
+                self.participant.send_failure(h.message)
+            except FipaProtocolComplete:
+                break
+
+
+def relay_tree(publisher: FipaSubscribeProtocolParticipant, relays, degree):
+    """Arrange relays in a tree of the given degree below publisher,
+    breadth first, and return its depth (1 without relays).
+
+    Relays must be started after the tree is built."""
+
+    depth = {id(publisher): 1}
+    parents = deque([publisher])
+    children = 0
+    for relay in relays:
+        if children == degree:
+            parents.popleft()
+            children = 0
+        parent = parents[0]
+
+        parent.add_relay(relay.aid)
+        relay.upstream = parent.agent.aid
+        depth[id(relay.participant)] = depth[id(parent)] + 1
+        parents.append(relay.participant)
+        children += 1
+
+    return max(depth.values())
@@ -0,0 +1,125 @@
+from collections import Counter, deque
+from pickle import dumps, loads
+
+from . import AgentSession
+
+
+class ReplicaGroup():
+    """Identical participants a request can be sent to.
+
+    A replica is chosen by least outstanding requests or by EWMA of
+    its response time (weighted by its outstanding requests). With
+    `hedge_after` seconds, or once the `hedge_quantile` of recent
+    response times is known, a duplicate request goes to a second
+    replica when the first one is slower than that."""
+
+    LEAST_OUTSTANDING = 'least-outstanding'
+    EWMA = 'ewma'
+
+    def __init__(self, replicas, strategy=LEAST_OUTSTANDING, alpha=0.2,
+                 hedge_after=None, hedge_quantile=None, window=100,
+                 min_samples=10):
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.alpha = alpha
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+
+        self.outstanding = Counter()
+        self.latency = {}
+        self.samples = deque(maxlen=window)
+        self.turn = 0
+        self.stats = Counter()
+
+    def choose(self, exclude=(), available=None):
+        """Best replica not in `exclude`, among those `available`
+        accepts, or None"""
+
+        candidates = [replica for replica in self.replicas
+                      if replica.name not in exclude and
+                      (available is None or available(replica.name))]
+        if not candidates:
+            return None
+
+        # Rotate the starting point so that ties are spread
+        self.turn += 1
+        start = self.turn % len(candidates)
+        candidates = candidates[start:] + candidates[:start]
+
+        if self.strategy == ReplicaGroup.EWMA:
+            return min(candidates, key=lambda replica:
+                       self.latency.get(replica.name, 0.0) *
+                       (1 + self.outstanding[replica.name]))
+        return min(candidates, key=lambda replica:
+                   self.outstanding[replica.name])
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None not to hedge"""
+
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if self.hedge_quantile is None or len(self.samples) < self.min_samples:
+            return None
+
+        samples = sorted(self.samples)
+        return samples[min(int(self.hedge_quantile * len(samples)),
+                           len(samples) - 1)]
+
+    def started(self, name):
+        self.outstanding[name] += 1
+
+    def finished(self, name, latency=None):
+        """Request to `name` is over, answered after `latency` seconds
+        or without usable answer"""
+
+        self.outstanding[name] -= 1
+        if latency is None:
+            return
+
+        self.samples.append(latency)
+        previous = self.latency.get(name)
+        self.latency[name] = latency if previous is None else \
+            previous + self.alpha * (latency - previous)
+
+    def report(self) -> dict:
+        return {
+            'requests': self.stats['requests'],
+            'hedged': self.stats['hedged'],
+            'hedge_wins': self.stats['hedge_wins'],
+            'cancelled': self.stats['cancelled'],
+            'outstanding': {name: count for name, count
+                            in self.outstanding.items() if count},
+            'latency': dict(self.latency),
+        }
+
+
+class ReplicaSession(AgentSession):
+    """Session of a request sent to a ReplicaGroup"""
+
+    def __init__(self, protocol, message, group: ReplicaGroup):
+        super().__init__(protocol, message)
+        self.group = group
+
+    def register(self, generator):
+        return self.protocol.register_group_session(
+            self.message, generator, self.group)
+
+
+class _Hedge():
+    """Replicas a request was sent to, and when"""
+
+    __slots__ = ('group', 'template', 'receivers', 'agreed', 'timer', 'hedged')
+
+    def __init__(self, group, template):
+        self.group = group
+        self.template = dumps(template)
+        self.receivers = {}
+        self.agreed = False
+        self.timer = None
+        self.hedged = None
+
+    def request(self, replica):
+        message = loads(self.template)
+        message.add_receiver(replica)
+        return message
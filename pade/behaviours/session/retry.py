@@ -0,0 +1,107 @@
+from collections import Counter
+from random import Random
+
+from pade.acl.messages import ACLMessage
+
+# Pseudo-performative for a request left without answer
+TIMEOUT = 'timeout'
+
+
+class RetryPolicy():
+    """How many times, and how long after, a request is sent again.
+
+    Attempt n waits `backoff * factor ** (n - 1)` seconds, capped at
+    `max_backoff` and shortened by up to `jitter` of itself. Only
+    answers whose performative is in `retry_on` are retried; with
+    TIMEOUT in `retry_on`, so is an attempt left `timeout` seconds
+    without answer."""
+
+    def __init__(self, max_attempts=3, backoff=1.0, factor=2.0,
+                 max_backoff=30.0, jitter=0.5, timeout=None,
+                 retry_on=(ACLMessage.FAILURE, TIMEOUT), seed=None):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.timeout = timeout
+        self.retry_on = frozenset(retry_on)
+        self.random = Random(seed)
+
+    def delay(self, attempt) -> float:
+        """Seconds to wait before sending attempt + 1"""
+        delay = min(self.max_backoff, self.backoff * self.factor ** (attempt - 1))
+        return delay * (1 - self.jitter * self.random.random())
+
+    def budget(self, attempt_timeout) -> float:
+        """Longest time all attempts may take, each one left at most
+        `attempt_timeout` seconds without answer"""
+        delays = sum(min(self.max_backoff, self.backoff * self.factor ** (n - 1))
+                     for n in range(1, self.max_attempts))
+        return self.max_attempts * attempt_timeout + delays
+
+
+class CircuitBreaker():
+    """Per-receiver circuit breaker.
+
+    After `failure_threshold` consecutive failures the receiver's
+    circuit opens and requests to it are rejected. `reset_timeout`
+    seconds later one trial request is let through (half-open): its
+    success closes the circuit, its failure opens it again."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.states = {}
+        self.failures = Counter()
+        self.trials = set()
+        self.stats = Counter()
+
+    def state(self, receiver) -> str:
+        return self.states.get(receiver, CircuitBreaker.CLOSED)
+
+    def allow(self, receiver) -> bool:
+        state = self.state(receiver)
+        if state == CircuitBreaker.CLOSED:
+            return True
+        if state == CircuitBreaker.HALF_OPEN and receiver not in self.trials:
+            self.trials.add(receiver)
+            return True
+        return False
+
+    def record_success(self, receiver):
+        self.trials.discard(receiver)
+        self.failures.pop(receiver, None)
+        if self.states.pop(receiver, CircuitBreaker.CLOSED) != CircuitBreaker.CLOSED:
+            self.stats['closed'] += 1
+
+    def record_failure(self, receiver) -> bool:
+        """Count a failure, return True if the circuit just opened"""
+
+        self.trials.discard(receiver)
+        self.failures[receiver] += 1
+        if self.state(receiver) == CircuitBreaker.OPEN:
+            return False
+        if self.state(receiver) == CircuitBreaker.HALF_OPEN or \
+                self.failures[receiver] >= self.failure_threshold:
+            self.states[receiver] = CircuitBreaker.OPEN
+            self.stats['opened'] += 1
+            return True
+        return False
+
+    def half_open(self, receiver):
+        if self.state(receiver) == CircuitBreaker.OPEN:
+            self.states[receiver] = CircuitBreaker.HALF_OPEN
+
+    def report(self) -> dict:
+        return {
+            'states': dict(self.states),
+            'failures': dict(self.failures),
+            'opened': self.stats['opened'],
+            'closed': self.stats['closed'],
+        }
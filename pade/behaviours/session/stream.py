@@ -0,0 +1,250 @@
+from collections import Counter
+from pickle import dumps, loads
+
+from pade.acl.messages import ACLMessage
+
+# Value of the ACL encoding field for the parts of a streamed INFORM
+# and for the credits granted by the receiver
+STREAM_ENCODING = 'pade-plus-stream'
+
+# Content kinds: (kind, sequence number, window, data)
+CHUNK = 'chunk'
+END = 'end'
+CREDIT = 'credit'
+
+
+def is_stream(message: ACLMessage) -> bool:
+    return message.encoding == STREAM_ENCODING
+
+
+class _Producer():
+    __slots__ = ('template', 'chunks', 'window', 'credit', 'sequence', 'timer')
+
+    def __init__(self, template, chunks, window):
+        self.template = dumps(template)
+        self.chunks = iter(chunks)
+        self.window = window
+        self.credit = window
+        self.sequence = 0
+        self.timer = None
+
+
+class ChunkSender():
+    """Streams of INFORM parts sent by a participant.
+
+    Parts are taken lazily from an iterable and sent while the
+    receiver has credit: at most `window` parts are in flight. A stream
+    left without credit for `stall_timeout` seconds is dropped."""
+
+    def __init__(self, agent, send, stall_timeout=60):
+        self.agent = agent
+        self.send = send
+        self.stall_timeout = stall_timeout
+
+        # (receiver name, conversation_id) -> _Producer
+        self.producers = {}
+        self.stats = Counter()
+
+    def start(self, message: ACLMessage, chunks, window):
+        """Stream the parts of `chunks` as answers shaped as `message`"""
+
+        key = (message.receivers[0].name, message.conversation_id)
+        self.producers[key] = _Producer(message, chunks, window)
+        self.stats['streams'] += 1
+        self.pump(key)
+
+    def pump(self, key):
+        producer = self.producers[key]
+        while producer.credit > 0:
+            try:
+                data = next(producer.chunks)
+            except StopIteration:
+                del self.producers[key]
+                self.send(self.part(producer, END, None))
+                return
+            except Exception as error:
+                del self.producers[key]
+                self.stats['failed'] += 1
+                failure = loads(producer.template)
+                failure.set_performative(ACLMessage.FAILURE)
+                failure.set_content(str(error))
+                self.send(failure)
+                return
+
+            self.send(self.part(producer, CHUNK, data))
+            producer.sequence += 1
+            producer.credit -= 1
+            self.stats['chunks'] += 1
+
+        # Out of credit: the receiver is behind
+        self.stats['blocked'] += 1
+        producer.timer = self.agent.call_later(
+            self.stall_timeout, self.stalled, key, producer.sequence)
+
+    @staticmethod
+    def part(producer, kind, data) -> ACLMessage:
+        message = loads(producer.template)
+        message.set_performative(ACLMessage.INFORM)
+        message.set_encoding(STREAM_ENCODING)
+        message.set_content((kind, producer.sequence, producer.window, data))
+        return message
+
+    def credit(self, message: ACLMessage):
+        """Resume a stream with the credit granted by its receiver"""
+
+        key = (message.sender.name, message.conversation_id)
+        producer = self.producers.get(key)
+        if producer is None:
+            return
+
+        producer.credit += message.content[3]
+        if producer.timer is not None and producer.timer.active():
+            producer.timer.cancel()
+        producer.timer = None
+        self.pump(key)
+
+    def cancel(self, message: ACLMessage):
+        key = (message.sender.name, message.conversation_id)
+        if self.producers.pop(key, None) is not None:
+            self.stats['cancelled'] += 1
+
+    def stalled(self, key, sequence):
+        producer = self.producers.get(key)
+        if producer is not None and producer.sequence == sequence and \
+                producer.credit == 0:
+            del self.producers[key]
+            self.stats['stalled'] += 1
+
+    def report(self) -> dict:
+        return {
+            'active': len(self.producers),
+            'streams': self.stats['streams'],
+            'chunks': self.stats['chunks'],
+            'blocked': self.stats['blocked'],
+            'stalled': self.stats['stalled'],
+            'cancelled': self.stats['cancelled'],
+            'failed': self.stats['failed'],
+        }
+
+
+class _Consumer():
+    __slots__ = ('incremental', 'expected', 'pending', 'parts', 'end',
+                 'window', 'consumed', 'last')
+
+    def __init__(self, incremental):
+        self.incremental = incremental
+        self.expected = 0
+        # Parts received ahead of order: sequence -> message
+        self.pending = {}
+        # Contents kept to rebuild the whole answer
+        self.parts = []
+        self.end = None
+        self.window = 1
+        # Parts taken since credit was last granted
+        self.consumed = 0
+        # Last message received, to answer the sender
+        self.last = None
+
+
+class ChunkReceiver():
+    """Streams of INFORM parts received by an initiator, put back in
+    order, with credit granted back as parts are consumed.
+
+    Incremental streams hand each part over as it comes, the others
+    are reassembled into the list of parts of the final INFORM."""
+
+    def __init__(self, agent):
+        self.agent = agent
+
+        # conversation_id -> sender name -> _Consumer
+        self.consumers = {}
+        # conversation_id of the sessions taking parts one by one
+        self.incremental = set()
+        self.stats = Counter()
+
+    def expect(self, session_id):
+        """Hand the parts of the session over one by one"""
+        self.incremental.add(session_id)
+
+    def receive(self, message: ACLMessage):
+        """Parts ready to be handed over, in order, and the final
+        INFORM once the stream is complete (else None)"""
+
+        senders = self.consumers.setdefault(message.conversation_id, {})
+        consumer = senders.get(message.sender.name)
+        if consumer is None:
+            consumer = senders[message.sender.name] = _Consumer(
+                message.conversation_id in self.incremental)
+
+        consumer.last = message
+        kind, sequence, consumer.window, _ = message.content
+        if kind == END:
+            consumer.end = message
+        else:
+            if sequence != consumer.expected:
+                self.stats['reordered'] += 1
+            consumer.pending[sequence] = message
+
+        ready = []
+        while consumer.expected in consumer.pending:
+            part = consumer.pending.pop(consumer.expected)
+            part.set_content(part.content[3])
+            part.set_encoding(None)
+            consumer.expected += 1
+            consumer.consumed += 1
+            self.stats['chunks'] += 1
+            if consumer.incremental:
+                ready.append(part)
+            else:
+                consumer.parts.append(part.content)
+
+        end = consumer.end
+        if end is None or end.content[1] != consumer.expected:
+            return ready, None
+
+        # Complete
+        del senders[message.sender.name]
+        if not senders:
+            del self.consumers[message.conversation_id]
+        end.set_content(None if consumer.incremental else consumer.parts)
+        end.set_encoding(None)
+        self.stats['streams'] += 1
+        return ready, end
+
+    def consumed(self, message: ACLMessage):
+        """Grant credit for the parts handed over, in batches of half
+        a window"""
+
+        consumer = self.consumers.get(message.conversation_id, {}).get(
+            message.sender.name)
+        if consumer is None or consumer.consumed < max(1, consumer.window // 2):
+            return
+
+        credit = message.create_reply()
+        credit.set_performative(ACLMessage.CONFIRM)
+        credit.set_encoding(STREAM_ENCODING)
+        credit.set_content((CREDIT, 0, 0, consumer.consumed))
+        consumer.consumed = 0
+        self.stats['credits'] += 1
+        self.agent.send(credit)
+
+    def discard(self, session_id):
+        """Forget the streams of a session, telling their senders
+        to stop"""
+
+        self.incremental.discard(session_id)
+        for consumer in self.consumers.pop(session_id, {}).values():
+            self.stats['cancelled'] += 1
+            cancel = consumer.last.create_reply()
+            cancel.set_performative(ACLMessage.CANCEL)
+            self.agent.send(cancel)
+
+    def report(self) -> dict:
+        return {
+            'active': sum(len(senders) for senders in self.consumers.values()),
+            'streams': self.stats['streams'],
+            'chunks': self.stats['chunks'],
+            'reordered': self.stats['reordered'],
+            'credits': self.stats['credits'],
+            'cancelled': self.stats['cancelled'],
+        }
@@ -1,7 +1,122 @@
-from pade.core.agent import Agent
+from collections import Counter
+
+from pade.acl.messages import ACLMessage
+from pade.behaviours.session import clock, is_expired
+from pade.core.agent import Agent, Agent_
+
+from .capture import INBOUND, OUTBOUND
+from .compression import is_compressed
+from .directory import TableSync
+from .messages import LazyACLMessage
+from .shared import SHARED_ENCODING, open_shared
+from .simulation import Simulation
+from .transport import ImprovedAgentFactory, encode_frame, one_per_address
 
 
 class ImprovedAgent(Agent):
+
+    # Performatives dropped once past their reply-by
+    EXPIRING = frozenset((ACLMessage.REQUEST, ACLMessage.CFP,
+                          ACLMessage.SUBSCRIBE))
+
+    def __init__(self, aid, debug=False, connection_pool=None,
+                 shared_payloads=None, compression=None, outbox=None,
+                 directory=None):
+        super().__init__(aid, debug)
+
+        # Optional ConnectionPool for persistent channels to peers
+        self.connection_pool = connection_pool
+
+        # Optional SharedPayloads handing large contents to agents
+        # on this host through shared memory
+        self.shared_payloads = shared_payloads
+
+        # Optional Compression of the large contents sent
+        self.compression = compression
+
+        # Optional Outbox logging the messages sent until answered
+        self.outbox = outbox
+
+        # Optional TrafficRecorder of sent and received messages
+        self.recorder = None
+
+        # Expired requests dropped before dispatch, by protocol
+        self.expired = Counter()
+
+        # Optional TableSync filling the agents table from the
+        # AgentDirectory `directory` instead of the AMS
+        self.table_sync = None
+        if directory is not None:
+            self.table_sync = TableSync(self, directory)
+
+        # Virtual-time runtime replacing reactor and transport
+        self.simulation = None
+        if Simulation.active is not None:
+            Simulation.active.add(self)
+
+    def update_ams(self, ams, subscribe=True):
+        if subscribe and self.table_sync is None:
+            super().update_ams(ams)
+        else:
+            # Agents table filled in process, as by a LocalAMS
+            Agent_.update_ams(self, ams)
+
+        # Accept framed channels from pooled peers
+        self.agentInstance = ImprovedAgentFactory(agent_ref=self)
+
+    def on_start(self):
+        # Messages left unanswered by a previous run
+        if self.outbox is not None:
+            self.outbox.replay(self)
+
+        if self.simulation is None:
+            return super().on_start()
+
+        # Same as PADE's on_start, on the simulated clock
+        for system_behaviour in self.system_behaviours:
+            system_behaviour.on_start()
+        self.call_later(2.0, self._launch_behaviours)
+
+    def _launch_behaviours(self):
+        for behaviour in self.behaviours:
+            behaviour.on_start()
+
+    def call_later(self, time, method, *args):
+        if self.simulation is not None:
+            return self.simulation.call_later(time, method, *args)
+        return super().call_later(time, method, *args)
+
+    def react(self, message):
+        """
+            Dispatch message to behaviours, copying it to the
+            sniffer only when one is registered in agents table.
+        """
+        if self.recorder is not None:
+            self.recorder.record(self, INBOUND, message)
+
+        # Nobody waits for the answer to an expired request
+        if message.performative in ImprovedAgent.EXPIRING and \
+                message.reply_by is not None and \
+                is_expired(message, clock(self)):
+            self.expired[message.protocol] += 1
+            return
+
+        if self.outbox is not None:
+            self.outbox.acknowledge(self, message)
+
+        if message.encoding == SHARED_ENCODING:
+            open_shared(self, message)
+        elif not isinstance(message, LazyACLMessage) and \
+                is_compressed(message.encoding):
+            # Decompressed on first access, as lazy messages are
+            message = LazyACLMessage.parsed(message)
+
+        sniffer = f"sniffer@{self.sniffer['name']}:{self.sniffer['port']}"
+        if sniffer in self.agentInstance.table:
+            super().react(message)
+        else:
+            Agent_.react(self, message)
+
     def send(self, message, tries=10, interval=2.0):
         """
             Send message once all receivers addresses are
@@ -10,11 +125,54 @@ class ImprovedAgent(Agent):
         if tries == 0:
             return
 
+        # Sent once written to the outbox log
+        if self.outbox is not None and self.outbox.holds(message):
+            self.outbox.append(self, message,
+                               lambda logged: self.send(logged, tries, interval))
+            return
+
         if hasattr(self, 'agentInstance') and \
                 all(receiver.localname == 'ams' or \
                     receiver.name in self.agentInstance.table \
                         for receiver in message.receivers):
-            super().send(message)
+            # Recorded once, as the application sent it
+            message.set_sender(self.aid)
+            message.set_message_id()
+            message.set_datetime_now()
+            if self.recorder is not None:
+                self.recorder.record(self, OUTBOUND, message)
+
+            if self.shared_payloads is not None:
+                message = self.shared_payloads.wrap(self, message)
+            if self.compression is not None:
+                message = self.compression.wrap(message)
+
+            if self.simulation is None:
+                super().send(message)
+            else:
+                self.simulation.transmit(self, message)
         else:
             self.call_later(interval, self.send,
                             message, tries-1, interval)
+
+    def _send(self, message, receivers):
+        """
+            Write message through the connection pool, except
+            for system messages, which PADE's runtime handles.
+        """
+        receivers = one_per_address(receivers, self.agentInstance.table)
+        if self.connection_pool is None or message.system_message:
+            return super()._send(message, receivers)
+
+        frame = None
+        for receiver in receivers:
+            if receiver.localname == 'ams' or receiver.name == self.aid.name:
+                super()._send(message, [receiver])
+                continue
+
+            peer = self.agentInstance.table.get(receiver.name)
+            if peer is None:
+                continue
+            if frame is None:
+                frame = encode_frame(message)
+            self.connection_pool.send(peer.host, peer.port, frame)
@@ -0,0 +1,211 @@
+from collections import defaultdict, deque, namedtuple
+from struct import Struct
+from time import perf_counter, time
+
+from twisted.internet import reactor
+
+from pade.acl.aid import AID
+from pade.behaviours.session import clock, deadline
+
+from .local import LocalAMS
+from .messages import dump_message, load_message
+
+# First bytes of a capture file
+MAGIC = b'PADECAP1'
+
+# Timestamp, direction, agent name length and payload length
+RECORD = Struct('!dBHI')
+
+OUTBOUND = 0
+INBOUND = 1
+
+Record = namedtuple('Record', 'time direction agent message')
+
+
+class TrafficRecorder():
+    """Appends every message sent or received by the agents it is
+    attached to (agent.recorder) to a compact binary log"""
+
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def record(self, agent, direction, message):
+        name = agent.aid.name.encode()
+        payload = dump_message(message)
+        now = agent.simulation.now if agent.simulation is not None else time()
+
+        self.file.write(RECORD.pack(now, direction, len(name), len(payload)))
+        self.file.write(name)
+        self.file.write(payload)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_capture(path):
+    """Yield the records of a capture file in order"""
+
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a capture file')
+
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            timestamp, direction, name_size, size = RECORD.unpack(header)
+            name = file.read(name_size).decode()
+            payload = file.read(size)
+            if len(payload) < size:
+                # Truncated by a crash while writing
+                return
+            yield Record(timestamp, direction, name, load_message(payload))
+
+
+def _is_external_inbound(record, names):
+    """Inbound message sent by an agent that is not replayed"""
+    sender = record.message.sender
+    return record.direction == INBOUND and record.agent in names and \
+        sender is not None and sender.name not in names
+
+
+def _summary(count, duration, latencies) -> dict:
+    latencies = sorted(latencies)
+
+    def quantile(q):
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    return {
+        'messages': count,
+        'duration': duration,
+        'throughput': count / duration if duration else 0.0,
+        'replies': len(latencies),
+        'latency_mean': sum(latencies) / len(latencies) if latencies else 0.0,
+        'latency_p50': quantile(0.5) if latencies else 0.0,
+        'latency_p99': quantile(0.99) if latencies else 0.0,
+    }
+
+
+class _ResponseTimes():
+    """Pairs each inbound message with the first message the agent
+    sends back in the same conversation"""
+
+    def __init__(self):
+        self.pending = defaultdict(deque)
+        self.latencies = []
+
+    def inbound(self, agent, conversation_id, now):
+        self.pending[agent, conversation_id].append(now)
+
+    def outbound(self, agent, conversation_id, now):
+        try:
+            received = self.pending[agent, conversation_id].popleft()
+        except IndexError:
+            return
+        self.latencies.append(now - received)
+
+
+def _rebase_deadline(record, now):
+    """Move the reply-by of a captured message to the replay clock,
+    keeping the time it left to answer when it was captured"""
+
+    expiry = deadline(record.message)
+    if expiry is not None:
+        record.message.reply_by = str(now + expiry - record.time)
+
+
+class TrafficReplayer():
+    """Feeds the inbound traffic of a capture back into agents with
+    the same names, at the captured pace times `speed` (None for as
+    fast as possible), and compares throughput and response times
+    with the original run.
+
+    Messages between replayed agents are regenerated by the agents
+    themselves. Agents run offline, registered by a LocalAMS.
+    Deadlines (reply-by) are shifted to the time of the replay."""
+
+    def __init__(self, path):
+        self.records = list(read_capture(path))
+
+    def original(self, names) -> dict:
+        """Throughput and response times of the captured agents"""
+
+        times = _ResponseTimes()
+        inbound = []
+        for record in self.records:
+            if _is_external_inbound(record, names):
+                inbound.append(record.time)
+                times.inbound(record.agent, record.message.conversation_id,
+                              record.time)
+            elif record.direction == OUTBOUND and record.agent in names:
+                times.outbound(record.agent, record.message.conversation_id,
+                               record.time)
+
+        duration = inbound[-1] - inbound[0] if inbound else 0.0
+        return _summary(len(inbound), duration, times.latencies)
+
+    def replay(self, agents, speed=1.0, settle=1.0, batch=100) -> dict:
+        """Run the reactor until the capture was fed and `settle`
+        seconds passed, then return the original and replayed stats"""
+
+        names = {agent.aid.name: agent for agent in agents}
+        inbound = [record for record in self.records
+                   if _is_external_inbound(record, names)]
+
+        local_ams = LocalAMS()
+        local_ams.register(agents)
+        for record in inbound:
+            if record.message.sender.name not in local_ams.table:
+                local_ams.add_peer(AID(record.message.sender.name))
+
+        times = _ResponseTimes()
+        replayed = []
+
+        class Observer():
+            def record(self, agent, direction, message):
+                if direction == OUTBOUND:
+                    times.outbound(agent.aid.name, message.conversation_id,
+                                   perf_counter())
+
+        for agent in agents:
+            agent.recorder = Observer()
+
+        def inject(record):
+            now = perf_counter()
+            replayed.append(now)
+            times.inbound(record.agent, record.message.conversation_id, now)
+            agent = names[record.agent]
+            _rebase_deadline(record, clock(agent))
+            agent.react(record.message)
+
+        def inject_batch(position):
+            for record in inbound[position:position + batch]:
+                inject(record)
+            if position + batch < len(inbound):
+                reactor.callLater(0, inject_batch, position + batch)
+            else:
+                reactor.callLater(settle, reactor.stop)
+
+        if not inbound:
+            reactor.callLater(settle, reactor.stop)
+        elif speed is None:
+            reactor.callLater(0, inject_batch, 0)
+        else:
+            start = inbound[0].time
+            for record in inbound:
+                reactor.callLater((record.time - start) / speed, inject, record)
+            reactor.callLater((inbound[-1].time - start) / speed + settle,
+                              reactor.stop)
+
+        reactor.run()
+
+        duration = replayed[-1] - replayed[0] if replayed else 0.0
+        return {
+            'original': self.original(names),
+            'replay': _summary(len(replayed), duration, times.latencies),
+        }
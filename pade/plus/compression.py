@@ -0,0 +1,155 @@
+import lzma
+import zlib
+from collections import Counter
+from pickle import dumps, loads
+from time import process_time
+
+# Prefix of the ACL encoding field of the contents handled by the
+# runtime (deltas, streams, shared memory), which are never compressed.
+# Compressed contents use it followed by the codec and the original
+# encoding if any: 'pade-plus-zlib', 'pade-plus-zlib/json'
+RUNTIME_PREFIX = 'pade-plus-'
+
+CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+# Decompressions done on received messages
+inflated = Counter()
+
+
+def _split(encoding):
+    """(codec, original encoding) of a compressed encoding field,
+    else None"""
+
+    if not encoding or not encoding.startswith(RUNTIME_PREFIX):
+        return None
+    codec, _, original = encoding[len(RUNTIME_PREFIX):].partition('/')
+    if codec not in CODECS:
+        return None
+    return codec, original or None
+
+
+def is_compressed(encoding) -> bool:
+    return _split(encoding) is not None
+
+
+def original_encoding(encoding):
+    """Encoding of the content before compression"""
+    split = _split(encoding)
+    return encoding if split is None else split[1]
+
+
+def inflate(message):
+    """Restore in place the content and encoding of a compressed message"""
+
+    codec, encoding = _split(message.encoding)
+    kind, data = message.content
+
+    start = process_time()
+    data = CODECS[codec][1](data)
+    if kind == 'str':
+        content = data.decode()
+    elif kind == 'pickle':
+        content = loads(data)
+    else:
+        content = data
+    inflated['cpu_time'] += process_time() - start
+    inflated['messages'] += 1
+
+    message.set_content(content)
+    message.set_encoding(encoding)
+
+
+class Compression():
+    """Contents of at least `threshold` bytes are compressed with
+    `codec` ('zlib' or 'lzma') before being sent, unless they shrink
+    by less than `min_saving`.
+
+    The encoding field marks them so that receivers decompress the
+    content the first time it is accessed."""
+
+    def __init__(self, threshold=16 << 10, codec='zlib', level=None,
+                 min_saving=0.1):
+        if codec not in CODECS:
+            raise ValueError(f'Unknown codec: {codec}')
+        self.threshold = threshold
+        self.codec = codec
+        self.level = level
+        self.min_saving = min_saving
+        self.stats = Counter()
+
+    def compress(self, content):
+        """(kind, compressed data) of a content, or None if it should
+        be sent as is"""
+
+        if isinstance(content, str):
+            kind, data = 'str', content.encode()
+        elif isinstance(content, bytes):
+            kind, data = 'bytes', content
+        elif content is None or isinstance(content, (int, float, bool)):
+            return None
+        else:
+            kind, data = 'pickle', dumps(content)
+
+        if len(data) < self.threshold:
+            return None
+
+        start = process_time()
+        compress = CODECS[self.codec][0]
+        if self.level is None:
+            compressed = compress(data)
+        elif self.codec == 'lzma':
+            compressed = compress(data, preset=self.level)
+        else:
+            compressed = compress(data, self.level)
+        self.stats['cpu_time'] += process_time() - start
+
+        if len(compressed) > (1 - self.min_saving) * len(data):
+            self.stats['incompressible'] += 1
+            return None
+
+        self.stats['compressed'] += 1
+        self.stats['bytes_in'] += len(data)
+        self.stats['bytes_out'] += len(compressed)
+        return kind, compressed
+
+    def wrap(self, message):
+        """The message to send: `message` itself, or a copy with its
+        content compressed"""
+
+        encoding = message.encoding
+        if encoding is not None and encoding.startswith(RUNTIME_PREFIX):
+            return message
+
+        content = message.content
+        compressed = self.compress(content)
+        if compressed is None:
+            return message
+
+        # Copy of the message without its content
+        message.content = None
+        try:
+            wrapped = loads(dumps(message))
+        finally:
+            message.content = content
+        wrapped.set_content(compressed)
+        if encoding is None:
+            wrapped.set_encoding(f'{RUNTIME_PREFIX}{self.codec}')
+        else:
+            wrapped.set_encoding(f'{RUNTIME_PREFIX}{self.codec}/{encoding}')
+        return wrapped
+
+    def report(self) -> dict:
+        bytes_in = self.stats['bytes_in']
+        return {
+            'compressed': self.stats['compressed'],
+            'incompressible': self.stats['incompressible'],
+            'bytes_in': bytes_in,
+            'bytes_out': self.stats['bytes_out'],
+            'ratio': self.stats['bytes_out'] / bytes_in if bytes_in else None,
+            'cpu_time': self.stats['cpu_time'],
+            'inflated': inflated['messages'],
+            'inflate_cpu_time': inflated['cpu_time'],
+        }
@@ -0,0 +1,222 @@
+from collections import deque
+
+from pade.acl.messages import ACLMessage
+from pade.behaviours.session.fipa_subscribe import (
+    FipaSubscribeProtocolInitiator, FipaSubscribeProtocolParticipant,
+    _subscriber)
+
+# Value of the ACL encoding field for agents table updates
+TABLE_ENCODING = 'pade-plus-table'
+
+# Update kinds: (EVENTS, base version, [(version, op, name, aid)])
+# and (SNAPSHOT, version, {name: aid})
+EVENTS = 'events'
+SNAPSHOT = 'snapshot'
+
+ADD = 'add'
+REMOVE = 'remove'
+
+
+class TableLog():
+    """Agents table with the versioned log of its last `history`
+    changes"""
+
+    def __init__(self, history=4096):
+        self.table = {}
+        self.version = 0
+        # (version, op, name, aid), oldest first
+        self.events = deque(maxlen=history)
+
+    def add(self, aid):
+        if self.table.get(aid.name) == aid:
+            return
+        self.version += 1
+        self.table[aid.name] = aid
+        self.events.append((self.version, ADD, aid.name, aid))
+
+    def remove(self, name):
+        if self.table.pop(name, None) is None:
+            return
+        self.version += 1
+        self.events.append((self.version, REMOVE, name, None))
+
+    def since(self, version):
+        """Changes after `version`, or None if some were forgotten"""
+
+        if version == self.version:
+            return []
+        if not self.events or self.events[0][0] > version + 1:
+            return None
+        # Events are numbered without gaps
+        skip = version + 1 - self.events[0][0]
+        return [self.events[i] for i in range(skip, len(self.events))]
+
+
+class AgentDirectory(FipaSubscribeProtocolParticipant):
+    """Agents table published to the agents subscribed to it.
+
+    An agent joins by subscribing (TableSync.join) and gets the whole
+    table. Then, every `publish_every` seconds at most, all members get
+    the changes since the last publication only. A member that missed
+    some asks for the whole table again. Members leave with
+    unsubscribe(), or when their lease is over.
+
+    Members unknown to the host's agents table are added to it to be
+    answered, and removed when they leave."""
+
+    def __init__(self, agent, publish_every=0.1, history=4096, lease=None):
+        super().__init__(agent, lease=lease)
+        self.set_subscribe_handler(self.join)
+        self.publish_every = publish_every
+        self.log = TableLog(history)
+        self.published = 0
+        self.publish_timer = None
+        # Names added to the host's table by join()
+        self.added = set()
+
+    def join(self, message: ACLMessage):
+        member = _subscriber(message)
+        table = self.agent.agentInstance.table
+        if member.name not in table:
+            table[member.name] = member
+            self.added.add(member.name)
+        self.subscribe(message)
+        self.log.add(member)
+        self.send_agree(message.create_reply())
+        self.send_snapshot(message)
+        self.schedule_publish()
+
+    def _remove(self, subscribe_message):
+        super()._remove(subscribe_message)
+        name = _subscriber(subscribe_message).name
+        self.log.remove(name)
+        if name in self.added:
+            self.added.discard(name)
+            self.agent.agentInstance.table.pop(name, None)
+        self.schedule_publish()
+
+    def schedule_publish(self):
+        if self.publish_timer is None:
+            self.publish_timer = self.agent.call_later(
+                self.publish_every, self.publish)
+
+    def publish(self):
+        """Send the changes since the last publication to all members"""
+
+        self.publish_timer = None
+        events = self.log.since(self.published)
+        if not events:
+            return
+
+        message = ACLMessage()
+        message.set_content((EVENTS, self.published, events))
+        message.set_encoding(TABLE_ENCODING)
+        self.published = self.log.version
+        self.stats['publications'] += 1
+        self.stats['events'] += len(events)
+        self.send_inform(message)
+
+    def send_snapshot(self, subscribe_message: ACLMessage):
+        inform = self._create_inform(subscribe_message, ACLMessage.INFORM)
+        inform.set_content((SNAPSHOT, self.log.version, dict(self.log.table)))
+        inform.set_encoding(TABLE_ENCODING)
+        self.stats['snapshots'] += 1
+        self.agent.send(inform)
+
+    def resync(self, message: ACLMessage):
+        """Send the whole table to a member that missed changes"""
+
+        for subscribe_message in self._subscribers:
+            if subscribe_message.conversation_id == message.conversation_id \
+                    and _subscriber(subscribe_message) == message.sender:
+                self.send_snapshot(subscribe_message)
+                return
+
+    def report(self) -> dict:
+        report = super().report()
+        report.update({
+            'version': self.log.version,
+            'publications': self.stats['publications'],
+            'events': self.stats['events'],
+            'snapshots': self.stats['snapshots'],
+        })
+        return report
+
+
+class TableSync(FipaSubscribeProtocolInitiator):
+    """Keeps an agents table in step with an AgentDirectory, changing
+    only the entries that changed.
+
+    The table is the agent's own (agentInstance.table once joined),
+    with the AMS and the directory to begin with, instead of the one
+    a LocalAMS or a Simulation shares between agents. Given a
+    `directory`, the agent joins it when its behaviours start."""
+
+    def __init__(self, agent, directory=None, renew_every=None):
+        super().__init__(agent, renew_every=renew_every)
+        self.directory = directory
+        self.table = {}
+        self.version = 0
+        # Names learnt from the directory
+        self.names = set()
+
+    def on_start(self):
+        if self.directory is not None:
+            self.join(self.directory)
+
+    def join(self, directory_aid):
+        self.table['ams'] = self.agent.agentInstance.ams_aid
+        self.table[directory_aid.name] = directory_aid
+        self.agent.agentInstance.table = self.table
+
+        message = ACLMessage()
+        message.add_receiver(directory_aid)
+        self.subscribe(message, on_inform=self.on_update)
+
+    def on_update(self, message: ACLMessage):
+        if message.encoding != TABLE_ENCODING:
+            return
+        if not self.apply(message.content):
+            self.stats['gaps'] += 1
+            self.request_resync(message)
+
+    def apply(self, update) -> bool:
+        """Apply an update to the table. Returns False if changes
+        before it were missed."""
+
+        kind, version, payload = update
+
+        if kind == SNAPSHOT:
+            for name in self.names.difference(payload):
+                self.table.pop(name, None)
+            self.table.update(payload)
+            self.names = set(payload)
+            self.version = version
+            self.stats['snapshots'] += 1
+            return True
+
+        if version > self.version:
+            return False
+
+        for event_version, op, name, aid in payload:
+            # Already part of the snapshot received
+            if event_version <= self.version:
+                continue
+            if op == ADD:
+                self.table[name] = aid
+                self.names.add(name)
+            else:
+                self.table.pop(name, None)
+                self.names.discard(name)
+            self.version = event_version
+            self.stats['events'] += 1
+        return True
+
+    def report(self) -> dict:
+        return {
+            'version': self.version,
+            'agents': len(self.names),
+            'events': self.stats['events'],
+            'snapshots': self.stats['snapshots'],
+            'gaps': self.stats['gaps'],
+        }
@@ -0,0 +1,84 @@
+from twisted.internet import defer, reactor
+
+from .transport import HostFactory
+
+
+class LocalAMS():
+    """In-process stand-in for the AMS.
+
+    Agents are started as start_loop does, but learn each other's
+    addresses directly instead of subscribing to a running AMS: they
+    all share one agents table. Agents given the same port share one
+    listening socket."""
+
+    def __init__(self):
+        self.table = {}
+        self.agents = []
+
+        # port -> HostFactory of the agents listening on it
+        self.hosts = {}
+
+    def register(self, agents, listen=True, start=True):
+        """Start agents and share the agents table with them"""
+
+        for agent in agents:
+            agent.update_ams(agent.ams, subscribe=False)
+            self.table.setdefault('ams', agent.agentInstance.ams_aid)
+            agent.agentInstance.table = self.table
+            self.table[agent.aid.name] = agent.aid
+            self.agents.append(agent)
+            if listen:
+                self.listen(agent)
+            if start:
+                agent.on_start()
+
+    def listen(self, agent):
+        port = agent.aid.port
+        host = self.hosts.get(port)
+        if host is None:
+            host = self.hosts[port] = HostFactory(agent)
+            host.port = reactor.listenTCP(port, host)
+        host.agents[agent.aid.name] = agent
+        agent.ILP = host.port
+
+    def start(self, agents, batch=500, listen=True) -> defer.Deferred:
+        """Register agents `batch` at a time, one reactor iteration
+        each, so that the reactor keeps serving the agents already
+        started.
+
+        Returns a Deferred fired with the agents once all of them are
+        registered and listening, to start working without waiting
+        a fixed delay."""
+
+        agents = list(agents)
+        ready = defer.Deferred()
+
+        def register_batch(position):
+            self.register(agents[position:position + batch], listen)
+            if position + batch < len(agents):
+                reactor.callLater(0, register_batch, position + batch)
+            else:
+                ready.callback(agents)
+
+        reactor.callLater(0, register_batch, 0)
+        return ready
+
+    def add_peer(self, aid):
+        """Make an address known to agents without running it"""
+        self.table[aid.name] = aid
+
+    def report(self) -> dict:
+        return {
+            'agents': len(self.agents),
+            'sockets': len(self.hosts),
+            'messages': sum(host.stats['messages']
+                            for host in self.hosts.values()),
+            'copies': sum(host.stats['copies']
+                          for host in self.hosts.values()),
+        }
+
+
+def start_local_loop(agents):
+    """start_loop without AMS"""
+    LocalAMS().start(agents)
+    reactor.run()
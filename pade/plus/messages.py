@@ -0,0 +1,136 @@
+from pickle import dumps, loads
+from struct import Struct
+
+from pade.acl.aid import AID
+
+from .compression import inflate, is_compressed, original_encoding
+
+# Length of the routing headers at the beginning of a payload
+HEAD = Struct('!H')
+
+
+def dump_message(message) -> bytes:
+    """Serialize a message with its routing headers in front,
+    so that receivers can filter it without unpickling it all"""
+
+    head = dumps((
+        message.protocol,
+        message.conversation_id,
+        message.performative,
+        message.system_message,
+        message.sender.name if message.sender is not None else None,
+        message.reply_by,
+        message.encoding,
+    ))
+    return HEAD.pack(len(head)) + head + dumps(message)
+
+
+def load_message(payload):
+    """Build a lazy view of a payload created by dump_message"""
+
+    size, = HEAD.unpack_from(payload)
+    start = HEAD.size + size
+    return LazyACLMessage(loads(payload[HEAD.size:start]), payload[start:])
+
+
+class _Header():
+    """Routing header decoded with the payload, read from the
+    full message once it has been unpickled"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        if view._message is not None:
+            return getattr(view._message, self.name)
+        return view._headers[self.name]
+
+    def __set__(self, view, value):
+        setattr(view.message, self.name, value)
+
+
+class _Encoding(_Header):
+    """Encoding of the content, as it was before compression"""
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return original_encoding(super().__get__(view, owner))
+
+
+class LazyACLMessage():
+    """Received ACLMessage whose routing headers (protocol,
+    conversation_id, performative, sender, reply_by, encoding) are
+    available at once.
+    Any other field unpickles the whole message on first access,
+    and compressed contents are decompressed on first access."""
+
+    protocol = _Header('protocol')
+    conversation_id = _Header('conversation_id')
+    performative = _Header('performative')
+    system_message = _Header('system_message')
+    sender = _Header('sender')
+    reply_by = _Header('reply_by')
+    encoding = _Encoding('encoding')
+
+    def __init__(self, headers, body: bytes):
+        # Captures of older versions have no reply_by and encoding
+        protocol, conversation_id, performative, system_message, sender, \
+            *recent = headers
+        reply_by, encoding = recent if recent else (None, None)
+        self._headers = {
+            'protocol': protocol,
+            'conversation_id': conversation_id,
+            'performative': performative,
+            'system_message': system_message,
+            'sender': AID(sender) if sender is not None else None,
+            'reply_by': reply_by,
+            'encoding': encoding,
+        }
+        self._body = body
+        self._message = None
+
+    @classmethod
+    def parsed(cls, message):
+        """View of a message received already unpickled (by PADE's
+        transport), to decompress its content on first access"""
+        view = cls.__new__(cls)
+        view._headers = None
+        view._body = None
+        view._message = message
+        return view
+
+    @property
+    def message(self):
+        """The fully parsed ACLMessage"""
+        if self._message is None:
+            self._message = loads(self._body)
+        return self._message
+
+    @property
+    def content(self):
+        message = self.message
+        if is_compressed(message.encoding):
+            inflate(message)
+        return message.content
+
+    @content.setter
+    def content(self, value):
+        self.message.content = value
+
+    def __getattr__(self, name):
+        return getattr(self.message, name)
+
+    def __str__(self):
+        return str(self.message)
+
+    def __repr__(self):
+        return repr(self.message)
+
+    def __reduce_ex__(self, protocol):
+        if self._message is None:
+            # Unchanged message: forward the received bytes
+            return (loads, (self._body,))
+        return self._message.__reduce_ex__(protocol)
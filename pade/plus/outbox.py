@@ -0,0 +1,303 @@
+import os
+from collections import Counter
+from pickle import dumps, loads
+from struct import Struct
+from uuid import uuid4
+
+from pade.acl.messages import ACLMessage
+from pade.behaviours.session import clock, deadline
+
+# First bytes of an outbox log
+MAGIC = b'PADEOBX1'
+
+# Record kind, key length and payload length
+RECORD = Struct('!BHI')
+
+SENT = 0
+ACKNOWLEDGED = 1
+ABANDONED = 2
+
+# Performatives kept in the outbox until they are answered
+DURABLE = frozenset((ACLMessage.REQUEST, ACLMessage.CFP,
+                     ACLMessage.ACCEPT_PROPOSAL, ACLMessage.SUBSCRIBE))
+
+
+class _Entry():
+    __slots__ = ('payload', 'receivers', 'conversation_id', 'sent_at',
+                 'window', 'attempts')
+
+    def __init__(self, payload, receivers, conversation_id, sent_at, window):
+        self.payload = payload
+        self.receivers = receivers
+        self.conversation_id = conversation_id
+        self.sent_at = sent_at
+        # Seconds between sending and the reply_by, if known
+        self.window = window
+        self.attempts = 0 if sent_at is None else 1
+
+    def message(self, now):
+        """Copy of the message to send at `now`, with a deadline
+        as far as the first one was. A recovered message whose
+        window is lost is sent without deadline."""
+        message = loads(self.payload)
+        if message.reply_by is not None:
+            if self.window is None:
+                message.reply_by = None
+                message.find('reply-by').text = None
+            else:
+                message.set_reply_by(str(now + self.window))
+        return message
+
+
+def _read_log(path):
+    """Yield the (kind, key, payload) records of an outbox log"""
+
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not an outbox log')
+
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, key_size, size = RECORD.unpack(header)
+            key = file.read(key_size).decode()
+            payload = file.read(size)
+            if len(payload) < size:
+                # Truncated by a crash while writing
+                return
+            yield kind, key, payload
+
+
+def _record(kind, key, payload=b'') -> bytes:
+    key = key.encode()
+    return RECORD.pack(kind, len(key), len(payload)) + key + payload
+
+
+class Outbox():
+    """Append-only log of the messages an agent sends that expect an
+    answer (agent.outbox).
+
+    A message is written to the log before it is sent, and marked as
+    acknowledged once every receiver replied to it. Writes are grouped:
+    the messages submitted within `commit_interval` seconds (or
+    `max_batch` of them) share one write and, if `fsync`, one fsync,
+    and are sent once it returned.
+
+    Unanswered messages are sent again every `resend_after` seconds,
+    and after a restart by replay(). Their reply_with is kept, so that
+    participants with a ResponseCache answer the copies without
+    handling them again, and their reply_by is moved forward so that
+    they are not dropped as expired. A message still unanswered after
+    `max_attempts` sends is abandoned: it is removed from the log and
+    passed to `on_abandon`, if given."""
+
+    def __init__(self, path, commit_interval=0.005, max_batch=256,
+                 fsync=True, resend_after=30.0, max_attempts=10,
+                 on_abandon=None):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.resend_after = resend_after
+        self.max_attempts = max_attempts
+        self.on_abandon = on_abandon
+
+        # reply_with -> _Entry of the messages not yet acknowledged
+        self.entries = {}
+        # conversation_id -> number of entries, to filter replies
+        self.conversations = Counter()
+        # Records and messages to send after the next commit
+        self.batch = []
+        self.ready = []
+        self.commit_timer = None
+        self.resend_timer = None
+        self.stats = Counter()
+
+        self.recover()
+        self.file = open(path, 'ab')
+
+    def recover(self):
+        """Load the messages not acknowledged before the agent stopped,
+        and rewrite the log with them only"""
+
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'wb') as file:
+                file.write(MAGIC)
+            return
+
+        payloads = {}
+        for kind, key, payload in _read_log(self.path):
+            if kind == SENT:
+                payloads[key] = payload
+            else:
+                payloads.pop(key, None)
+
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(MAGIC)
+            for key, payload in payloads.items():
+                file.write(_record(SENT, key, payload))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+        for key, payload in payloads.items():
+            message = loads(payload)
+            self.track(key, payload, message, None)
+        self.stats['recovered'] = len(payloads)
+
+    def track(self, key, payload, message, now):
+        expiry = deadline(message)
+        window = None if expiry is None or now is None else expiry - now
+        self.entries[key] = _Entry(
+            payload, {receiver.name for receiver in message.receivers},
+            message.conversation_id, now, window)
+        self.conversations[message.conversation_id] += 1
+
+    def holds(self, message) -> bool:
+        """Whether `message` goes through the outbox before being sent"""
+        return message.performative in DURABLE and \
+            not message.system_message and message.reply_with not in self.entries
+
+    def append(self, agent, message, send):
+        """Log `message`, then call `send` with a copy of it once
+        the log is committed"""
+
+        if message.reply_with is None:
+            message.set_reply_with(f'{agent.aid.localname}-{uuid4().hex}')
+        key = message.reply_with
+
+        payload = dumps(message)
+        self.track(key, payload, message, clock(agent))
+        self.batch.append(_record(SENT, key, payload))
+        self.ready.append((send, payload))
+        self.stats['appended'] += 1
+
+        self.schedule_commit(agent)
+        if self.resend_timer is None and self.resend_after is not None:
+            self.resend_timer = agent.call_later(
+                self.resend_after, self.resend, agent)
+
+    def schedule_commit(self, agent):
+        if len(self.batch) >= self.max_batch:
+            self.commit()
+        elif self.commit_timer is None:
+            self.commit_timer = agent.call_later(
+                self.commit_interval, self.commit)
+
+    def commit(self):
+        """Write the pending records at once, then send their messages"""
+
+        if self.commit_timer is not None and self.commit_timer.active():
+            self.commit_timer.cancel()
+        self.commit_timer = None
+        if not self.batch:
+            return
+
+        self.file.write(b''.join(self.batch))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+            self.stats['fsyncs'] += 1
+        self.stats['commits'] += 1
+        self.batch = []
+
+        ready, self.ready = self.ready, []
+        for send, payload in ready:
+            send(loads(payload))
+
+    def acknowledge(self, agent, message):
+        """Mark a message as answered by the reply `message`"""
+
+        if message.conversation_id not in self.conversations:
+            return
+        entry = self.entries.get(message.in_reply_to)
+        if entry is None or message.sender is None:
+            return
+
+        entry.receivers.discard(message.sender.name)
+        if entry.receivers:
+            return
+
+        self.forget(message.in_reply_to, ACKNOWLEDGED)
+        self.stats['acknowledged'] += 1
+        self.schedule_commit(agent)
+
+    def forget(self, key, kind):
+        entry = self.entries.pop(key)
+        self.conversations[entry.conversation_id] -= 1
+        if not self.conversations[entry.conversation_id]:
+            del self.conversations[entry.conversation_id]
+        # Written with the next commit: a crash before only means
+        # the message is sent again
+        self.batch.append(_record(kind, key))
+        return entry
+
+    def resend(self, agent):
+        """Send again the messages left unanswered for `resend_after`
+        seconds"""
+
+        self.resend_timer = None
+        now = clock(agent)
+        for key, entry in list(self.entries.items()):
+            if entry.sent_at is None or \
+                    now - entry.sent_at < self.resend_after:
+                continue
+            if self.max_attempts is not None and \
+                    entry.attempts >= self.max_attempts:
+                self.abandon(key, now)
+                continue
+            entry.sent_at = now
+            entry.attempts += 1
+            self.stats['resent'] += 1
+            agent.send(entry.message(now))
+        self.commit()
+
+        if self.entries:
+            self.resend_timer = agent.call_later(
+                self.resend_after, self.resend, agent)
+
+    def replay(self, agent):
+        """Send the messages recovered from the log"""
+
+        now = clock(agent)
+        for entry in self.entries.values():
+            if entry.sent_at is None:
+                entry.sent_at = now
+                entry.attempts += 1
+                self.stats['replayed'] += 1
+                agent.send(entry.message(now))
+
+        if self.entries and self.resend_timer is None and \
+                self.resend_after is not None:
+            self.resend_timer = agent.call_later(
+                self.resend_after, self.resend, agent)
+
+    def abandon(self, key, now):
+        """Stop sending a message nobody answered"""
+        entry = self.forget(key, ABANDONED)
+        self.stats['abandoned'] += 1
+        if self.on_abandon is not None:
+            self.on_abandon(entry.message(now))
+
+    def close(self):
+        self.commit()
+        for timer in (self.commit_timer, self.resend_timer):
+            if timer is not None and timer.active():
+                timer.cancel()
+        self.resend_timer = None
+        self.file.close()
+
+    def report(self) -> dict:
+        return {
+            'pending': len(self.entries),
+            'appended': self.stats['appended'],
+            'commits': self.stats['commits'],
+            'fsyncs': self.stats['fsyncs'],
+            'acknowledged': self.stats['acknowledged'],
+            'resent': self.stats['resent'],
+            'recovered': self.stats['recovered'],
+            'replayed': self.stats['replayed'],
+            'abandoned': self.stats['abandoned'],
+        }
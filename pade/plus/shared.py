@@ -0,0 +1,209 @@
+from collections import Counter
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pickle import dumps, loads
+from time import monotonic
+
+# Value of the ACL encoding field for contents left in shared memory
+SHARED_ENCODING = 'pade-plus-shm'
+
+# Hosts of agents in this machine
+LOCAL_HOSTS = frozenset(('localhost', '127.0.0.1'))
+
+# Segments created by this process, unlinked by their SharedPayloads
+_created = set()
+
+
+def _attach(name) -> SharedMemory:
+    """Open a segment created by another agent, leaving its cleanup
+    to the creator"""
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 every process tracks the segments it opens
+        segment = SharedMemory(name)
+        if name not in _created:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+class SharedPayload():
+    """Content received through shared memory.
+
+    `view` is a memoryview of the segment, without copy. release(), or
+    the garbage collection of the payload, tells the sender it can free
+    the segment. A receiver without release flag (`index` None) leaves
+    it to be freed after the sender's ttl."""
+
+    def __init__(self, name, size, index, array):
+        self.segment = _attach(name)
+        self.index = index
+        self.size = size
+        self.array_info = array
+        # One release flag per receiver, then the payload
+        self.offset = _header_size(self.segment)
+        self.view = self.segment.buf[self.offset:self.offset + size]
+
+    def array(self):
+        """The payload as the NumPy array that was sent"""
+        import numpy
+        dtype, shape = self.array_info
+        return numpy.frombuffer(self.view, dtype=dtype).reshape(shape)
+
+    def tobytes(self) -> bytes:
+        return self.view.tobytes()
+
+    def release(self):
+        if self.segment is None:
+            return
+        try:
+            self.view.release()
+        except BufferError:
+            # Still exported, by an array for instance
+            return
+        if self.index is not None:
+            self.segment.buf[8 + self.index] = 1
+        self.segment.close()
+        self.segment = None
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+    def __repr__(self):
+        return f'SharedPayload({self.size} bytes)'
+
+
+def _header_size(segment) -> int:
+    """Length of the header: receivers count and release flags"""
+    return 8 + int.from_bytes(segment.buf[:8], 'little')
+
+
+class SharedPayloads():
+    """Contents of at least `threshold` bytes (bytes-like objects and
+    NumPy arrays) sent to agents on this host are written once to a
+    shared memory segment, and the message carries its name instead.
+
+    Each receiver flags its release in the segment header. The sender
+    checks the flags every `interval` seconds and unlinks a segment
+    once all its receivers released it, or after `ttl` seconds."""
+
+    def __init__(self, threshold=1 << 20, ttl=60.0, interval=1.0):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.interval = interval
+
+        # name -> (SharedMemory, receivers count, time created)
+        self.segments = {}
+        self.timer = None
+        self.stats = Counter()
+
+    def wrap(self, agent, message):
+        """The message to send: `message` itself, or a copy whose
+        content is in shared memory"""
+
+        content = message.content
+        array = None
+        if hasattr(content, '__array_interface__'):
+            array = (content.dtype.str, content.shape)
+        elif not isinstance(content, (bytes, bytearray, memoryview)):
+            return message
+
+        try:
+            view = memoryview(content).cast('B')
+        except (TypeError, ValueError):
+            # Not contiguous
+            return message
+        if view.nbytes < self.threshold or \
+                not all(self.is_local(agent, receiver)
+                        for receiver in message.receivers):
+            return message
+
+        receivers = len(message.receivers)
+        segment = SharedMemory(create=True, size=8 + receivers + view.nbytes)
+        segment.buf[:8] = receivers.to_bytes(8, 'little')
+        segment.buf[8:8 + receivers] = bytes(receivers)
+        segment.buf[8 + receivers:8 + receivers + view.nbytes] = view
+        self.segments[segment.name] = (segment, receivers, monotonic())
+        _created.add(segment.name)
+        self.stats['shared'] += 1
+        self.stats['bytes'] += view.nbytes
+        if self.timer is None:
+            self.timer = agent.call_later(self.interval, self.check, agent)
+
+        # Copy of the message without its content
+        message.content = None
+        try:
+            shared = loads(dumps(message))
+        finally:
+            message.content = content
+        shared.set_content((segment.name, view.nbytes,
+                            [receiver.name for receiver in message.receivers],
+                            array))
+        shared.set_encoding(SHARED_ENCODING)
+        return shared
+
+    @staticmethod
+    def is_local(agent, receiver) -> bool:
+        host = receiver.host
+        return host == agent.aid.host or \
+            host in LOCAL_HOSTS and agent.aid.host in LOCAL_HOSTS
+
+    def sweep(self, force=False):
+        """Free the segments released by all receivers or too old"""
+
+        now = monotonic()
+        for name, (segment, receivers, created) in list(self.segments.items()):
+            released = all(segment.buf[8:8 + receivers])
+            if released or force or now - created > self.ttl:
+                del self.segments[name]
+                _created.discard(name)
+                self.stats['released' if released else 'expired'] += 1
+                segment.close()
+                segment.unlink()
+
+    def check(self, agent):
+        self.timer = None
+        self.sweep()
+        if self.segments:
+            self.timer = agent.call_later(self.interval, self.check, agent)
+
+    def close(self):
+        """Free all segments"""
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        self.sweep(force=True)
+
+    def report(self) -> dict:
+        return {
+            'segments': len(self.segments),
+            'shared': self.stats['shared'],
+            'bytes': self.stats['bytes'],
+            'released': self.stats['released'],
+            'expired': self.stats['expired'],
+        }
+
+
+def open_shared(agent, message):
+    """Replace the content of a message received through shared
+    memory by a SharedPayload"""
+
+    name, size, receivers, array = message.content
+    if agent.aid.name in receivers:
+        index = receivers.index(agent.aid.name)
+    elif len(receivers) == 1:
+        # Addressed under another name, as PADE allows
+        index = 0
+    else:
+        index = None
+    message.set_content(SharedPayload(name, size, index, array))
+    message.set_encoding(None)
@@ -0,0 +1,199 @@
+from collections import Counter
+from heapq import heappop, heappush
+from random import Random
+from time import perf_counter
+
+from twisted.python import log
+
+from .messages import dump_message, load_message
+
+
+class ConstantLatency():
+    """Every message takes the same time to be delivered"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def __call__(self, sender, receiver, message):
+        return self.delay
+
+
+class UniformLatency():
+    """Delivery time uniformly distributed in [low, high]"""
+
+    def __init__(self, low, high, seed=None):
+        self.low = low
+        self.high = high
+        self.random = Random(seed)
+
+    def __call__(self, sender, receiver, message):
+        return self.random.uniform(self.low, self.high)
+
+
+class ExponentialLatency():
+    """Fixed minimum delay plus an exponentially distributed part"""
+
+    def __init__(self, mean, minimum=0.0, seed=None):
+        self.mean = mean
+        self.minimum = minimum
+        self.random = Random(seed)
+
+    def __call__(self, sender, receiver, message):
+        return self.minimum + self.random.expovariate(1 / self.mean)
+
+
+class SimulatedCall():
+    """Scheduled call on the virtual clock, with the same interface
+    as the reactor's DelayedCall"""
+
+    def __init__(self, simulation, time, method, args, kwargs):
+        self.simulation = simulation
+        self.time = time
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.called = False
+        self.seq = None
+
+    def getTime(self):
+        return self.time
+
+    def active(self):
+        return not (self.cancelled or self.called)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def reset(self, delay):
+        self.time = self.simulation.now + delay
+        self.simulation.schedule(self)
+
+    def delay(self, delay):
+        self.time += delay
+        self.simulation.schedule(self)
+
+
+class Simulation():
+    """Discrete-event runtime for ImprovedAgents.
+
+    Timers and message deliveries are kept in a virtual-time event
+    queue and the clock jumps straight to the next event. Agents built
+    inside a `with simulation:` block (or passed to `add`) use it in
+    place of the reactor and TCP transport; they must schedule work
+    through `agent.call_later`.
+
+    `latency` is any callable (sender, receiver, message) -> seconds."""
+
+    # Simulation that takes the agents being created
+    active = None
+
+    def __init__(self, latency=None):
+        self.latency = latency or ConstantLatency()
+        self.now = 0.0
+        self.agents = {}
+        self.queue = []
+        self.seq = 0
+        self.started = False
+        self.wall_time = 0.0
+        self.stats = Counter()
+
+    def __enter__(self):
+        Simulation.active = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Simulation.active = None
+
+    def add(self, agent):
+        """Run agent in this simulation"""
+        agent.simulation = self
+        self.agents[agent.aid.name] = agent
+
+    def call_later(self, delay, method, *args, **kwargs) -> SimulatedCall:
+        call = SimulatedCall(self, self.now + delay, method, args, kwargs)
+        self.schedule(call)
+        return call
+
+    def schedule(self, call: SimulatedCall):
+        self.seq += 1
+        call.seq = self.seq
+        heappush(self.queue, (call.time, call.seq, call))
+
+    def transmit(self, sender, message):
+        """Deliver a message to its receivers after the modelled latency"""
+
+        payload = dump_message(message)
+        for receiver in message.receivers:
+            agent = self.agents.get(receiver.name)
+            if agent is None or agent is sender:
+                self.stats['undeliverable'] += 1
+                continue
+
+            self.stats['messages'] += 1
+            delay = self.latency(sender.aid, receiver, message)
+            self.call_later(delay, agent.react, load_message(payload))
+
+    def start(self):
+        """Equivalent of start_loop: every agent knows every other
+        agent and starts its behaviours at time zero"""
+
+        self.started = True
+        for agent in self.agents.values():
+            agent.update_ams(agent.ams, subscribe=False)
+
+        # One table for all agents instead of a copy each
+        table = {}
+        for name, agent in self.agents.items():
+            table.setdefault('ams', agent.agentInstance.ams_aid)
+            table[name] = agent.aid
+        for agent in self.agents.values():
+            agent.agentInstance.table = table
+
+        for agent in self.agents.values():
+            self.call_later(0, agent.on_start)
+
+    def run(self, until=None, max_events=None) -> dict:
+        """Process events in time order until the queue is empty,
+        the clock reaches `until` or `max_events` were processed"""
+
+        if not self.started:
+            self.start()
+
+        events = 0
+        start = perf_counter()
+        while self.queue:
+            time, seq, call = self.queue[0]
+            if until is not None and time > until:
+                break
+            if max_events is not None and events >= max_events:
+                break
+
+            heappop(self.queue)
+            if call.seq != seq or not call.active():
+                continue
+
+            self.now = time
+            call.called = True
+            events += 1
+            try:
+                call.method(*call.args, **call.kwargs)
+            except Exception:
+                log.err()
+
+        if until is not None and (not self.queue or self.queue[0][0] > until):
+            self.now = max(self.now, until)
+
+        self.wall_time += perf_counter() - start
+        self.stats['events'] += events
+        return self.report()
+
+    def report(self) -> dict:
+        return {
+            'simulated_seconds': self.now,
+            'wall_seconds': self.wall_time,
+            'events': self.stats['events'],
+            'messages': self.stats['messages'],
+            'undeliverable': self.stats['undeliverable'],
+            'speedup': self.now / self.wall_time if self.wall_time else 0.0,
+        }
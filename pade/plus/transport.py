@@ -0,0 +1,345 @@
+from collections import Counter, OrderedDict, defaultdict
+from pickle import dumps, loads
+from struct import Struct
+from time import perf_counter
+
+from twisted.internet import protocol, reactor
+
+from pade.core.agent import AgentFactory, AgentProtocol
+
+from .messages import dump_message, load_message
+
+# First bytes written on a persistent framed channel
+MAGIC = b'PADE+\x01'
+
+# Every frame is prefixed by the length of its payload
+HEADER = Struct('!I')
+
+# Length flag of frames whose payload is a sequence of frames
+BATCH = 1 << 31
+
+
+def encode_frame(message) -> bytes:
+    """Serialize a message into a length-prefixed frame"""
+    payload = dump_message(message)
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_batch(frames) -> bytes:
+    """Join several frames into a single multi-message frame"""
+    if len(frames) == 1:
+        return frames[0]
+    body = b''.join(frames)
+    return HEADER.pack(BATCH | len(body)) + body
+
+
+def split_frames(data):
+    """Split the complete frames in data into message payloads,
+    unpacking multi-message frames.
+
+    Returns the payloads and the length of data consumed."""
+
+    payloads = []
+    offset = 0
+    while len(data) - offset >= HEADER.size:
+        size, = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        end = start + (size & ~BATCH)
+        if len(data) < end:
+            break
+        offset = end
+        if size & BATCH:
+            payloads.extend(split_frames(data[start:end])[0])
+        else:
+            payloads.append(data[start:end])
+    return payloads, offset
+
+
+class ImprovedAgentProtocol(AgentProtocol):
+    """Receives both PADE's one-message-per-connection traffic
+    and persistent framed channels opened by pooled peers."""
+
+    def __init__(self, fact):
+        super().__init__(fact)
+        self.framed = None
+        self.buffer = b''
+
+    def dataReceived(self, data):
+
+        # Decide the kind of connection from its first bytes
+        if self.framed is None:
+            self.buffer += data
+            if len(self.buffer) < len(MAGIC):
+                return
+            data, self.buffer = self.buffer, b''
+            self.framed = data.startswith(MAGIC)
+            if self.framed:
+                data = data[len(MAGIC):]
+
+        if not self.framed:
+            AgentProtocol.dataReceived(self, data)
+            return
+
+        self.buffer += data
+        payloads, offset = split_frames(self.buffer)
+        self.buffer = self.buffer[offset:]
+        for payload in payloads:
+            self.fact.react(load_message(payload))
+
+
+class ImprovedAgentFactory(AgentFactory):
+
+    def buildProtocol(self, addr):
+        return ImprovedAgentProtocol(self)
+
+
+class HostFactory(ImprovedAgentFactory):
+    """Listening socket shared by the agents of this process that
+    have the same port. Messages are handed to the agents named in
+    their receivers.
+
+    A sender may write one copy of a message per local receiver: the
+    later copies are recognized by their message id and dropped."""
+
+    # Message ids remembered to drop copies
+    RECENT = 4096
+
+    def __init__(self, agent_ref):
+        super().__init__(agent_ref)
+        self.react = self.dispatch
+        self.agents = {}
+        self.recent = OrderedDict()
+        self.stats = Counter()
+
+    def dispatch(self, message):
+        local = [self.agents[receiver.name] for receiver in message.receivers
+                 if receiver.name in self.agents]
+        if not local:
+            if len(self.agents) != 1:
+                self.stats['unknown'] += 1
+                return
+            # Receiver named differently, as PADE allows
+            local = list(self.agents.values())
+
+        if len(local) > 1:
+            if message.messageID in self.recent:
+                self.stats['copies'] += 1
+                return
+            self.recent[message.messageID] = None
+            if len(self.recent) > HostFactory.RECENT:
+                self.recent.popitem(last=False)
+
+        # Each agent gets its own message, which its behaviours may change
+        copies = [message] + [loads(dumps(message)) for _ in local[1:]]
+        for agent, copy in zip(local, copies):
+            self.stats['messages'] += 1
+            agent.react(copy)
+
+
+def one_per_address(receivers, table):
+    """Receivers with distinct addresses: agents sharing a listening
+    socket need a single copy of a message"""
+
+    if len(receivers) < 2:
+        return receivers
+    addresses = {}
+    for receiver in receivers:
+        peer = table.get(receiver.name, receiver)
+        addresses.setdefault((peer.host, peer.port), receiver)
+    return list(addresses.values())
+
+
+class PeerChannel(protocol.Protocol):
+    """Persistent client connection that writes framed messages"""
+
+    def __init__(self, pool, address):
+        self.pool = pool
+        self.address = address
+        self.connected = False
+        self.idle_call = None
+        self.retries = 0
+
+        # Frames (and their enqueue time) waiting for the connection
+        self.pending = []
+
+    def connect(self):
+        host, port = self.address
+        reactor.connectTCP(host, port, _PeerChannelFactory(self))
+
+    def connectionMade(self):
+        self.connected = True
+        self.transport.setTcpNoDelay(True)
+        self.transport.write(MAGIC)
+
+        pending, self.pending = self.pending, []
+        for frame, enqueued in pending:
+            self.write(frame, enqueued)
+
+    def connectionLost(self, reason):
+        self.connected = False
+        if self.idle_call is not None and self.idle_call.active():
+            self.idle_call.cancel()
+        self.pool.channel_lost(self)
+
+    def connectionFailed(self, reason):
+        self.pool.channel_lost(self)
+
+    def write(self, frame, enqueued):
+        if not self.connected:
+            self.pending.append((frame, enqueued))
+            return
+
+        self.transport.write(frame)
+        self.pool.record_latency(perf_counter() - enqueued)
+
+        # Close the channel after some time without traffic
+        if self.idle_call is None or not self.idle_call.active():
+            self.idle_call = reactor.callLater(
+                self.pool.idle_timeout, self.transport.loseConnection)
+        else:
+            self.idle_call.reset(self.pool.idle_timeout)
+
+
+class _PeerChannelFactory(protocol.ClientFactory):
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def buildProtocol(self, addr):
+        return self.channel
+
+    def clientConnectionFailed(self, connector, reason):
+        self.channel.connectionFailed(reason)
+
+
+class ConnectionPool():
+    """Keeps persistent framed connections to each peer, opened on
+    demand, reused across messages and closed when idle.
+
+    With batching, frames sent to a same peer during one reactor
+    iteration are coalesced into a single multi-message frame.
+
+    Both sides must be ImprovedAgents."""
+
+    def __init__(self, max_connections=1, idle_timeout=60.0,
+                 retries=3, retry_interval=1.0, batching=False):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.batching = batching
+
+        # (host, port) -> open channels and round-robin position
+        self.channels = defaultdict(list)
+        self.turn = Counter()
+
+        # (host, port) -> frames waiting for the end of the tick
+        self.batches = {}
+        self.flush_call = None
+
+        self.stats = Counter()
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def send(self, host, port, frame):
+        """Write a frame to the peer listening at host:port"""
+
+        address = (host, int(port))
+        self.stats['messages'] += 1
+
+        if not self.batching:
+            self._write(address, frame, perf_counter())
+            return
+
+        try:
+            self.batches[address][1].append(frame)
+        except KeyError:
+            self.batches[address] = (perf_counter(), [frame])
+
+        if self.flush_call is None:
+            self.flush_call = reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """Write one frame per peer with the messages of this tick"""
+
+        self.flush_call = None
+        batches, self.batches = self.batches, {}
+
+        for address, (enqueued, frames) in batches.items():
+            self.stats['batches'] += 1
+            self._write(address, encode_batch(frames), enqueued)
+
+    def _write(self, address, frame, enqueued):
+        channels = self.channels[address]
+
+        if len(channels) < self.max_connections:
+            channel = PeerChannel(self, address)
+            channels.append(channel)
+            channel.connect()
+            self.stats['connections'] += 1
+        else:
+            self.turn[address] += 1
+            channel = channels[self.turn[address] % len(channels)]
+            self.stats['reused'] += 1
+
+        channel.write(frame, enqueued)
+
+    def channel_lost(self, channel):
+        """Forget a closed channel and reconnect its pending frames"""
+
+        try:
+            self.channels[channel.address].remove(channel)
+        except ValueError:
+            pass
+
+        pending, channel.pending = channel.pending, []
+        if not pending:
+            return
+
+        if channel.retries >= self.retries:
+            self.stats['dropped'] += len(pending)
+            return
+
+        self.stats['reconnects'] += 1
+        reactor.callLater(self.retry_interval, self._reconnect,
+                          channel.address, pending, channel.retries + 1)
+
+    def _reconnect(self, address, pending, retries):
+        channels = self.channels[address]
+
+        # Channels opened since take the frames
+        if len(channels) >= self.max_connections:
+            for frame, enqueued in pending:
+                self.turn[address] += 1
+                channels[self.turn[address] % len(channels)].write(
+                    frame, enqueued)
+            return
+
+        channel = PeerChannel(self, address)
+        channel.retries = retries
+        channel.pending = pending
+        channels.append(channel)
+        channel.connect()
+        self.stats['connections'] += 1
+
+    def record_latency(self, latency):
+        self.stats['written'] += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def report(self) -> dict:
+        """Connection reuse and per-frame latency (enqueue to write)"""
+
+        messages = self.stats['messages']
+        frames = self.stats['connections'] + self.stats['reused']
+        written = self.stats['written']
+        return {
+            'messages': messages,
+            'frames': frames,
+            'connections': self.stats['connections'],
+            'reconnects': self.stats['reconnects'],
+            'dropped': self.stats['dropped'],
+            'reuse_ratio': self.stats['reused'] / frames if frames else 0.0,
+            'mean_latency': self.latency_total / written if written else 0.0,
+            'max_latency': self.latency_max,
+        }
@@ -0,0 +1,70 @@
+import sys
+import threading
+import traceback
+from time import monotonic, sleep
+
+from twisted.internet import reactor, task
+
+
+class ReactorWatchdog():
+    """Dumps the reactor thread's stack when the event loop has not
+    ticked for `timeout` seconds.
+
+    A heartbeat is scheduled on the reactor every `interval` seconds
+    and checked from a daemon thread. Each stall is reported once, with
+    the statement running when it was detected."""
+
+    def __init__(self, timeout=1.0, interval=0.1, output=None):
+        self.timeout = timeout
+        self.interval = interval
+        self.output = output or sys.stderr
+
+        self.last_tick = monotonic()
+        self.reactor_thread = None
+        self.stalled = False
+        self.stalls = 0
+        self.heartbeat = task.LoopingCall(self.tick)
+        self.running = False
+
+    def start(self):
+        self.running = True
+        reactor.callWhenRunning(self._start_heartbeat)
+        thread = threading.Thread(target=self._watch, name='reactor-watchdog',
+                                  daemon=True)
+        thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.heartbeat.running:
+            self.heartbeat.stop()
+
+    def _start_heartbeat(self):
+        self.reactor_thread = threading.get_ident()
+        self.heartbeat.start(self.interval)
+
+    def tick(self):
+        self.last_tick = monotonic()
+        if self.stalled:
+            self.stalled = False
+            self.output.write('Reactor resumed\n')
+
+    def _watch(self):
+        while self.running:
+            sleep(self.interval)
+            if self.reactor_thread is None or self.stalled:
+                continue
+
+            blocked = monotonic() - self.last_tick
+            if blocked >= self.timeout:
+                self.stalled = True
+                self.stalls += 1
+                self.dump(blocked)
+
+    def dump(self, blocked):
+        frame = sys._current_frames().get(self.reactor_thread)
+        if frame is None:
+            return
+
+        stack = ''.join(traceback.format_stack(frame))
+        self.output.write(f'Reactor blocked for {blocked:.2f} s:\n{stack}')
+        self.output.flush()
@@ -0,0 +1,92 @@
+"""Agents shared by the simulated tests"""
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+
+
+class Client(ImprovedAgent):
+    def __init__(self, name, server_aid):
+        super().__init__(AID(f'{name}@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server_aid
+        self.results = []
+        self.call_later(5, self.make_request)
+
+    @AgentSession.session
+    def make_request(self):
+        message = ACLMessage()
+        message.set_content('request')
+        message.add_receiver(self.server)
+        while True:
+            try:
+                response = yield from self.request.send_request(message)
+                self.results.append((self.simulation.now, response.content))
+            except FipaAgreeHandler:
+                self.results.append((self.simulation.now, 'agreed'))
+            except FipaProtocolComplete:
+                self.results.append((self.simulation.now, 'complete'))
+                break
+
+
+class Server(ImprovedAgent):
+    def __init__(self, name, answer=True, port=9000):
+        super().__init__(AID(f'{name}@localhost:{port}'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.answer = answer
+
+    def on_request(self, message):
+        if not self.answer:
+            return
+        self.request.send_agree(message.create_reply())
+        reply = message.create_reply()
+        reply.set_content('inform')
+        self.call_later(10, self.request.send_inform, reply)
+
+
+class RetryClient(ImprovedAgent):
+    """Client with the initiator options given, that records
+    informs and failures"""
+
+    def __init__(self, server_aid, **kwargs):
+        super().__init__(AID('client@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True, **kwargs)
+        self.server = server_aid
+        self.results = []
+
+    @AgentSession.session
+    def make_request(self):
+        message = ACLMessage()
+        message.add_receiver(self.server)
+        while True:
+            try:
+                response = yield from self.request.send_request(message)
+                self.results.append((self.simulation.now, response.content))
+            except FipaFailureHandler as h:
+                self.results.append((self.simulation.now, h.message.content))
+            except FipaProtocolComplete:
+                break
+
+
+class Subscriber(ImprovedAgent):
+    def __init__(self, name, publisher_aid, renew_every):
+        super().__init__(AID(f'{name}@localhost:9001'))
+        self.protocol = FipaSubscribeProtocol(
+            self, is_initiator=True, renew_every=renew_every)
+        self.received = []
+        self.call_later(5, self.make_subscribe, publisher_aid)
+
+    @AgentSession.session
+    def make_subscribe(self, publisher_aid):
+        message = ACLMessage()
+        message.add_receiver(publisher_aid)
+        while True:
+            try:
+                response = yield from self.protocol.send_subscribe(message)
+                self.received.append(response.content)
+            except FipaAgreeHandler:
+                pass
+            except FipaProtocolComplete:
+                break
@@ -0,0 +1,75 @@
+from pytest import approx
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.latency import LatencyEstimator, QuantileSketch
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Client(ImprovedAgent):
+    def __init__(self, server_aid, latency):
+        super().__init__(AID('client@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True,
+                                           latency=latency)
+        self.server = server_aid
+        self.results = []
+
+    def make_request(self):
+        message = ACLMessage()
+        message.add_receiver(self.server)
+        self.request.request(
+            message,
+            on_inform=lambda m: self.results.append('inform'),
+            on_timeout=lambda: self.results.append(
+                ('timeout', self.simulation.now)))
+
+
+class SlowServer(ImprovedAgent):
+    def __init__(self, delay, answers):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.delay = delay
+        self.answers = answers
+
+    def on_request(self, message):
+        if self.answers == 0:
+            return
+        self.answers -= 1
+        reply = message.create_reply()
+        self.call_later(self.delay, self.request.send_inform, reply)
+
+
+def test_quantile_sketch():
+    sketch = QuantileSketch(accuracy=0.01)
+    for value in range(1, 1001):
+        sketch.add(value / 1000)
+
+    assert sketch.quantile(0.5) == approx(0.5, rel=0.02)
+    assert sketch.quantile(0.99) == approx(0.99, rel=0.02)
+
+
+def test_request_timeout_follows_latency():
+    latency = LatencyEstimator(factor=2.0, min_samples=10)
+    simulation = Simulation(latency=ConstantLatency(0.1))
+    with simulation:
+        server = SlowServer(delay=1.0, answers=10)
+        client = Client(server.aid, latency)
+    for i in range(11):
+        client.call_later(5 * i, client.make_request)
+    simulation.run()
+
+    # Answers take 1.2 s: the last request expires after about 2.4 s
+    # rather than 60 s
+    assert client.results[:10] == ['inform'] * 10
+    event, time = client.results[10]
+    assert event == 'timeout'
+    assert time - 50 == approx(2.4, rel=0.02)
+
+    estimate = client.request.report()['latency'][server.aid.name]
+    assert estimate['samples'] == 10
+    assert estimate['ewma'] == approx(1.2)
+    assert estimate['timeout'] == approx(2.4, rel=0.02)
@@ -0,0 +1,109 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.retry import RetryPolicy
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Client(ImprovedAgent):
+    def __init__(self, server_aid, **kwargs):
+        super().__init__(AID('client@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True, **kwargs)
+        self.server = server_aid
+        self.results = []
+
+    def make_request(self):
+        message = ACLMessage()
+        message.add_receiver(self.server)
+        self.request.request(
+            message,
+            on_inform=lambda m: self.results.append(
+                (self.simulation.now, m.content)),
+            on_agree=lambda m: self.results.append(
+                (self.simulation.now, 'agree')),
+            on_failure=lambda m: self.results.append(
+                (self.simulation.now, m.content)),
+            on_timeout=lambda: self.results.append(
+                (self.simulation.now, 'timeout')))
+
+
+class Server(ImprovedAgent):
+    def __init__(self, failures, answer=True):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.failures = failures
+        self.answer = answer
+        self.requests = 0
+
+    def on_request(self, message):
+        self.requests += 1
+        if not self.answer:
+            return
+        reply = message.create_reply()
+        self.request.send_agree(reply)
+        reply = message.create_reply()
+        if self.requests <= self.failures:
+            reply.set_content('failure')
+            self.request.send_failure(reply)
+        else:
+            reply.set_content('inform')
+            self.request.send_inform(reply)
+
+
+def test_request_callbacks():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server(failures=1)
+        client = Client(server.aid)
+    client.call_later(5, client.make_request)
+    client.call_later(10, client.make_request)
+    simulation.run()
+
+    assert client.results == [(6.0, 'agree'), (6.0, 'failure'),
+                              (11.0, 'agree'), (11.0, 'inform')]
+    assert not client.request.open_sessions
+
+
+def test_callbacks_share_retries_and_timeouts():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server(failures=0, answer=False)
+        client = Client(server.aid, retry_policy=RetryPolicy(
+            max_attempts=2, backoff=1.0, jitter=0.0, timeout=5.0))
+    client.call_later(5, client.make_request)
+    simulation.run()
+
+    # Timeout at 10 s, retried at 11 s, timeout again at 16 s
+    assert client.results == [(16.0, 'timeout')]
+    assert server.requests == 2
+    assert client.request.report()['timeouts'] == 2
+
+
+def test_subscribe_callbacks():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        publisher = ImprovedAgent(AID('publisher@localhost:9000'))
+        publisher.protocol = FipaSubscribeProtocol(publisher, is_initiator=False)
+        publisher.protocol.set_subscribe_handler(publisher.protocol.subscribe)
+        subscriber = ImprovedAgent(AID('subscriber@localhost:9001'))
+        subscriber.protocol = FipaSubscribeProtocol(subscriber, is_initiator=True)
+
+    received = []
+    message = ACLMessage()
+    message.add_receiver(publisher.aid)
+    subscriber.call_later(1, lambda: subscriber.protocol.subscribe(
+        message, on_inform=lambda m: received.append(m.content)))
+
+    def publish(count):
+        inform = ACLMessage()
+        inform.set_content(count)
+        publisher.protocol.send_inform(inform)
+
+    for count in range(1, 4):
+        publisher.call_later(5 * count, publish, count)
+    simulation.run()
+
+    assert received == [1, 2, 3]
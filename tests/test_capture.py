@@ -0,0 +1,137 @@
+from multiprocessing import Process, Queue
+from random import randint
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.capture import TrafficRecorder, TrafficReplayer
+from pade.plus.capture import read_capture, INBOUND, OUTBOUND
+from pade.plus.compression import Compression
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from helpers import Client, Server, Subscriber
+
+
+class Publisher(ImprovedAgent):
+    def __init__(self, port):
+        super().__init__(AID(f'publisher@localhost:{port}'))
+        self.protocol = FipaSubscribeProtocol(self, is_initiator=False)
+        self.protocol.set_subscribe_handler(self.on_subscribe)
+
+    def on_subscribe(self, message):
+        self.protocol.subscribe(message)
+        self.protocol.send_agree(message.create_reply())
+
+
+def replay(queue, path, agent):
+    queue.put_nowait(TrafficReplayer(path).replay([agent], speed=None))
+
+
+def test_capture_simulated_traffic(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server('server')
+        client = Client('client', server.aid)
+    server.recorder = TrafficRecorder(path)
+    simulation.run()
+    server.recorder.close()
+
+    records = [(r.time, r.direction, r.message.performative)
+               for r in read_capture(path)
+               if not r.message.system_message]
+    assert records == [
+        (5.5, INBOUND, ACLMessage.REQUEST),
+        (5.5, OUTBOUND, ACLMessage.AGREE),
+        (15.5, OUTBOUND, ACLMessage.INFORM),
+    ]
+
+    # Response time is measured up to the first reply
+    original = TrafficReplayer(path).original({server.aid.name})
+    assert original['messages'] == 1
+    assert original['latency_mean'] == 0.0
+
+
+def test_capture_before_compression(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server('server')
+        sender = ImprovedAgent(AID('sender@localhost:9001'),
+                               compression=Compression(threshold=100))
+    sender.recorder = TrafficRecorder(path)
+    message = ACLMessage(ACLMessage.INFORM)
+    message.add_receiver(server.aid)
+    message.set_content('x' * 1000)
+    sender.call_later(1, sender.send, message)
+    simulation.run()
+    sender.recorder.close()
+
+    # The content the application sent, recorded once
+    records = [r.message for r in read_capture(path)
+               if r.direction == OUTBOUND and not r.message.system_message]
+    assert len(records) == 1
+    recorded = records[0].message
+    assert (recorded.encoding, recorded.content) == (None, 'x' * 1000)
+
+
+def test_replay_subscriptions(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    port = randint(20000, 60000)
+
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        publisher = Publisher(port)
+        subscribers = [Subscriber(f'subscriber{i}', publisher.aid, None)
+                       for i in range(3)]
+    publisher.recorder = TrafficRecorder(path)
+    simulation.run()
+    publisher.recorder.close()
+
+    # Replayed into a new publisher, which agrees to each subscription
+    queue = Queue()
+    process = Process(target=replay, args=(queue, path, Publisher(port)))
+    process.start()
+    try:
+        report = queue.get(timeout=30)
+    finally:
+        process.terminate()
+
+    assert report['original']['messages'] == 3
+    assert report['replay']['messages'] == 3
+    assert report['replay']['replies'] == 3
+
+
+def test_replay_old_requests(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    port = randint(20000, 60000)
+
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server('server', port=port)
+        client = Client('client', server.aid)
+    server.recorder = TrafficRecorder(path)
+    simulation.run()
+    server.recorder.close()
+
+    # Deadline on the simulated clock, long past on the real one
+    request, = [r.message for r in read_capture(path)
+                if r.message.performative == ACLMessage.REQUEST]
+    assert float(request.reply_by) == 65.0
+
+    queue = Queue()
+    replayed = Server('server', port=port)
+    process = Process(target=replay, args=(queue, path, replayed))
+    process.start()
+    try:
+        report = queue.get(timeout=30)
+    finally:
+        process.terminate()
+
+    # The request was handled and agreed to, not dropped as expired
+    assert report['replay']['messages'] == 1
+    assert report['replay']['replies'] == 1
@@ -0,0 +1,91 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Manager(ImprovedAgent):
+    def __init__(self, contractors, **options):
+        super().__init__(AID('manager@localhost:9000'))
+        self.contract_net = FipaContractNetProtocol(self, is_initiator=True)
+        self.contractors = contractors
+        self.options = options
+        self.rounds = []
+
+    @AgentSession.session
+    def call_proposals(self):
+        message = ACLMessage()
+        for contractor in self.contractors:
+            message.add_receiver(contractor)
+
+        proposals = []
+        while True:
+            try:
+                proposal = yield from self.contract_net.send_cfp(
+                    message, **self.options)
+                proposals.append(proposal.sender.localname)
+            except FipaCfpComplete:
+                break
+        self.rounds.append((self.simulation.now, proposals))
+
+
+class Contractor(ImprovedAgent):
+    def __init__(self, name, delay, price):
+        super().__init__(AID(f'{name}@localhost:9001'))
+        self.contract_net = FipaContractNetProtocol(self, is_initiator=False)
+        self.contract_net.set_cfp_handler(self.on_cfp)
+        # Answer time of each round
+        self.delays = iter(delay)
+        self.price = price
+        self.rejected = []
+
+    def on_cfp(self, message):
+        reply = message.create_reply()
+        reply.set_content(self.price)
+        self.call_later(next(self.delays), self.propose, reply)
+
+    @AgentSession.session
+    def propose(self, reply):
+        try:
+            yield from self.contract_net.send_propose(reply)
+        except FipaRejectProposalHandler as h:
+            self.rejected.append(h.message.content)
+
+
+def run(delays, **options):
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        contractors = [Contractor(f'contractor{i}', delay, price=10 * i)
+                       for i, delay in enumerate(delays)]
+        manager = Manager([c.aid for c in contractors], **options)
+    for start in (5, 100):
+        manager.call_later(start, manager.call_proposals)
+    simulation.run()
+    return manager, contractors
+
+
+def test_cfp_quorum():
+    manager, contractors = run([[1, 1], [2, 2], [20, 20]], quorum=2)
+
+    assert manager.rounds == [(8.0, ['contractor0', 'contractor1']),
+                              (103.0, ['contractor0', 'contractor1'])]
+    assert contractors[2].rejected == ['late proposal'] * 2
+    assert manager.contract_net.stats['late'] == 2
+
+
+def test_cfp_accept_predicate():
+    manager, _ = run([[1, 1], [2, 2], [3, 3]],
+                     accept=lambda proposal: proposal.content >= 10)
+    assert manager.rounds[0] == (8.0, ['contractor0', 'contractor1'])
+
+
+def test_cfp_adaptive_deadline():
+    manager, contractors = run([[1, 1], [2, 2], [3, 40]], adaptive=True)
+
+    # Contractors usually answer in 4 s: mean + 4 deviations is 12 s
+    assert manager.rounds == [
+        (9.0, ['contractor0', 'contractor1', 'contractor2']),
+        (112.0, ['contractor0', 'contractor1'])]
+    assert contractors[2].rejected == ['late proposal']
@@ -0,0 +1,133 @@
+import json
+import os
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.protocols import Behaviour
+from pade.plus.agent import ImprovedAgent
+from pade.plus.compression import Compression, inflated
+from pade.plus.messages import dump_message, load_message
+from pade.plus.simulation import Simulation
+
+
+class Subscriber(ImprovedAgent):
+    def __init__(self, name, publisher_aid):
+        super().__init__(AID(f'{name}@localhost:9001'))
+        self.subscribe = FipaSubscribeProtocol(self, is_initiator=True)
+        self.publisher = publisher_aid
+        self.informs = []
+        self.call_later(1, self.make_subscribe)
+
+    @AgentSession.session
+    def make_subscribe(self):
+        message = ACLMessage()
+        message.add_receiver(self.publisher)
+        while True:
+            try:
+                inform = yield from self.subscribe.send_subscribe(message)
+                self.informs.append((inform.encoding, inform.content))
+            except FipaAgreeHandler:
+                pass
+            except FipaProtocolComplete:
+                break
+
+
+class Publisher(ImprovedAgent):
+    def __init__(self, compression):
+        super().__init__(AID('publisher@localhost:9000'),
+                         compression=compression)
+        self.subscribe = FipaSubscribeProtocol(self, is_initiator=False)
+        self.subscribe.set_subscribe_handler(self.on_subscribe)
+
+    def on_subscribe(self, message):
+        self.subscribe.subscribe(message)
+        self.subscribe.send_agree(message.create_reply())
+
+    def publish(self, content, encoding=None):
+        message = ACLMessage()
+        message.set_content(content)
+        message.set_encoding(encoding)
+        self.subscribe.send_inform(message)
+
+
+def test_compressed_once_per_publish():
+    document = json.dumps([{'id': i, 'name': f'item {i}', 'price': i * 1.5}
+                           for i in range(1000)])
+    compression = Compression(threshold=4096)
+    simulation = Simulation()
+    with simulation:
+        publisher = Publisher(compression)
+        subscribers = [Subscriber(f'subscriber{i}', publisher.aid)
+                       for i in range(5)]
+    publisher.call_later(10, publisher.publish, document, 'json')
+    publisher.call_later(20, publisher.publish, 'small')
+    simulation.run(until=30)
+
+    for subscriber in subscribers:
+        assert subscriber.informs == [('json', document), (None, 'small')]
+
+    report = compression.report()
+    assert report['compressed'] == 1
+    assert report['bytes_in'] == len(document)
+    assert report['ratio'] < 0.5
+    assert report['cpu_time'] >= 0
+
+
+def test_decompressed_on_access():
+    compression = Compression(threshold=100, codec='lzma')
+    message = ACLMessage(ACLMessage.INFORM)
+    message.set_sender(AID('publisher@localhost:9000'))
+    message.set_content({'values': list(range(1000))})
+
+    wrapped = compression.wrap(message)
+    assert wrapped.encoding == 'pade-plus-lzma'
+    # The message to send is left as is
+    assert message.content == {'values': list(range(1000))}
+
+    received = load_message(dump_message(wrapped))
+    # Original encoding read from the routing headers
+    assert received.encoding is None
+    assert received._message is None
+    assert received.content == {'values': list(range(1000))}
+    assert received.encoding is None
+
+
+def test_incompressible_sent_as_is():
+    compression = Compression(threshold=100)
+    message = ACLMessage(ACLMessage.INFORM)
+    message.set_content(os.urandom(1024))
+
+    assert compression.wrap(message) is message
+    assert compression.report()['incompressible'] == 1
+
+
+class Keep(Behaviour):
+    def execute(self, message):
+        self.agent.received.append(message)
+
+
+def test_not_inflated_unless_read():
+    compression = Compression(threshold=100)
+    simulation = Simulation()
+    with simulation:
+        agent = ImprovedAgent(AID('receiver@localhost:9001'))
+    agent.received = []
+    agent.behaviours.append(Keep(agent))
+    simulation.run(until=1)
+
+    message = ACLMessage(ACLMessage.INFORM)
+    message.set_sender(AID('publisher@localhost:9000'))
+    message.set_content('x' * 1000)
+    message.set_encoding('text')
+
+    # Received already unpickled, as from PADE's transport
+    messages = inflated['messages']
+    agent.react(compression.wrap(message))
+    received, = agent.received
+    assert received.encoding == 'text'
+    assert inflated['messages'] == messages
+
+    assert received.content == 'x' * 1000
+    assert inflated['messages'] == messages + 1
@@ -0,0 +1,95 @@
+from multiprocessing import Queue
+from random import randint
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.messages import load_message
+from pade.plus.transport import ConnectionPool, PeerChannel
+from pade.plus.transport import encode_frame, encode_batch, split_frames
+
+from conftest import start_loop_test
+
+
+def test_batch_frames():
+    messages = [ACLMessage(ACLMessage.INFORM) for _ in range(3)]
+    for i, message in enumerate(messages):
+        message.set_content(i)
+    frames = [encode_frame(message) for message in messages]
+    data = frames[0] + encode_batch(frames[1:]) + frames[2][:5]
+
+    payloads, offset = split_frames(data)
+
+    # Complete frames are unpacked in order, the partial one is kept
+    received = [load_message(payload) for payload in payloads]
+    assert [m.performative for m in received] == [ACLMessage.INFORM] * 3
+    assert [m.content for m in received] == [0, 1, 2]
+    assert offset == len(data) - 5
+
+
+def test_reconnect_within_limit():
+    pool = ConnectionPool(max_connections=1)
+    address = ('localhost', 9000)
+    # Opened by a send while the lost channel waited to reconnect
+    channel = PeerChannel(pool, address)
+    pool.channels[address].append(channel)
+
+    pool._reconnect(address, [(b'frame', 0.0)], 1)
+
+    assert pool.channels[address] == [channel]
+    assert channel.pending == [(b'frame', 0.0)]
+    assert pool.report()['connections'] == 0
+
+
+def test_pooled_requests(start_runtime):
+    queue = Queue()
+
+    class Sender(ImprovedAgent):
+        def __init__(self, receiver_aid):
+            super().__init__(AID(f'pooled_sender@localhost:{randint(9000, 60000)}'),
+                             connection_pool=ConnectionPool())
+            self.request = FipaRequestProtocol(self, is_initiator=True)
+            self.receiver = receiver_aid
+            self.call_later(5, self.make_requests)
+
+        @AgentSession.session
+        def make_requests(self):
+            for i in range(5):
+                message = ACLMessage()
+                message.set_content(i)
+                message.add_receiver(self.receiver)
+                while True:
+                    try:
+                        response = yield from self.request.send_request(message)
+                    except FipaProtocolComplete:
+                        break
+                queue.put_nowait(response.content)
+
+            report = self.connection_pool.report()
+            queue.put_nowait((report['messages'], report['connections']))
+
+    class Receiver(ImprovedAgent):
+        def __init__(self):
+            super().__init__(AID(f'pooled_receiver@localhost:{randint(9000, 60000)}'),
+                             connection_pool=ConnectionPool(batching=True))
+            self.request = FipaRequestProtocol(self, is_initiator=False)
+            self.request.set_request_handler(self.on_request)
+
+        def on_request(self, message):
+            response = message.create_reply()
+            response.set_content(2 * message.content)
+            self.request.send_inform(response)
+
+    receiver = Receiver()
+    sender = Sender(receiver.aid)
+
+    sender.ams = start_runtime
+    receiver.ams = start_runtime
+
+    with start_loop_test([sender, receiver]):
+        for i in range(5):
+            assert queue.get(timeout=30) == 2 * i
+        # All requests went through a single persistent connection
+        assert queue.get(timeout=30) == (5, 1)
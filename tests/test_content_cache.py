@@ -0,0 +1,99 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.memo import ContentCache
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Client(ImprovedAgent):
+    def __init__(self, name, server_aid):
+        super().__init__(AID(f'{name}@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server_aid
+        self.results = []
+
+    @AgentSession.session
+    def query(self, content):
+        message = ACLMessage()
+        message.set_content(content)
+        message.add_receiver(self.server)
+        while True:
+            try:
+                response = yield from self.request.send_request(message)
+                self.results.append((self.simulation.now, response.content))
+            except FipaAgreeHandler:
+                self.results.append((self.simulation.now, 'agreed'))
+            except FipaFailureHandler as h:
+                self.results.append((self.simulation.now, h.message.content))
+            except FipaProtocolComplete:
+                break
+
+
+class PriceServer(ImprovedAgent):
+    def __init__(self, cache):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request, cache=cache)
+        self.computed = []
+
+    def on_request(self, message):
+        self.computed.append(message.content)
+        self.request.send_agree(message.create_reply())
+        reply = message.create_reply()
+        reply.set_content(f'price of {message.content}')
+        self.call_later(10, self.request.send_inform, reply)
+
+
+def test_memoized_requests():
+    cache = ContentCache(ttl=30)
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = PriceServer(cache)
+        clients = [Client(f'client{i}', server.aid) for i in range(3)]
+
+    # Second client joins the computation, third one hits the cache
+    clients[0].call_later(5, clients[0].query, 'apple')
+    clients[1].call_later(8, clients[1].query, 'apple')
+    clients[2].call_later(20, clients[2].query, 'apple')
+    simulation.run()
+
+    assert server.computed == ['apple']
+    assert clients[0].results == [(6.0, 'agreed'), (16.0, 'price of apple')]
+    assert clients[1].results == [(9.0, 'agreed'), (16.0, 'price of apple')]
+    assert clients[2].results == [(21.0, 'agreed'), (21.0, 'price of apple')]
+    report = cache.report()
+    assert (report['misses'], report['joined'], report['hits']) == (1, 1, 1)
+
+    cache.invalidate(('apple', None, None))
+    assert cache.report()['entries'] == 0
+
+
+class SilentServer(PriceServer):
+    def on_request(self, message):
+        self.computed.append(message.content)
+
+
+def test_unanswered_flight_abandoned():
+    cache = ContentCache(ttl=300)
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = SilentServer(cache)
+        clients = [Client(f'client{i}', server.aid) for i in range(2)]
+    clients[0].call_later(5, clients[0].query, 'apple')
+    clients[1].call_later(8, clients[1].query, 'apple')
+    simulation.run()
+
+    # The first request expires at 65 s, its waiter gets a failure
+    assert server.computed == ['apple']
+    assert clients[0].results == []
+    assert clients[1].results == [(65.5, 'timeout')]
+    assert cache.report()['abandoned'] == 1
+    assert (cache.report()['in_flight'], cache.leaders) == (0, {})
+    assert server.request.report()['expired'] == 0
+
+    # A new request runs the handler again
+    clients[0].call_later(1, clients[0].query, 'apple')
+    simulation.run()
+    assert server.computed == ['apple', 'apple']
@@ -0,0 +1,91 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from helpers import Server
+
+
+class Orchestrator(ImprovedAgent):
+    def __init__(self, server_aid):
+        super().__init__(AID('orchestrator@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server_aid
+        self.results = []
+
+    def ask(self):
+        message = ACLMessage()
+        message.add_receiver(self.server)
+        content = None
+        while True:
+            try:
+                response = yield from self.request.send_request(message)
+                content = response.content
+            except FipaAgreeHandler:
+                pass
+            except FipaProtocolComplete:
+                break
+        return content
+
+    def tree(self, depth, fanout):
+        if depth == 0:
+            return [(yield from self.ask())]
+        results = yield from AgentSession.gather(
+            *(self.tree(depth - 1, fanout) for _ in range(fanout)))
+        return sum(results, [])
+
+    @AgentSession.session
+    def run_tree(self, depth, fanout):
+        results = yield from self.tree(depth, fanout)
+        empty = yield from AgentSession.gather()
+        self.results.append((self.simulation.now, results, empty))
+
+
+def run_tree(depth, fanout):
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server('server')
+        orchestrator = Orchestrator(server.aid)
+    orchestrator.call_later(5, orchestrator.run_tree, depth, fanout)
+    simulation.run()
+    return orchestrator.results
+
+
+def test_nested_gather():
+    # All requests sent at 5 s, informed 11 s later
+    assert run_tree(3, 2) == [(16.0, ['inform'] * 8, [])]
+
+
+def test_deep_gather_chain():
+    # Completion of 2000 nested gathers does not recurse
+    assert run_tree(2000, 1) == [(16.0, ['inform'], [])]
+
+
+class Impatient(Orchestrator):
+    def ask_once(self, server):
+        # FipaProtocolComplete ends it when the session expires
+        message = ACLMessage()
+        message.add_receiver(server)
+        response = yield from self.request.send_request(message)
+        return response.content
+
+    @AgentSession.session
+    def run_both(self, silent):
+        results = yield from AgentSession.gather(
+            self.ask_once(silent), self.ask())
+        self.results.append((self.simulation.now, results))
+
+
+def test_gathered_child_times_out():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server('server')
+        silent = Server('silent', answer=False, port=9002)
+        orchestrator = Impatient(server.aid)
+    orchestrator.call_later(5, orchestrator.run_both, silent.aid)
+    simulation.run()
+
+    # The expired request gives None, and the gather resumes
+    assert orchestrator.results == [(65.0, [None, 'inform'])]
@@ -0,0 +1,57 @@
+from multiprocessing import Process, Queue
+from random import randint
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.plus.agent import ImprovedAgent
+from pade.plus.local import LocalAMS
+
+
+class Worker(ImprovedAgent):
+    def __init__(self, name, port):
+        super().__init__(AID(f'{name}@localhost:{port}'))
+        self.received = 0
+
+    def react(self, message):
+        self.received += 1
+
+
+def run_population(queue, port, size):
+    from twisted.internet import reactor
+
+    # Workers share two listening sockets
+    workers = [Worker(f'worker{i}', port + i % 2) for i in range(size)]
+    boss = Worker('boss', port + 2)
+    local_ams = LocalAMS()
+
+    def broadcast(agents):
+        message = ACLMessage(ACLMessage.INFORM)
+        for worker in workers:
+            message.add_receiver(worker.aid)
+        boss.send(message)
+        reactor.callLater(8, done)
+
+    def done():
+        queue.put_nowait(sorted({worker.received for worker in workers}))
+        queue.put_nowait(local_ams.report())
+        reactor.stop()
+
+    local_ams.start([boss, *workers], batch=50).addCallback(broadcast)
+    reactor.run()
+
+
+def test_population_shares_sockets():
+    queue = Queue()
+    process = Process(target=run_population,
+                      args=(queue, randint(20000, 60000), 100))
+    process.start()
+    try:
+        # Every worker got the message once
+        assert queue.get(timeout=30) == [1]
+        report = queue.get(timeout=30)
+        assert report['agents'] == 101
+        assert report['sockets'] == 3
+        assert report['messages'] == 100
+    finally:
+        process.terminate()
@@ -0,0 +1,77 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.messages import dump_message, load_message
+from pade.plus.simulation import Simulation
+
+from helpers import Client, Server
+
+
+class SlowFirstMessage():
+    """The first message is stuck for `delay` seconds"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def __call__(self, sender, receiver, message):
+        delay, self.delay = self.delay, 0.5
+        return delay
+
+
+class CountingServer(Server):
+    handled = 0
+
+    def on_request(self, message):
+        self.handled += 1
+        super().on_request(message)
+
+
+def test_dispatcher_drops_expired_requests():
+    simulation = Simulation(latency=SlowFirstMessage(80))
+    with simulation:
+        server = CountingServer('server')
+        client = Client('client', server.aid)
+    simulation.run()
+
+    # The request arrives at 85 s, after the session expired at 65 s
+    assert client.results == [(65.0, 'complete')]
+    assert server.handled == 0
+    assert server.expired == {ACLMessage.FIPA_REQUEST_PROTOCOL: 1}
+
+
+def test_participant_drops_expired_messages():
+    simulation = Simulation()
+    with simulation:
+        agent = ImprovedAgent(AID('server@localhost:9000'))
+        handled = []
+        request = FipaRequestProtocol(agent, is_initiator=False)
+        request.set_request_handler(handled.append)
+        cfp = FipaContractNetProtocol(agent, is_initiator=False)
+        cfp.set_cfp_handler(handled.append)
+    simulation.run(until=100)
+
+    for performative, protocol, participant in (
+            (ACLMessage.REQUEST, ACLMessage.FIPA_REQUEST_PROTOCOL, request),
+            (ACLMessage.CFP, ACLMessage.FIPA_CONTRACT_NET_PROTOCOL, cfp)):
+        for reply_by in ('50.0', '150.0'):
+            message = ACLMessage(performative)
+            message.set_protocol(protocol)
+            message.set_sender(AID('client@localhost:9001'))
+            message.set_reply_by(reply_by)
+            participant.execute(message)
+
+    assert [message.reply_by for message in handled] == ['150.0', '150.0']
+    assert request.report()['expired'] == 1
+    assert cfp.report()['expired'] == 1
+
+
+def test_reply_by_read_without_unpickling():
+    message = ACLMessage(ACLMessage.REQUEST)
+    message.set_sender(AID('client@localhost:9001'))
+    message.set_reply_by('10.0')
+
+    received = load_message(dump_message(message))
+    assert received.reply_by == '10.0'
+    assert received._message is None
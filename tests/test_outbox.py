@@ -0,0 +1,139 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.dedup import ResponseCache
+from pade.plus.agent import ImprovedAgent
+from pade.plus.outbox import Outbox
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Client(ImprovedAgent):
+    def __init__(self, server_aid, outbox):
+        super().__init__(AID('client@localhost:9001'), outbox=outbox)
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server_aid
+        self.results = []
+
+    @AgentSession.session
+    def make_request(self, content):
+        message = ACLMessage()
+        message.set_content(content)
+        message.add_receiver(self.server)
+        while True:
+            try:
+                response = yield from self.request.send_request(message)
+                self.results.append(response.content)
+            except FipaProtocolComplete:
+                break
+
+
+class Server(ImprovedAgent):
+    def __init__(self, answer=True):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(
+            self, is_initiator=False, response_cache=ResponseCache())
+        self.request.set_request_handler(self.on_request)
+        self.answer = answer
+        self.handled = []
+
+    def on_request(self, message):
+        self.handled.append(message.content)
+        if self.answer:
+            reply = message.create_reply()
+            reply.set_content(message.content.upper())
+            self.request.send_inform(reply)
+
+
+def run(path, answer, contents, until=None, **kwargs):
+    outbox = Outbox(path, **kwargs)
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server(answer)
+        client = Client(server.aid, outbox)
+    for content in contents:
+        client.call_later(5, client.make_request, content)
+    simulation.run(until=until)
+    return client, server, outbox
+
+
+def test_acknowledged_by_reply(tmp_path):
+    client, server, outbox = run(tmp_path / 'outbox', True, ['a', 'b', 'c'])
+
+    assert sorted(client.results) == ['A', 'B', 'C']
+    report = outbox.report()
+    # Requests sent together share one write and one fsync
+    assert report['appended'] == 3
+    assert report['fsyncs'] == report['commits'] == 2
+    assert report['acknowledged'] == 3
+    assert report['pending'] == 0
+
+    outbox.close()
+    assert Outbox(tmp_path / 'outbox').report()['recovered'] == 0
+
+
+def test_replayed_after_restart(tmp_path):
+    # The server never answers, then the client stops
+    client, server, outbox = run(tmp_path / 'outbox', False, ['a'],
+                                 until=20)
+    assert server.handled == ['a']
+    assert outbox.report()['pending'] == 1
+    outbox.file.close()
+
+    # The request is sent again by the restarted client
+    client, server, outbox = run(tmp_path / 'outbox', True, [])
+    assert server.handled == ['a']
+    report = outbox.report()
+    assert report['recovered'] == report['replayed'] == 1
+    assert report['acknowledged'] == 1
+    assert report['pending'] == 0
+
+
+def test_resent_while_unanswered(tmp_path):
+    client, server, outbox = run(tmp_path / 'outbox', False, ['a'],
+                                 until=17, resend_after=5.0)
+
+    # Copies are recognized by their reply_with and not handled again
+    assert server.handled == ['a']
+    assert outbox.report()['resent'] == 2
+    assert outbox.report()['pending'] == 1
+
+
+def test_resent_after_deadline(tmp_path):
+    abandoned = []
+    client, server, outbox = run(tmp_path / 'outbox', False, ['a'],
+                                 resend_after=70.0, max_attempts=3,
+                                 on_abandon=abandoned.append)
+
+    # The copies sent after the first reply-by (65 s) carry a new one,
+    # and are handled again once the response cache forgot the request
+    assert server.handled == ['a', 'a', 'a']
+    assert server.expired == {}
+    report = outbox.report()
+    assert (report['resent'], report['abandoned']) == (2, 1)
+    assert report['pending'] == 0
+    assert [m.content for m in abandoned] == ['a']
+
+    # Abandoned messages are not replayed
+    outbox.close()
+    assert Outbox(tmp_path / 'outbox').report()['recovered'] == 0
+
+
+def test_replayed_after_deadline(tmp_path):
+    client, server, outbox = run(tmp_path / 'outbox', False, ['a'],
+                                 until=20)
+    outbox.file.close()
+
+    # Restarted after the reply-by of the request
+    outbox = Outbox(tmp_path / 'outbox')
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server(True)
+        client = Client(server.aid, None)
+    simulation.call_later(100, setattr, client, 'outbox', outbox)
+    simulation.call_later(100, outbox.replay, client)
+    simulation.run()
+
+    assert server.handled == ['a']
+    assert server.expired == {}
+    assert outbox.report()['acknowledged'] == 1
@@ -0,0 +1,25 @@
+from pade.behaviours.session import profiling
+from pade.plus.simulation import Simulation
+
+from helpers import Client, Server
+
+
+def test_profiler_flags_slow_handlers():
+    slow = []
+    profiler = profiling.enable(threshold=0.0, top=3,
+                                on_slow=lambda *step: slow.append(step))
+    try:
+        simulation = Simulation()
+        with simulation:
+            server = Server('server')
+            client = Client('client', server.aid)
+        simulation.run()
+    finally:
+        profiling.disable()
+
+    summary = profiler.summary()
+    assert 'Server.on_request' in summary
+    assert 'Client.make_request' in summary
+    assert len(profiler.report()) == 3
+    assert profiler.stats['slow'] == profiler.stats['steps'] == len(slow)
+    assert profiling.step(client.make_request) is profiling.step(None)
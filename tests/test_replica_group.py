@@ -0,0 +1,84 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.replicas import ReplicaGroup
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Client(ImprovedAgent):
+    def __init__(self, group):
+        super().__init__(AID('client@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.group = group
+        self.results = []
+
+    @AgentSession.session
+    def make_request(self):
+        message = ACLMessage()
+        while True:
+            try:
+                response = yield from self.request.send_group_request(
+                    message, self.group)
+                self.results.append((self.simulation.now, response.content))
+            except FipaProtocolComplete:
+                break
+
+
+class Replica(ImprovedAgent):
+    def __init__(self, name, delay):
+        super().__init__(AID(f'{name}@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.delay = delay
+        self.requests = 0
+        self.cancelled = []
+
+    def react(self, message):
+        super().react(message)
+        if message.performative == ACLMessage.CANCEL:
+            self.cancelled.append(message.conversation_id)
+
+    def on_request(self, message):
+        self.requests += 1
+        reply = message.create_reply()
+        reply.set_content(self.aid.localname)
+        self.call_later(self.delay, self.request.send_inform, reply)
+
+
+def test_hedged_request():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        fast = Replica('fast', delay=0)
+        slow = Replica('slow', delay=10)
+        group = ReplicaGroup([fast.aid, slow.aid], hedge_after=2.0)
+        client = Client(group)
+    client.call_later(5, client.make_request)
+    simulation.run()
+
+    # Sent to slow at 5 s, hedged to fast at 7 s
+    assert client.results == [(8.0, 'fast')]
+    assert len(slow.cancelled) == 1
+    # The slow replica did not send its answer after the CANCEL
+    assert (slow.request.report()['cancelled'],
+            slow.request.report()['unsent']) == (1, 1)
+    assert fast.request.report()['unsent'] == 0
+    report = group.report()
+    assert (report['hedged'], report['hedge_wins'], report['cancelled']) == (1, 1, 1)
+    assert report['outstanding'] == {}
+
+
+def test_least_outstanding():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        replicas = [Replica(f'replica{i}', delay=10) for i in range(2)]
+        group = ReplicaGroup([replica.aid for replica in replicas])
+        client = Client(group)
+    for _ in range(4):
+        client.call_later(5, client.make_request)
+    simulation.run()
+
+    assert len(client.results) == 4
+    assert [replica.requests for replica in replicas] == [2, 2]
+    assert set(group.latency.values()) == {11.0}
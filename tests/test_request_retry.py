@@ -0,0 +1,84 @@
+from pade.acl.aid import AID
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.retry import RetryPolicy, CircuitBreaker
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from helpers import RetryClient
+
+
+class FlakyServer(ImprovedAgent):
+    def __init__(self, failures):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.failures = failures
+        self.requests = 0
+
+    def on_request(self, message):
+        self.requests += 1
+        if self.failures is None:
+            return
+        reply = message.create_reply()
+        if self.requests <= self.failures:
+            reply.set_content('failure')
+            self.request.send_failure(reply)
+        else:
+            reply.set_content('inform')
+            self.request.send_inform(reply)
+
+
+def test_retry_with_backoff():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = FlakyServer(failures=2)
+        client = RetryClient(server.aid, retry_policy=RetryPolicy(
+            max_attempts=3, backoff=1.0, jitter=0.0))
+    client.call_later(5, client.make_request)
+    simulation.run()
+
+    # Failures at 6 s and 8 s, retried after 1 s then 2 s
+    assert client.results == [(11.0, 'inform')]
+    assert server.requests == 3
+    assert client.request.report()['retries'] == 2
+
+
+def test_circuit_breaker_rejects():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    with simulation:
+        server = FlakyServer(failures=None)
+        client = RetryClient(server.aid, circuit_breaker=breaker,
+                        retry_policy=RetryPolicy(max_attempts=1, timeout=5.0))
+    for start in (5, 15, 25, 45):
+        client.call_later(start, client.make_request)
+    simulation.run()
+
+    # Two timeouts open the circuit at 20 s, it half-opens at 50 s
+    assert client.results == [(25.0, 'circuit open'), (45.0, 'circuit open')]
+    assert server.requests == 2
+    assert breaker.state(server.aid.name) == CircuitBreaker.HALF_OPEN
+
+    report = client.request.report()
+    assert report['rejected'] == 2
+    assert report['timeouts'] == 2
+    assert report['circuits']['opened'] == 1
+
+
+def test_session_lasts_for_all_attempts():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    policy = RetryPolicy(max_attempts=3, backoff=10.0, jitter=0.0, timeout=25.0)
+    with simulation:
+        server = FlakyServer(failures=None)
+        client = RetryClient(server.aid, retry_policy=policy)
+    client.call_later(5, client.make_request)
+    simulation.run()
+
+    # Attempts at 5 s, 40 s and 85 s, beyond the default 60 s expiry
+    assert policy.budget(25.0) == 105.0
+    assert server.requests == 3
+    assert server.expired == {}
+    report = client.request.report()
+    assert (report['retries'], report['timeouts'], report['pending']) == (2, 3, 0)
+    assert simulation.now == 110.0
@@ -0,0 +1,63 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.dedup import ResponseCache
+from pade.behaviours.session.retry import RetryPolicy
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from helpers import RetryClient
+
+
+class SlowServer(ImprovedAgent):
+    def __init__(self, cache):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(
+            self, is_initiator=False, response_cache=cache)
+        self.request.set_request_handler(self.on_request)
+        self.requests = 0
+
+    def on_request(self, message):
+        self.requests += 1
+        reply = message.create_reply()
+        reply.set_content('inform')
+        self.call_later(8, self.request.send_inform, reply)
+
+
+def test_duplicate_requests_replayed():
+    cache = ResponseCache(max_size=10)
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = SlowServer(cache)
+        client = RetryClient(server.aid, retry_policy=RetryPolicy(
+            max_attempts=3, backoff=1.0, jitter=0.0, timeout=5.0))
+    client.call_later(5, client.make_request)
+    simulation.run()
+
+    # Retry at 10.5 s is dropped while the first request is handled
+    assert server.requests == 1
+    assert client.results == [(14.0, 'inform')]
+
+    report = cache.report()
+    assert (report['entries'], report['hits'], report['misses']) == (1, 1, 1)
+    assert report['bytes'] > 0
+
+
+def test_cache_bounded():
+    cache = ResponseCache(max_size=2, ttl=10)
+    requests = []
+    for i in range(3):
+        request = ACLMessage(ACLMessage.REQUEST)
+        request.set_sender(AID('client@localhost:9001'))
+        requests.append(request)
+        assert cache.lookup(request, now=i) is None
+
+    reply = requests[2].create_reply()
+    reply.set_performative(ACLMessage.INFORM)
+    cache.record(reply)
+
+    assert [r.performative for r in cache.lookup(requests[2], now=5)] == ['inform']
+    assert cache.lookup(requests[2], now=20) is None
+    assert cache.report()['evictions'] == 1
+    assert cache.report()['expired'] == 1
@@ -0,0 +1,71 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session import audit
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Client(ImprovedAgent):
+    def __init__(self, server_aid):
+        super().__init__(AID('client@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server_aid
+        self.answers = 0
+
+    @AgentSession.session
+    def swallow_completion(self):
+        message = ACLMessage()
+        message.add_receiver(self.server)
+        while True:
+            try:
+                yield from self.request.send_request(message)
+                self.answers += 1
+            except FipaProtocolComplete:
+                # Never gives up
+                pass
+
+
+class SilentServer(ImprovedAgent):
+    def __init__(self):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.requests = 0
+
+    def on_request(self, message):
+        self.requests += 1
+
+
+def test_auditor_closes_abandoned_sessions():
+    auditor = audit.enable(max_age=100)
+    try:
+        simulation = Simulation(latency=ConstantLatency(0.5))
+        with simulation:
+            server = SilentServer()
+            client = Client(server.aid)
+        client.call_later(5, client.swallow_completion)
+        client.call_later(30, auditor.schedule, client, 30)
+
+        simulation.run(until=100)
+        live = auditor.live()
+        assert len(live) == 1
+        assert live[0]['site'] == 'Client.swallow_completion'
+        assert live[0]['age'] == 95.0
+        # The 60 s expiry resumed it, and it sent the request again
+        assert live[0]['idle'] == 35.0
+        assert auditor.count() == {'FipaRequestProtocolInitiator': 1}
+
+        simulation.run(until=300)
+    finally:
+        audit.disable()
+
+    # Sent at 5 s, 65 s, and once more when closed at 120 s
+    assert server.requests == 3
+    assert not client.request.open_sessions
+
+    report = auditor.report()
+    assert report['live'] == 0
+    assert report['forced'] == report['swallowed'] == 1
+    assert report['opened'] == report['closed'] == 1
@@ -0,0 +1,123 @@
+import pytest
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.shared import SharedPayload, SharedPayloads, open_shared
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Receiver(ImprovedAgent):
+    def __init__(self, name):
+        super().__init__(AID(f'{name}@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.received = []
+
+    def on_request(self, message):
+        content = message.content
+        if isinstance(content, SharedPayload):
+            with content:
+                self.received.append(('shared', content.tobytes()))
+        else:
+            self.received.append(('inline', content))
+
+
+def send(sender, receivers, content):
+    message = ACLMessage(ACLMessage.REQUEST)
+    message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+    for receiver in receivers:
+        message.add_receiver(receiver.aid)
+    message.set_content(content)
+    sender.send(message)
+    return message
+
+
+def test_large_payloads_through_shared_memory():
+    payloads = SharedPayloads(threshold=1024)
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        sender = ImprovedAgent(AID('sender@localhost:9001'),
+                               shared_payloads=payloads)
+        receivers = [Receiver('first'), Receiver('second')]
+
+    large = bytes(range(256)) * 64
+    sender.call_later(1, send, sender, receivers, b'small')
+    message = []
+    sender.call_later(2, lambda: message.append(send(sender, receivers, large)))
+    simulation.run()
+
+    for receiver in receivers:
+        assert receiver.received == [('inline', b'small'), ('shared', large)]
+    # The sender's message is left as is
+    assert message[0].content is large
+
+    report = payloads.report()
+    assert report['shared'] == 1
+    assert report['bytes'] == len(large)
+    # Freed once both receivers released it
+    assert report['released'] == 1
+    assert report['segments'] == 0
+
+
+def test_numpy_array_zero_copy():
+    numpy = pytest.importorskip('numpy')
+
+    payloads = SharedPayloads(threshold=1024)
+    simulation = Simulation()
+    with simulation:
+        sender = ImprovedAgent(AID('sender@localhost:9001'),
+                               shared_payloads=payloads)
+        receiver = ImprovedAgent(AID('receiver@localhost:9000'))
+        request = FipaRequestProtocol(receiver, is_initiator=False)
+        arrays = []
+        request.set_request_handler(lambda m: arrays.append(m.content))
+
+    array = numpy.arange(1000, dtype=numpy.float64).reshape(10, 100)
+    sender.call_later(1, send, sender, [receiver], array)
+    simulation.run(until=1.5)
+
+    received = arrays[0].array()
+    assert received.shape == (10, 100)
+    assert (received == array).all()
+    # Until released, the segment is kept
+    assert payloads.report()['segments'] == 1
+
+    del received
+    arrays[0].release()
+    simulation.run()
+    assert payloads.report()['released'] == 1
+
+
+def test_receiver_named_differently():
+    payloads = SharedPayloads(threshold=1024)
+    simulation = Simulation()
+    with simulation:
+        sender = ImprovedAgent(AID('sender@localhost:9001'),
+                               shared_payloads=payloads)
+        receiver = ImprovedAgent(AID('receiver@localhost:9000'))
+    large = bytes(1024)
+
+    def received(*names):
+        message = ACLMessage(ACLMessage.INFORM)
+        for name in names:
+            message.add_receiver(AID(f'{name}@localhost:9000'))
+        message.set_content(large)
+        message = payloads.wrap(sender, message)
+        open_shared(receiver, message)
+        return message.content
+
+    # The only receiver owns the release flag
+    with received('alias') as payload:
+        assert payload.tobytes() == large
+    payloads.sweep()
+    assert payloads.report()['released'] == 1
+
+    # Without a flag of its own, the segment expires instead
+    with received('first', 'second') as payload:
+        assert payload.index is None
+        assert payload.tobytes() == large
+    payloads.sweep(force=True)
+    assert payloads.report()['expired'] == 1
@@ -0,0 +1,31 @@
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from helpers import Client, Server
+
+
+def test_simulated_request():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        server = Server('server')
+        client = Client('client', server.aid)
+
+    report = simulation.run()
+
+    # Request at 5 s, agree at 6 s, inform after 10 s of work
+    assert client.results == [
+        (6.0, 'agreed'), (16.0, 'inform'), (16.0, 'complete')]
+    # Queue drained with the session expiry timer
+    assert report['simulated_seconds'] == 65.0
+
+
+def test_simulated_timeout():
+    simulation = Simulation()
+    with simulation:
+        server = Server('server', answer=False)
+        client = Client('client', server.aid)
+
+    simulation.run(until=3600)
+
+    # The session expires 60 s after the request
+    assert client.results == [(65.0, 'complete')]
+    assert simulation.now == 3600
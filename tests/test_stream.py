@@ -0,0 +1,151 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Client(ImprovedAgent):
+    def __init__(self, server_aid):
+        super().__init__(AID('client@localhost:9001'))
+        self.request = FipaRequestProtocol(self, is_initiator=True)
+        self.server = server_aid
+        self.parts = []
+        self.results = []
+
+    @AgentSession.session
+    def make_request(self, stream, keep=None):
+        message = ACLMessage()
+        message.add_receiver(self.server)
+        while True:
+            try:
+                response = yield from self.request.send_request(
+                    message, stream=stream)
+                self.results.append(response.content)
+            except FipaChunkHandler as h:
+                self.parts.append(h.message.content)
+                if len(self.parts) == keep:
+                    return
+            except FipaProtocolComplete:
+                break
+
+
+class Server(ImprovedAgent):
+    def __init__(self, client, parts, window):
+        super().__init__(AID('server@localhost:9000'))
+        self.request = FipaRequestProtocol(self, is_initiator=False)
+        self.request.set_request_handler(self.on_request)
+        self.client = client
+        self.parts = parts
+        self.window = window
+        # Parts produced but not yet handed to the client's session
+        self.ahead = []
+
+    def produce(self):
+        for part in range(self.parts):
+            self.ahead.append(part + 1 - len(self.client.parts))
+            yield part
+
+    def on_request(self, message):
+        self.request.send_stream(message.create_reply(), self.produce(),
+                                 self.window)
+
+
+def run(parts, window, stream, keep=None):
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        client = Client(AID('server@localhost:9000'))
+        server = Server(client, parts, window)
+    client.call_later(5, client.make_request, stream, keep)
+    simulation.run()
+    return client, server
+
+
+def test_stream_reassembled():
+    client, server = run(parts=20, window=4, stream=False)
+
+    assert client.results == [list(range(20))]
+    assert client.parts == []
+    report = server.request.report()['streams']
+    assert report['chunks'] == 20
+    assert report['blocked'] > 0
+    assert report['active'] == 0
+
+
+def test_stream_incremental_flow_control():
+    client, server = run(parts=20, window=4, stream=True)
+
+    assert client.parts == list(range(20))
+    assert client.results == [None]
+    # Never more than a window of parts ahead of the consumer
+    assert max(server.ahead) == 4
+    assert client.request.report()['streams']['credits'] == 10
+
+
+def test_stream_cancelled_by_consumer():
+    client, server = run(parts=100, window=4, stream=True, keep=3)
+
+    assert client.parts == [0, 1, 2]
+    assert client.results == []
+    report = server.request.report()['streams']
+    assert report['cancelled'] == 1
+    assert report['active'] == 0
+    assert len(server.ahead) < 10
+
+
+class Manager(ImprovedAgent):
+    def __init__(self, contractor_aid):
+        super().__init__(AID('manager@localhost:9002'))
+        self.contract_net = FipaContractNetProtocol(self, is_initiator=True)
+        self.contractor = contractor_aid
+        self.results = []
+
+    @AgentSession.session
+    def call_proposals(self):
+        message = ACLMessage()
+        message.add_receiver(self.contractor)
+
+        proposals = []
+        while True:
+            try:
+                proposals.append((yield from self.contract_net.send_cfp(message)))
+            except FipaCfpComplete:
+                break
+
+        accept = proposals[0].create_reply()
+        while True:
+            try:
+                result = yield from self.contract_net.send_accept_proposal(accept)
+                self.results.append(result.content)
+            except FipaProtocolComplete:
+                break
+
+
+class Contractor(ImprovedAgent):
+    def __init__(self):
+        super().__init__(AID('contractor@localhost:9003'))
+        self.contract_net = FipaContractNetProtocol(self, is_initiator=False)
+        self.contract_net.set_cfp_handler(self.on_cfp)
+
+    @AgentSession.session
+    def on_cfp(self, message):
+        try:
+            accept = yield from self.contract_net.send_propose(
+                message.create_reply())
+            self.contract_net.send_stream(
+                accept.create_reply(), iter('result'), window=2)
+        except FipaRejectProposalHandler:
+            pass
+
+
+def test_contract_net_stream():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        contractor = Contractor()
+        manager = Manager(contractor.aid)
+    manager.call_later(5, manager.call_proposals)
+    simulation.run()
+
+    assert manager.results == [list('result')]
+    assert contractor.contract_net.report()['streams']['chunks'] == 6
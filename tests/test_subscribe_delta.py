@@ -0,0 +1,149 @@
+from multiprocessing import Queue
+from random import randint
+
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.delta import make_delta, apply_delta
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from conftest import start_loop_test
+
+
+def test_delta_roundtrip():
+    snapshots = [
+        {'a': 1, 'b': 2, 'c': 3, 'd': 4},
+        {'a': 1, 'b': 5, 'c': 3, 'd': 4},
+        {'a': 1, 'b': 5, 'c': 3},
+    ]
+    for old, new in zip(snapshots, snapshots[1:]):
+        delta = make_delta(old, new)
+        assert delta is not None
+        assert apply_delta(old, delta) == new
+
+    old = 'price=10;' * 1000
+    new = old[:4000] + 'price=11;' + old[4009:4500] + 'price=12;' + old[4509:]
+    delta = make_delta(old, new)
+    assert delta is not None
+    assert apply_delta(old, delta) == new
+
+    # Unrelated contents are sent in full
+    assert make_delta(b'abcdef', b'uvwxyz') is None
+    assert make_delta(None, 'abc') is None
+
+
+def test_delta_subscribe(start_runtime):
+    queue = Queue()
+    snapshots = [{'key%d' % i: i for i in range(100)} for _ in range(3)]
+    snapshots[1]['key7'] = -7
+    snapshots[2]['key9'] = -9
+    del snapshots[2]['key0']
+
+    class Subscriber(ImprovedAgent):
+        def __init__(self, publisher_aid):
+            super().__init__(AID(f'subscriber@localhost:{randint(9000, 60000)}'), True)
+            self.subscribe = FipaSubscribeProtocol(self, is_initiator=True)
+            self.call_later(5, self.make_subscribe, publisher_aid)
+
+        @AgentSession.session
+        def make_subscribe(self, publisher_aid):
+            message = ACLMessage()
+            message.add_receiver(publisher_aid)
+            while True:
+                try:
+                    inform = yield from self.subscribe.send_subscribe(message)
+                    queue.put_nowait(inform.content)
+                except FipaAgreeHandler:
+                    pass
+                except FipaProtocolComplete:
+                    break
+
+    class Publisher(ImprovedAgent):
+        def __init__(self):
+            super().__init__(AID(f'publisher@localhost:{randint(9000, 60000)}'), True)
+            self.subscribe = FipaSubscribeProtocol(
+                self, is_initiator=False, delta_encoding=True)
+            self.subscribe.set_subscribe_handler(self.on_subscribe)
+
+        def on_subscribe(self, message):
+            self.subscribe.send_agree(message.create_reply())
+            self.subscribe.subscribe(message)
+            for i, snapshot in enumerate(snapshots):
+                self.call_later(i, self.publish, snapshot)
+
+        def publish(self, snapshot):
+            inform = ACLMessage()
+            inform.set_content(snapshot)
+            self.subscribe.send_inform(inform)
+
+    publisher = Publisher()
+    subscriber = Subscriber(publisher.aid)
+
+    publisher.ams = start_runtime
+    subscriber.ams = start_runtime
+
+    with start_loop_test([publisher, subscriber]):
+        for snapshot in snapshots:
+            assert queue.get(timeout=30) == snapshot
+
+
+def test_changed_in_place():
+    class Subscriber(ImprovedAgent):
+        def __init__(self, publisher_aid):
+            super().__init__(AID('subscriber@localhost:9001'))
+            self.protocol = FipaSubscribeProtocol(
+                self, is_initiator=True, delta_encoding=True)
+            self.received = []
+            self.encodings = []
+            self.call_later(1, self.make_subscribe, publisher_aid)
+
+        def react(self, message):
+            if message.performative == ACLMessage.INFORM:
+                self.encodings.append(message.content[0])
+            super().react(message)
+
+        @AgentSession.session
+        def make_subscribe(self, publisher_aid):
+            message = ACLMessage()
+            message.add_receiver(publisher_aid)
+            while True:
+                try:
+                    inform = yield from self.protocol.send_subscribe(message)
+                    self.received.append(inform.content)
+                except FipaAgreeHandler:
+                    pass
+                except FipaProtocolComplete:
+                    break
+
+    class Publisher(ImprovedAgent):
+        def __init__(self):
+            super().__init__(AID('publisher@localhost:9000'))
+            self.protocol = FipaSubscribeProtocol(
+                self, is_initiator=False, delta_encoding=True)
+            self.protocol.set_subscribe_handler(self.on_subscribe)
+            self.state = {'key%d' % i: i for i in range(100)}
+
+        def on_subscribe(self, message):
+            self.protocol.subscribe(message)
+            self.protocol.send_agree(message.create_reply())
+            for i in range(3):
+                self.call_later(1 + i, self.publish, i)
+
+        def publish(self, i):
+            # Same dict, changed in place
+            self.state['key7'] = -i
+            inform = ACLMessage()
+            inform.set_content(self.state)
+            self.protocol.send_inform(inform)
+
+    simulation = Simulation(latency=ConstantLatency(0.1))
+    with simulation:
+        publisher = Publisher()
+        subscriber = Subscriber(publisher.aid)
+    simulation.run(until=10)
+
+    assert [content['key7'] for content in subscriber.received] == [0, -1, -2]
+    assert subscriber.received[-1] == publisher.state
+    assert subscriber.encodings == ['full', 'delta', 'delta']
@@ -0,0 +1,69 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from helpers import Subscriber
+
+
+class Publisher(ImprovedAgent):
+    def __init__(self, lease=30):
+        super().__init__(AID('publisher@localhost:9000'))
+        self.protocol = FipaSubscribeProtocol(
+            self, is_initiator=False, lease=lease)
+        self.protocol.set_subscribe_handler(self.on_subscribe)
+        self.call_later(10, self.publish, 1)
+
+    def on_subscribe(self, message):
+        self.protocol.subscribe(message)
+        self.protocol.send_agree(message.create_reply())
+
+    def publish(self, count):
+        message = ACLMessage()
+        message.set_content(count)
+        self.protocol.send_inform(message)
+        if count < 20:
+            self.call_later(5, self.publish, count + 1)
+
+
+def test_lease_expiry():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        publisher = Publisher()
+        alive = Subscriber('alive', publisher.aid, renew_every=10)
+        dead = Subscriber('dead', publisher.aid, renew_every=None)
+    simulation.run(until=200)
+
+    # Publications every 5 s from 10 s, lease until 35.5 s
+    assert alive.received == list(range(1, 21))
+    assert dead.received == list(range(1, 7))
+
+    report = publisher.protocol.report()
+    assert report['subscribers'] == 1
+    assert report['purged'] == 1
+    assert report['renewals'] == alive.protocol.stats['renewals'] > 10
+
+
+class AgreeCounter(Subscriber):
+    agreed = 0
+
+    def react(self, message):
+        if message.performative == ACLMessage.AGREE:
+            self.agreed += 1
+        super().react(message)
+
+
+def test_repeated_subscribe_without_lease():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        publisher = Publisher(lease=None)
+        subscriber = AgreeCounter('subscriber', publisher.aid, renew_every=10)
+    simulation.run(until=200)
+
+    # Registered again, and agreed to, on every repeated subscribe
+    assert subscriber.agreed == subscriber.protocol.stats['renewals'] + 1
+    assert subscriber.received == list(range(1, 21))
+    report = publisher.protocol.report()
+    assert (report['subscribers'], report['renewals']) == (1, 0)
@@ -0,0 +1,128 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.behaviours.highlevel import *
+from pade.behaviours.session.relay import FipaSubscribeRelay, relay_tree
+from pade.plus.agent import ImprovedAgent
+from pade.plus.simulation import Simulation, ConstantLatency
+
+from helpers import Subscriber
+
+
+class Publisher(ImprovedAgent):
+    def __init__(self, publish_at=(10,), agree=True):
+        super().__init__(AID('publisher@localhost:9000'))
+        self.protocol = FipaSubscribeProtocol(self, is_initiator=False)
+        self.protocol.set_subscribe_handler(self.on_subscribe)
+        self.agree = agree
+        for time in publish_at:
+            self.call_later(time, self.publish)
+
+    def on_subscribe(self, message):
+        self.protocol.subscribe(message)
+        if self.agree:
+            self.protocol.send_agree(message.create_reply())
+
+    def publish(self):
+        message = ACLMessage()
+        message.set_content(self.simulation.now)
+        self.protocol.send_inform(message)
+
+
+class Relay(ImprovedAgent):
+    def __init__(self, name):
+        super().__init__(AID(f'{name}@localhost:9002'))
+        self.relay = FipaSubscribeRelay(self)
+        self.call_later(1, self.relay.start)
+
+
+def test_relay_tree():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        publisher = Publisher()
+        relays = [Relay(f'relay{i}') for i in range(6)]
+        subscribers = [Subscriber(f'subscriber{i}', publisher.aid, None)
+                       for i in range(8)]
+
+    # publisher -> relay0, relay1 -> relay2 ... relay5
+    depth = relay_tree(publisher.protocol, [r.relay for r in relays], degree=2)
+    assert depth == 3
+    simulation.run()
+
+    for subscriber in subscribers:
+        assert subscriber.received == [10.0]
+    assert publisher.protocol.report()['subscribers'] == 2
+    leaves = [relay.relay.participant.report()['subscribers']
+              for relay in relays[2:]]
+    assert leaves == [2, 2, 2, 2]
+
+
+class AgreeRecorder(Subscriber):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.agreed_by = []
+
+    def react(self, message):
+        if message.performative == ACLMessage.AGREE:
+            self.agreed_by.append(message.sender.localname)
+        super().react(message)
+
+
+def test_unsubscribe_through_relay():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        publisher = Publisher(publish_at=(10, 20))
+        relays = [Relay(f'relay{i}') for i in range(2)]
+        subscribers = [AgreeRecorder(f'subscriber{i}', publisher.aid, None)
+                       for i in range(4)]
+    relay_tree(publisher.protocol, [r.relay for r in relays], degree=2)
+    simulation.run(until=15)
+
+    # Each subscriber was agreed to by its relay only
+    assert sorted(s.agreed_by[0] for s in subscribers) == \
+        ['relay0', 'relay0', 'relay1', 'relay1']
+    assert all(len(s.agreed_by) == 1 for s in subscribers)
+
+    publisher.protocol.unsubscribe(subscribers[0].aid)
+    simulation.run()
+
+    assert subscribers[0].received == [10.0]
+    for subscriber in subscribers[1:]:
+        assert subscriber.received == [10.0, 20.0]
+    assert publisher.protocol.report()['routed'] == 3
+    assert sorted(publisher.protocol._relay_load.values()) == [1, 2]
+    served = [relay.relay.participant.report() for relay in relays]
+    assert sum(report['subscribers'] for report in served) == 3
+    assert sum(report['cancelled'] for report in served) == 1
+
+
+class CompletingSubscriber(AgreeRecorder):
+    """Written for a publisher that never agrees: an AGREE would end
+    its session with an error"""
+
+    @AgentSession.session
+    def make_subscribe(self, publisher_aid):
+        message = ACLMessage()
+        message.add_receiver(publisher_aid)
+        while True:
+            try:
+                response = yield from self.protocol.send_subscribe(message)
+                self.received.append(response.content)
+            except FipaProtocolComplete:
+                break
+
+
+def test_relay_without_agree():
+    simulation = Simulation(latency=ConstantLatency(0.5))
+    with simulation:
+        publisher = Publisher(agree=False)
+        relays = [Relay(f'relay{i}') for i in range(2)]
+        subscribers = [CompletingSubscriber(f'subscriber{i}', publisher.aid,
+                                            None) for i in range(4)]
+    relay_tree(publisher.protocol, [r.relay for r in relays], degree=2)
+    simulation.run()
+
+    # Relays do not agree on behalf of the publisher
+    for subscriber in subscribers:
+        assert subscriber.agreed_by == []
+        assert subscriber.received == [10.0]
@@ -0,0 +1,121 @@
+from pade.acl.aid import AID
+from pade.acl.messages import ACLMessage
+
+from pade.plus.agent import ImprovedAgent
+from pade.plus.directory import AgentDirectory, TableLog, TableSync
+from pade.plus.simulation import Simulation, ConstantLatency
+
+
+class Member(ImprovedAgent):
+    def __init__(self, name, directory_aid):
+        super().__init__(AID(f'{name}@localhost:9001'))
+        self.sync = TableSync(self)
+        self.directory = directory_aid
+
+    def join(self):
+        self.sync.join(self.directory)
+
+
+def test_table_log_since():
+    log = TableLog(history=3)
+    for port in range(5):
+        log.add(AID(f'agent{port}@localhost:{port}'))
+
+    assert [event[0] for event in log.since(3)] == [4, 5]
+    assert log.since(5) == []
+    # Changes 1 and 2 were forgotten
+    assert log.since(1) is None
+
+
+def test_members_follow_joins_and_leaves():
+    simulation = Simulation(latency=ConstantLatency(0.01))
+    with simulation:
+        host = ImprovedAgent(AID('directory@localhost:9000'))
+        directory = AgentDirectory(host, publish_every=0.5)
+        members = [Member(f'member{i}', host.aid) for i in range(20)]
+    for i, member in enumerate(members):
+        member.call_later(1 + i // 10, member.join)
+    simulation.run(until=5)
+
+    names = {member.aid.name for member in members}
+    for member in members:
+        assert member.sync.names == names
+        assert member.sync.version == 20
+        assert member.agentInstance.table is member.sync.table
+        assert set(member.agentInstance.table) == \
+            names | {host.aid.name, 'ams'}
+
+    # The first member got the 19 others as events
+    assert members[0].sync.report()['events'] == 19
+    assert members[0].sync.report()['snapshots'] == 1
+
+    directory.unsubscribe(members[-1].aid)
+    simulation.run(until=10)
+    for member in members[:-1]:
+        assert members[-1].aid.name not in member.agentInstance.table
+        assert member.sync.version == 21
+
+    report = directory.report()
+    assert report['publications'] == 3
+    assert report['snapshots'] == 20
+
+
+def test_gap_resynchronized():
+    simulation = Simulation(latency=ConstantLatency(0.01))
+    with simulation:
+        host = ImprovedAgent(AID('directory@localhost:9000'))
+        directory = AgentDirectory(host, publish_every=0.5)
+        members = [Member(f'member{i}', host.aid) for i in range(3)]
+    members[0].call_later(1, members[0].join)
+    members[1].call_later(2, members[1].join)
+    members[2].call_later(4, members[2].join)
+    simulation.run(until=3)
+
+    # Lost track of the table, as if an update was missed
+    members[0].sync.version = 0
+    members[0].agentInstance.table.pop(members[1].aid.name)
+    simulation.run(until=6)
+
+    assert members[0].sync.report()['gaps'] == 1
+    assert members[0].sync.version == 3
+    assert members[1].aid.name in members[0].agentInstance.table
+
+
+def test_agents_join_directory():
+    simulation = Simulation(latency=ConstantLatency(0.01))
+    with simulation:
+        host = ImprovedAgent(AID('directory@localhost:9000'))
+        directory = AgentDirectory(host, publish_every=0.5)
+        members = [ImprovedAgent(AID(f'member{i}@localhost:9001'),
+                                 directory=host.aid) for i in range(3)]
+    simulation.run(until=5)
+
+    # Joined when their behaviours started, each with its own table
+    names = {member.aid.name for member in members}
+    for member in members:
+        assert member.table_sync.names == names
+        assert member.agentInstance.table is member.table_sync.table
+    assert directory.report()['version'] == 3
+    assert set(host.agentInstance.table) == \
+        names | {host.aid.name, 'ams'}
+
+
+def test_host_table_follows_members():
+    simulation = Simulation(latency=ConstantLatency(0.01))
+    with simulation:
+        host = ImprovedAgent(AID('directory@localhost:9000'))
+        directory = AgentDirectory(host, publish_every=0.5)
+    simulation.run(until=1)
+
+    # Subscription of an agent the host does not know yet
+    outsider = AID('outsider@localhost:9005')
+    message = ACLMessage(ACLMessage.SUBSCRIBE)
+    message.set_protocol(ACLMessage.FIPA_SUBSCRIBE_PROTOCOL)
+    message.set_sender(outsider)
+    message.set_conversation_id('outsider')
+    directory.join(message)
+    assert host.agentInstance.table[outsider.name] == outsider
+
+    directory.unsubscribe(outsider)
+    assert outsider.name not in host.agentInstance.table
+    assert host.aid.name in host.agentInstance.table
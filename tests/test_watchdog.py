@@ -0,0 +1,65 @@
+from multiprocessing import Process
+from time import sleep
+
+from pade.behaviours.session import profiling
+from pade.plus.simulation import Simulation
+from pade.plus.watchdog import ReactorWatchdog
+
+
+def stalled():
+    yield
+    sleep(1.5)
+    yield
+
+
+def run_stall(path):
+    from twisted.internet import reactor
+
+    with open(path, 'w') as output:
+        watchdog = ReactorWatchdog(timeout=0.5, interval=0.05, output=output)
+        watchdog.start()
+        generator = stalled()
+        next(generator)
+        reactor.callLater(0.5, generator.send, None)
+        reactor.callLater(2.5, reactor.stop)
+        reactor.run()
+        output.write(f'stalls={watchdog.stalls}\n')
+
+
+def test_watchdog_reports_stall(tmp_path):
+    path = str(tmp_path / 'watchdog.log')
+    process = Process(target=run_stall, args=(path,))
+    process.start()
+    process.join(timeout=30)
+
+    with open(path) as output:
+        report = output.read()
+    assert 'Reactor blocked for' in report
+    # The stack shows the statement that stalled
+    assert 'in stalled\n    sleep(1.5)' in report
+    assert 'Reactor resumed' in report
+    assert report.endswith('stalls=1\n')
+
+
+def test_stalled_generator_in_simulation():
+    slow = []
+    profiling.enable(threshold=0.2, on_slow=lambda *step: slow.append(step))
+    try:
+        simulation = Simulation()
+        generator = stalled()
+        next(generator)
+
+        def resume():
+            with profiling.step(generator):
+                generator.send(None)
+
+        simulation.call_later(1, resume)
+        simulation.run()
+    finally:
+        profiling.disable()
+
+    # Reported at the yield it resumed from, the line before the sleep
+    (name, line, duration), = slow
+    assert name == 'stalled'
+    assert line == stalled.__code__.co_firstlineno + 1
+    assert duration >= 1.5